@@ -0,0 +1,145 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from pydantic import BaseModel
+from typing import Dict, Any, Optional
+from auth.utils import get_current_user
+from config import settings
+import asyncio
+import logging
+from indexing.index_stats import collect_index_stats, load_known_sources
+from utils.tracing import tracer
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    responses={404: {"description": "Not found"}},
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def require_admin(current_user: Dict = Depends(get_current_user)) -> Dict:
+    """Chỉ cho phép user có is_admin=True hoặc nằm trong ADMIN_USERNAMES."""
+    if current_user.get("is_admin") or current_user.get("username") in settings.ADMIN_USERNAMES:
+        return current_user
+    raise HTTPException(status_code=403, detail="Bạn không có quyền truy cập chức năng quản trị")
+
+
+class RebuildRequest(BaseModel):
+    model_name: Optional[str] = None  # Mặc định: EMBEDDING_MODEL trong cấu hình
+
+
+@router.get("/index/versions", summary="Trạng thái phiên bản index và tiến độ rebuild")
+async def get_index_versions(request: Request, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    return {"success": True, "data": request.app.state.index_versions.status()}
+
+
+@router.post("/index/rebuild", summary="Dựng lại index bằng embedding model mới ở background")
+async def rebuild_index(body: RebuildRequest, request: Request, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    """
+    Embed lại toàn bộ chunk đang có sang một collection mới. Search vẫn dùng collection
+    hiện tại cho tới khi collection mới hoàn tất, sau đó tự động chuyển sang.
+    """
+    index_versions = request.app.state.index_versions
+    model_name = body.model_name or settings.EMBEDDING_MODEL
+    try:
+        status = index_versions.start_rebuild(model_name)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Admin {admin.get('username')} started index rebuild with {model_name}")
+    return {"success": True, "message": f"Đang dựng lại index với model {model_name}", "data": status}
+
+
+@router.get("/scheduler/stats", summary="Hàng đợi index (bulk) và độ trễ truy vấn (interactive)")
+async def get_scheduler_stats(request: Request, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    """Số tác vụ index đang chạy/chờ, thời gian chờ, thời gian bị throttle/tạm dừng và p50/p95 của /ask."""
+    return {"success": True, "data": request.app.state.workload_scheduler.snapshot()}
+
+
+@router.get("/index/embedding-cache", summary="Tỷ lệ trúng cache embedding khi index")
+async def get_embedding_cache_stats(request: Request, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    cache = request.app.state.document_indexer.embedder.cache
+    if cache is None:
+        return {"success": True, "data": {"enabled": False}}
+    return {"success": True, "data": {"enabled": True, **cache.snapshot()}}
+
+
+@router.get("/index/stats", summary="Thống kê kích thước và sức khỏe của index đang active")
+async def get_index_stats(request: Request, admin: Dict = Depends(require_admin),
+                          page_size: int = Query(1000, ge=10, le=5000),
+                          max_scan: int = Query(200_000, ge=1000),
+                          orphans: bool = True) -> Dict[str, Any]:
+    """
+    Đọc collection theo trang (lấy mẫu khi collection lớn hơn max_scan chunk): phân bố độ dài
+    chunk, tỷ lệ trùng lặp, chunk không còn bản ghi user_files, BM25 đang nạp và ước lượng bộ nhớ.
+    """
+    retriever = request.app.state.assistant.retriever
+
+    def compute():
+        known_sources = load_known_sources() if orphans else None
+        return collect_index_stats(retriever.collection, known_sources=known_sources, retriever=retriever,
+                                   page_size=page_size, max_scan_chunks=max_scan)
+
+    try:
+        stats = await asyncio.to_thread(compute)
+    except Exception as e:
+        logger.error(f"Error computing index stats: {e}")
+        raise HTTPException(status_code=500, detail=f"Không thể tính thống kê index: {e}")
+    return {"success": True, "data": stats}
+
+
+@router.get("/llm/stats", summary="Số lời gọi LLM đang chạy/đang chờ và độ trễ trung bình")
+async def get_llm_stats(request: Request, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    assistant = request.app.state.assistant
+    data = assistant.llm_client.snapshot()
+    if assistant.fast_router is not None:
+        # Số câu được định tuyến bằng luật / centroid và số câu phải hỏi LLM
+        data["fast_router"] = dict(assistant.fast_router.stats)
+    return {"success": True, "data": data}
+
+
+@router.get("/answer-cache", summary="Tỷ lệ trúng cache câu trả lời theo ngữ nghĩa")
+async def get_answer_cache_stats(request: Request, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    cache = request.app.state.assistant.answer_cache
+    if cache is None:
+        return {"success": True, "data": {"enabled": False}}
+    return {"success": True, "data": {"enabled": True, **cache.snapshot()}}
+
+
+@router.delete("/answer-cache", summary="Xóa toàn bộ cache câu trả lời")
+async def clear_answer_cache(request: Request, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    cache = request.app.state.assistant.answer_cache
+    removed = cache.clear() if cache is not None else 0
+    logger.info(f"Admin {admin.get('username')} cleared the answer cache ({removed} entries)")
+    return {"success": True, "message": f"Đã xóa {removed} câu trả lời khỏi cache"}
+
+
+@router.get("/single-flight", summary="Số request /ask và tool được gộp với một request trùng đang chạy")
+async def get_single_flight_stats(request: Request, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    single_flight = request.app.state.assistant.single_flight
+    if single_flight is None:
+        return {"success": True, "data": {"enabled": False}}
+    return {"success": True, "data": {"enabled": True, **single_flight.snapshot()}}
+
+
+@router.get("/tracing/stages", summary="Độ trễ p50/p95/p99 theo từng stage của pipeline")
+async def get_tracing_stages(admin: Dict = Depends(require_admin),
+                             window_seconds: Optional[float] = Query(None, gt=0),
+                             prefix: Optional[str] = None) -> Dict[str, Any]:
+    """Tính trên các span còn trong ring buffer; prefix lọc theo tên, vd. "graph.", "retriever.", "llm."."""
+    return {"success": True, "data": {**tracer.snapshot(),
+                                      "stages": tracer.stage_stats(window_seconds=window_seconds, prefix=prefix)}}
+
+
+@router.get("/tracing/traces", summary="Các request gần nhất cùng tổng thời gian")
+async def get_recent_traces(admin: Dict = Depends(require_admin),
+                            limit: int = Query(20, ge=1, le=200),
+                            min_duration_ms: float = Query(0.0, ge=0)) -> Dict[str, Any]:
+    return {"success": True, "data": tracer.recent_traces(limit=limit, min_duration_ms=min_duration_ms)}
+
+
+@router.get("/tracing/traces/{trace_id}", summary="Toàn bộ span của một request")
+async def get_trace(trace_id: str, admin: Dict = Depends(require_admin)) -> Dict[str, Any]:
+    spans = tracer.get_trace(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="Không tìm thấy trace (có thể đã bị đẩy khỏi buffer)")
+    return {"success": True, "data": spans}
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Depends, Header, status
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Depends, Header, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from auth.models import UserBase, UserCreate, UserLogin, Token, UserUpdate, TokenData, StatsResponse, StatsUpdate
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,12 +7,17 @@ from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import os
 import json
+import hashlib
 from pathlib import Path
 import asyncio
+import aiofiles
+import aiofiles.os
 import logging
 from contextlib import asynccontextmanager
 from core.learning_assistant_v2 import LearningAssistant
 from indexing.document_indexer import DocumentIndexer
+from indexing.index_versions import IndexRegistry, IndexVersionManager, create_chroma_client, resolve_active_index
+from utils.workload_scheduler import WorkloadScheduler
 from auth.utils import (
     authenticate_user, create_access_token, verify_token,
     get_password_hash, get_mongo_connection
@@ -24,6 +30,7 @@ from datetime import datetime, timedelta, timezone
 
 # Import router stats mới
 from api.stats import router as stats_router
+from api.admin import router as admin_router
 
 # Thiết lập logging thay vì print
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -32,6 +39,8 @@ logger = logging.getLogger(__name__)
 # Biến toàn cục để lưu trữ tài nguyên
 assistant = None
 document_indexer = None
+# Truy vấn (interactive) được ưu tiên hơn việc index tài liệu (bulk)
+workload_scheduler = WorkloadScheduler()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Context manager để quản lý lifecycle của ứng dụng
@@ -55,13 +64,29 @@ async def lifespan(app: FastAPI):
 
     # --- Initialize Assistant and Indexer ---
     try:
+        # Collection/embedding model đang active lấy từ registry phiên bản index
+        index_registry = IndexRegistry()
+        active_index = resolve_active_index(create_chroma_client(), index_registry)
+        chroma_collection_name = active_index["collection"]
+        logger.info(f"Active index: {chroma_collection_name} ({active_index['model']})")
+
         # Pass the mongo_collection (which might be None) to the assistant
         assistant = LearningAssistant(
             mongo_collection=mongo_collection,
-            collection_name=chroma_collection_name
+            collection_name=chroma_collection_name,
+            embedding_model=active_index["model"]
         )
-        document_indexer = DocumentIndexer(collection_name=chroma_collection_name)
+        document_indexer = DocumentIndexer(collection_name=chroma_collection_name, model_name=active_index["model"],
+                                           scheduler=workload_scheduler)
         logger.info("LearningAssistant and DocumentIndexer initialized successfully")
+
+        index_versions = IndexVersionManager(document_indexer.client, document_indexer, assistant.retriever, index_registry)
+        if config.INDEX_AUTO_REBUILD:
+            index_versions.ensure_current_model()
+        app.state.assistant = assistant
+        app.state.document_indexer = document_indexer
+        app.state.index_versions = index_versions
+        app.state.workload_scheduler = workload_scheduler
         yield # Application runs here
     except Exception as e:
         logger.error(f"Error initializing core resources (Assistant/Indexer): {e}")
@@ -70,7 +95,7 @@ async def lifespan(app: FastAPI):
         logger.info("Shutting down EduMentor API")
         if assistant:
             try:
-                assistant.close()
+                await assistant.aclose()
                 logger.info("LearningAssistant closed")
             except Exception as e:
                 logger.error(f"Error closing LearningAssistant: {e}")
@@ -100,6 +125,76 @@ app.add_middleware(
 
 # Đăng ký router stats
 app.include_router(stats_router)
+app.include_router(admin_router)
+
+class UploadSizeLimitMiddleware:
+    """Giới hạn kích thước body của /upload ngay trong lúc nhận, trước khi Starlette spool multipart.
+
+    Starlette đọc và spool toàn bộ multipart trước khi endpoint chạy, nên kiểm tra trong ``upload_file``
+    không chặn được upload quá lớn. Middleware (ASGI thuần) này từ chối theo Content-Length nếu có, và
+    đếm số byte thực nhận từ ``receive`` (kể cả chunked / Content-Length sai): vượt giới hạn thì ngừng
+    đọc body và trả 413 thay cho response của endpoint.
+    """
+
+    def __init__(self, app, path: str = "/upload"):
+        self.app = app
+        self.path = path
+
+    @staticmethod
+    def limit() -> int:
+        # Chừa thêm 1MB cho phần header của multipart
+        return config.MAX_UPLOAD_SIZE + 1024 * 1024
+
+    @staticmethod
+    async def reject(send):
+        response = JSONResponse(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            content={"detail": f"File vượt quá giới hạn {config.MAX_UPLOAD_SIZE // (1024 * 1024)}MB"}
+        )
+        await send({"type": "http.response.start", "status": response.status_code, "headers": response.raw_headers})
+        await send({"type": "http.response.body", "body": response.body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.limit():
+            return await self.reject(send)
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit():
+                    # Ngừng đọc: parser multipart nhận disconnect và dừng, phần body còn lại không được spool
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                return  # Response lỗi của endpoint (400/500 do body bị cắt) được thay bằng 413
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self.reject(send)
+
+
+app.add_middleware(UploadSizeLimitMiddleware)
 
 # --- Pydantic Models ---l
 
@@ -236,7 +331,8 @@ async def ask_question(request: AskRequest, current_user: Optional[dict] = Depen
         
         logger.info(f"Processing question for user '{username or 'anonymous'}': {request.question[:100]}...")
         # Pass username to the answer method
-        result = await asyncio.wait_for(assistant.answer(request.question, username=username), timeout=120.0) 
+        with workload_scheduler.interactive():
+            result = await asyncio.wait_for(assistant.answer(request.question, username=username), timeout=120.0)
 
         if not result or "response" not in result:
             logger.error(f"Invalid response from workflow: {result}")
@@ -246,7 +342,9 @@ async def ask_question(request: AskRequest, current_user: Optional[dict] = Depen
             "timestamp": asyncio.get_event_loop().time(),
             "route_decision": result.get("metadata", {}).get("route_decision"),
             "selected_tool": result.get("metadata", {}).get("selected_tool"),
-            "executed_tools": list(result.get("tool_outputs", {}).keys()) if result.get("tool_outputs") else []
+            "executed_tools": list(result.get("tool_outputs", {}).keys()) if result.get("tool_outputs") else [],
+            "coalesced": result.get("metadata", {}).get("coalesced", False),
+            "stage_timings": result.get("metadata", {}).get("stage_timings", {})
         }
 
         return ApiResponse(
@@ -266,6 +364,35 @@ async def ask_question(request: AskRequest, current_user: Optional[dict] = Depen
         raise HTTPException(status_code=500, detail=f"Lỗi máy chủ khi xử lý câu hỏi: {str(e)}")
 
 
+@app.post("/ask/stream")
+async def ask_question_stream(request: AskRequest, current_user: Optional[dict] = Depends(get_current_user)):
+    """
+    Như /ask nhưng trả về Server-Sent Events: `route`, `sources` (ngay khi truy xuất xong),
+    `token` (từng đoạn câu trả lời), `footer` (nguồn tham khảo) và cuối cùng `done` hoặc `error`.
+    """
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Câu hỏi không được để trống")
+
+    if not assistant:
+        raise HTTPException(status_code=503, detail="Hệ thống đang khởi động, vui lòng thử lại sau")
+
+    username = current_user.get("username") if current_user else None
+    logger.info(f"Streaming answer for user '{username or 'anonymous'}': {request.question[:100]}...")
+
+    async def event_stream():
+        with workload_scheduler.interactive():
+            async for event in assistant.answer_stream(request.question, username=username):
+                payload = json.dumps(event["data"], ensure_ascii=False, default=str)
+                yield f"event: {event['event']}\ndata: {payload}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Tắt cache và buffering của reverse proxy để token tới client ngay
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # Endpoint để thực thi một công cụ cụ thể qua path parameter
 @app.post("/tools/{tool_name}", response_model=ApiResponse)
 async def use_specific_tool(
@@ -316,7 +443,8 @@ async def use_specific_tool(
             tool_kwargs["options"] = options
         
         logger.info(f"Executing tool: {actual_tool_name} with input: {request.input[:50]}...")
-        result = await assistant.tool_registry.execute_tool(actual_tool_name, **tool_kwargs)
+        with workload_scheduler.interactive():
+            result = await assistant.tool_registry.execute_tool(actual_tool_name, **tool_kwargs)
         
         # Xử lý đặc biệt cho Progress_Tracker
         if actual_tool_name == "Progress_Tracker":
@@ -560,27 +688,44 @@ async def update_user_profile(user_update: UserUpdate, current_user: dict = Depe
 async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
     """Upload file và chạy indexing trong background."""
     try:
-        allowed_extensions = {'.pdf', '.docx', '.doc', '.txt', '.pptx', '.ppt'}
+        # Chỉ nhận các định dạng mà indexer xử lý được, từ chối trước khi ghi bất kỳ byte nào
+        allowed_extensions = DocumentIndexer.SUPPORTED_EXTENSIONS
         file_ext = Path(file.filename).suffix.lower()
         
         if file_ext not in allowed_extensions:
             raise HTTPException(
                 status_code=400,
-                detail=f"Định dạng file không được hỗ trợ. Chỉ chấp nhận: {', '.join(allowed_extensions)}"
+                detail=f"Định dạng file không được hỗ trợ. Chỉ chấp nhận: {', '.join(sorted(allowed_extensions))}"
             )
 
         # Tạo tên file duy nhất để tránh xung đột
         safe_filename = f"{Path(file.filename).stem}_{os.urandom(4).hex()}{file_ext}"
         file_location = UPLOAD_DIR / safe_filename
 
-        # Lưu file
+        # Lưu file theo từng chunk (ghi async), tính SHA-256 tăng dần. Kích thước body đã được giới hạn khi nhận
+        # (UploadSizeLimitMiddleware); kiểm tra ở đây chặn riêng phần file
+        sha256 = hashlib.sha256()
+        file_size = 0
         try:
-            with open(file_location, "wb") as f:
-                content = await file.read()
-                f.write(content)
+            async with aiofiles.open(file_location, "wb") as f:
+                while chunk := await file.read(config.UPLOAD_CHUNK_SIZE):
+                    file_size += len(chunk)
+                    if file_size > config.MAX_UPLOAD_SIZE:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"File vượt quá giới hạn {config.MAX_UPLOAD_SIZE // (1024 * 1024)}MB"
+                        )
+                    sha256.update(chunk)
+                    await f.write(chunk)
+        except HTTPException:
+            await aiofiles.os.remove(file_location)
+            raise
         except IOError as e:
             logger.error(f"Failed to save file {file.filename}: {e}")
+            if file_location.exists():
+                await aiofiles.os.remove(file_location)
             raise HTTPException(status_code=500, detail=f"Không thể lưu file: {e}")
+        content_hash = sha256.hexdigest()
 
         # Hàm chạy indexing trong background
         def run_indexing(location: Path, ext: str):
@@ -589,9 +734,9 @@ async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File
                 metadata = {"original_filename": file.filename}
                 if ext == '.pdf':
                     result = document_indexer.index_document(str(location), doc_metadata=metadata)
-                elif ext in ['.pptx', '.ppt']:
+                elif ext == '.pptx':
                     result = document_indexer.index_document(str(location), file_type="pptx", doc_metadata=metadata)
-                elif ext in ['.docx', '.doc']:
+                elif ext == '.docx':
                     result = document_indexer.index_document(str(location), file_type="docx", doc_metadata=metadata)
                 else:  # .txt
                     result = document_indexer.index_document(str(location), doc_metadata=metadata)
@@ -617,7 +762,8 @@ async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File
                 "filename": safe_filename,
                 "original_filename": file.filename,
                 "file_path": str(file_location),
-                "file_size": file_location.stat().st_size if file_location.exists() else 0,
+                "file_size": file_size,
+                "sha256": content_hash,
                 "content_type": file.content_type,
                 "created_at": datetime.now(timezone.utc)
             }
@@ -636,8 +782,10 @@ async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File
             documents_added=0,
             file_type=file_ext,
             message="File đã được nhận và đang được xử lý trong background",
-            metadata={"saved_as": safe_filename}
+            metadata={"saved_as": safe_filename, "sha256": content_hash, "file_size": file_size}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error in /upload: {e}")
         raise HTTPException(status_code=500, detail=f"Lỗi máy chủ: {str(e)}")
@@ -0,0 +1,124 @@
+"""So sánh MetadataExtractor (quét một lượt) với bản cũ dùng nhiều re.search.
+
+Kiểm tra title và chapter/section/part giống nhau trên các file mẫu, các trường hợp biên
+và văn bản ngẫu nhiên, kiểm tra extract_metadata_from_pages trên các trang OCR, sau đó đo
+thời gian trên file OCR lớn.
+
+Chạy: python bench_metadata_extractor.py [file ...]
+"""
+import re
+import sys
+import time
+import random
+from pathlib import Path
+from utils.metadata_extractor import MetadataExtractor
+
+DEFAULT_FILES = ["ocr_pdf_to_text.txt", "speech_to_text.txt", "speech_to_text.csv"]
+
+EDGE_CASES = [
+    "",
+    "\n\n   \n",
+    "x" * 150 + "\nShort line",
+    "Intro\n\nTITLE IN CAPS\nbody\n# Markdown wins\n",
+    "   \n=====\nblank line above the underline",
+    "Underlined title\n===  \nCAPS LATER\n",
+    "ABC\nDEF\nmulti line caps block",
+    "#\n\ncontent after a bare hash",
+    "Chương\nIV ABC\nChapter MMục 1.2 overlap",
+    "Bài toán Phần III và Section 2.1.3, CHAPTER XII",
+    "lower\r\nUNDER\r\n==\r\n",
+]
+
+
+def legacy_extract(content):
+    """Bản cũ của _extract_title + _extract_chapter_info, giữ lại làm chuẩn so sánh."""
+    def extract_title(content):
+        if not content:
+            return None
+        md_header_match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
+        if md_header_match:
+            return md_header_match.group(1).strip()
+        underline_match = re.search(r'^(.+)\n=+\s*$', content, re.MULTILINE)
+        if underline_match:
+            return underline_match.group(1).strip()
+        caps_match = re.search(r'^([A-Z][A-Z\s]+[A-Z])$', content, re.MULTILINE)
+        if caps_match:
+            return caps_match.group(1).strip()
+        for line in content.split('\n'):
+            line = line.strip()
+            if line and len(line) < 100:
+                return line
+        return "Unknown Title"
+
+    info = {}
+    chapter_match = re.search(r'(?:Chapter|CHAPTER|Chương)\s+(\d+|[IVXLCDM]+)', content)
+    if chapter_match:
+        info["chapter"] = chapter_match.group(0)
+    section_match = re.search(r'(?:Section|SECTION|Mục|MỤC)\s+(\d+(?:\.\d+)*)', content)
+    if section_match:
+        info["section"] = section_match.group(0)
+    vn_section_match = re.search(r'(?:PHẦN|Phần|BÀI|Bài)\s+(\d+|[IVXLCDM]+)', content)
+    if vn_section_match:
+        info["part"] = vn_section_match.group(0)
+    return extract_title(content), info
+
+
+def new_extract(content):
+    return MetadataExtractor._extract_title(content), MetadataExtractor._extract_chapter_info(content)
+
+
+def random_text(seed: int, size: int = 4000) -> str:
+    rng = random.Random(seed)
+    pieces = ["\n", "\n\n", " ", "# ", "=", "===\n", "ABC", "Title", "word", "Chương 3", "Mục 2.1",
+              "Bài IV", "Phần 2", "Section 4", "MỤC 5", "CHAPTER", " II", "x" * 120, "\r", "\t"]
+    return "".join(rng.choice(pieces) for _ in range(size // 4))
+
+
+def split_pages(text: str):
+    """Tách file OCR theo marker slide (giống cách các trang được ghi ra file .txt)."""
+    return [page for page in re.split(r'(?=📌 Slide \d+:)', text) if page]
+
+
+def bench(label, func, text, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<45} {best * 1000:8.3f} ms")
+
+
+def main(files):
+    samples = [(path, Path(path).read_text(encoding="utf-8", errors="ignore")) for path in files if Path(path).exists()]
+    cases = samples + [(f"edge-{i}", text) for i, text in enumerate(EDGE_CASES)]
+    cases += [(f"random-{seed}", random_text(seed)) for seed in range(200)]
+
+    mismatches = 0
+    for name, text in cases:
+        expected, actual = legacy_extract(text), new_extract(text)
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH {name}: {expected!r} vs {actual!r}")
+    print(f"Equivalence: {len(cases) - mismatches}/{len(cases)} cases identical")
+
+    for name, text in samples:
+        pages = split_pages(text)
+        streamed = MetadataExtractor.extract_metadata_from_pages(iter(pages))
+        expected_title, expected_info = legacy_extract(text)
+        streamed_info = {k: streamed[k] for k in ("chapter", "section", "part") if k in streamed}
+        if (streamed.get("title"), streamed_info) != (expected_title, expected_info):
+            mismatches += 1
+            print(f"MISMATCH (pages) {name}")
+    print()
+
+    for name, text in samples:
+        large = text * 20
+        print(f"{name}: {len(large) / 1e6:.2f}M chars")
+        bench("  legacy (5 re.search + split)", legacy_extract, large)
+        bench("  MetadataExtractor.extract_metadata", MetadataExtractor.extract_metadata, large)
+        bench("  extract_metadata_from_pages", MetadataExtractor.extract_metadata_from_pages, split_pages(large))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or DEFAULT_FILES))
@@ -0,0 +1,83 @@
+"""So sánh TextChunker với RecursiveCharacterTextSplitter của langchain.
+
+Kiểm tra hai bên cho ra cùng nội dung chunk trên các file mẫu trong repo (và văn bản
+ngẫu nhiên), sau đó đo throughput. start_index của langchain được tính lại bằng
+``text.find(chunk, ...)`` nên với chunk rất ngắn lặp lại trong vùng gối đầu nó có thể trỏ
+vào lần xuất hiện sớm hơn; TextChunker trả về offset thật nên các trường hợp này chỉ
+được đếm riêng, không tính là sai khác.
+
+Chạy: python bench_text_chunker.py [file ...]
+"""
+import sys
+import time
+import random
+from pathlib import Path
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from indexing.text_chunker import TextChunker
+
+DEFAULT_FILES = ["ocr_pdf_to_text.txt", "speech_to_text.txt", "speech_to_text.csv"]
+CONFIGS = [(500, 50), (200, 20), (1000, 100), (64, 0)]
+
+
+def random_text(seed: int, size: int = 8000) -> str:
+    rng = random.Random(seed)
+    pieces = ["\n\n", "\n", " ", "  ", "\t", "word", "Chương", "mạng Bayes", "x" * 120, ".", "#"]
+    return "".join(rng.choice(pieces) for _ in range(size // 4))
+
+
+def langchain_chunks(splitter, text):
+    return [(doc.metadata["start_index"], doc.page_content) for doc in splitter.create_documents([text])]
+
+
+def check_equivalence(texts):
+    mismatches = 0
+    offset_diffs = 0
+    for chunk_size, chunk_overlap in CONFIGS:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                  length_function=len, add_start_index=True)
+        chunker = TextChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        for name, text in texts:
+            expected = langchain_chunks(splitter, text)
+            actual = chunker.create_chunks(text)
+            if [c for _, c in expected] != [c for _, c in actual]:
+                mismatches += 1
+                print(f"MISMATCH {name} chunk_size={chunk_size} overlap={chunk_overlap}: "
+                      f"{len(expected)} vs {len(actual)} chunks")
+            elif expected != actual:
+                offset_diffs += 1
+                # Chỉ chấp nhận khác biệt khi offset của TextChunker đúng là vị trí của chunk
+                for (_, content), (start, _) in zip(expected, actual):
+                    assert text[start:start + len(content)] == content
+    if offset_diffs:
+        print(f"{offset_diffs} cases differ only in start_index (langchain matched an earlier duplicate)")
+    return mismatches
+
+
+def bench(label, func, text, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<40} {best * 1000:8.2f} ms  {len(text) / best / 1e6:8.2f} MB/s")
+
+
+def main(files):
+    texts = [(path, Path(path).read_text(encoding="utf-8", errors="ignore")) for path in files if Path(path).exists()]
+    texts += [(f"random-{seed}", random_text(seed)) for seed in range(20)]
+
+    mismatches = check_equivalence(texts)
+    print(f"Equivalence: {len(texts) * len(CONFIGS) - mismatches}/{len(texts) * len(CONFIGS)} cases identical\n")
+
+    corpus = "\n\n".join(text for _, text in texts) * 5
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, length_function=len, add_start_index=True)
+    chunker = TextChunker(chunk_size=500, chunk_overlap=50)
+    print(f"Corpus: {len(corpus) / 1e6:.2f}M chars")
+    bench("langchain create_documents", lambda t: splitter.create_documents([t]), corpus)
+    bench("TextChunker.create_chunks", chunker.create_chunks, corpus)
+    bench("TextChunker.split_spans (offsets only)", chunker.split_spans, corpus)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or DEFAULT_FILES))
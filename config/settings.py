@@ -30,12 +30,24 @@ JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES
 # --- Embedding Model ---
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
 
+# --- Admin ---
+# Username (phân tách bằng dấu phẩy) được dùng các endpoint /admin, ngoài các user có is_admin=True
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
 # --- LLM Configuration ---
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 LLM_GROQ_MODEL = os.getenv("LLM_GROQ_MODEL", "llama-3.3-70b-versatile")
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", 0.05))
+# LLM client async dùng chung: số lời gọi Groq đồng thời tối đa (phần còn lại xếp hàng), số kết nối
+# keep-alive trong pool, HTTP/2 (cần gói h2) và timeout mỗi request (giây)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 60))
+# Phân tích cảm xúc câu hỏi: "llm" (thêm một lượt gọi Groq), "local" (từ điển từ khóa, gần như tức thì) hoặc "off"
+EMOTION_ANALYSIS_MODE = os.getenv("EMOTION_ANALYSIS_MODE", "llm").lower()
 
 # --- Web Search Configuration ---
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
@@ -44,10 +56,54 @@ TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 # --- Indexing Configuration ---
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 500))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 50))
+# Cách chia chunk: "fixed" (theo số ký tự) hoặc "structure" (theo ranh giới chương/mục/tiêu đề
+# do MetadataExtractor nhận diện, gắn chapter/section/section_title vào metadata của chunk)
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "fixed").lower()
+# Transcript (speech-to-text): độ dài thời gian tối đa của một chunk khi gộp các đoạn liên tiếp
+TRANSCRIPT_MAX_WINDOW_SECONDS = float(os.getenv("TRANSCRIPT_MAX_WINDOW_SECONDS", 180))
+# Số chunk mỗi lần embed + ghi vào Chroma khi index (giới hạn bộ nhớ, kết quả tìm kiếm được sớm)
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", 128))
+# Ghi Chroma: số bản ghi / kích thước payload tối đa mỗi request, số batch ghi song song và số lần retry
+CHROMA_WRITE_BATCH_SIZE = int(os.getenv("CHROMA_WRITE_BATCH_SIZE", 256))
+CHROMA_WRITE_MAX_PAYLOAD_BYTES = int(os.getenv("CHROMA_WRITE_MAX_PAYLOAD_MB", 8)) * 1024 * 1024
+CHROMA_WRITE_CONCURRENCY = int(os.getenv("CHROMA_WRITE_CONCURRENCY", 4))
+CHROMA_WRITE_RETRIES = int(os.getenv("CHROMA_WRITE_RETRIES", 3))
+# Ưu tiên truy vấn (/ask, /tools) hơn việc index: số batch index được đọc/tách chunk đồng thời, tỷ lệ CPU tối đa
+# cho index, SLO độ trễ p95 của truy vấn trong cửa sổ SLO_WINDOW_SECONDS (vượt SLO thì tạm dừng index,
+# mỗi lần tối đa BULK_MAX_PAUSE_SECONDS)
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", 1))
+BULK_CPU_SHARE = float(os.getenv("BULK_CPU_SHARE", 0.5))
+ASK_LATENCY_SLO_MS = float(os.getenv("ASK_LATENCY_SLO_MS", 15000))
+SLO_WINDOW_SECONDS = float(os.getenv("SLO_WINDOW_SECONDS", 60))
+BULK_MAX_PAUSE_SECONDS = float(os.getenv("BULK_MAX_PAUSE_SECONDS", 30))
+# Hàng đợi embedding dùng chung khi index: gom chunk của nhiều tài liệu thành batch theo ngân sách token
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", 16384))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", 256))
+EMBED_MAX_WAIT_MS = int(os.getenv("EMBED_MAX_WAIT_MS", 20))
+# Số process trích xuất nội dung (parse PPTX...) chạy song song khi index
+INDEX_EXTRACT_WORKERS = int(os.getenv("INDEX_EXTRACT_WORKERS", 2))
+# OCR backend cho PDF: "mistral" (Mistral OCR API) hoặc "local" (PyMuPDF, không cần mạng)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "mistral").lower()
+# Cache kết quả OCR theo trang (key: hash nội dung file + số trang) để re-index không phải OCR lại
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(os.getcwd(), "data", "ocr_cache"))
+# Cache vector embedding theo hash nội dung chunk (memmap trên đĩa, tách theo model) để re-index không embed lại
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.getcwd(), "data", "embedding_cache"))
+
+# Registry các phiên bản collection (collection đang active + embedding model của nó, tiến độ rebuild)
+INDEX_REGISTRY_PATH = os.getenv("INDEX_REGISTRY_PATH", os.path.join(os.getcwd(), "data", "index_registry.json"))
+# Số chunk mỗi lượt đọc/embed lại khi dựng collection mới cho embedding model mới
+INDEX_REBUILD_BATCH_SIZE = int(os.getenv("INDEX_REBUILD_BATCH_SIZE", 256))
+# Tự động dựng lại index ở background khi EMBEDDING_MODEL khác model của collection đang active
+INDEX_AUTO_REBUILD = os.getenv("INDEX_AUTO_REBUILD", "true").lower() == "true"
 
 # --- Upload Directory ---
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Giới hạn kích thước upload (áp dụng cho body /upload ngay khi nhận, trước khi multipart được spool)
+# và kích thước mỗi chunk khi ghi file xuống đĩa
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE_MB", 200)) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE_KB", 1024)) * 1024
 
 # --- Logging ---
 LOGGING_LEVEL = os.getenv("LOGGING_LEVEL", "INFO").upper()
@@ -56,6 +112,42 @@ LOGGING_LEVEL = os.getenv("LOGGING_LEVEL", "INFO").upper()
 RETRIEVER_TOP_K = int(os.getenv("RETRIEVER_TOP_K", 5))
 VECTOR_WEIGHT = float(os.getenv("VECTOR_WEIGHT", 0.7))
 BM25_WEIGHT = float(os.getenv("BM25_WEIGHT", 0.3))
+# Định tuyến cục bộ trước LLM: ngưỡng cosine tới centroid gần nhất, khoảng cách tối thiểu với nhãn thứ hai,
+# tỷ lệ câu đã định tuyến cục bộ vẫn được gửi thêm cho LLM router để ghi replay log đánh giá
+FAST_ROUTER_ENABLED = os.getenv("FAST_ROUTER_ENABLED", "true").lower() == "true"
+FAST_ROUTER_THRESHOLD = float(os.getenv("FAST_ROUTER_THRESHOLD", 0.7))
+FAST_ROUTER_MARGIN = float(os.getenv("FAST_ROUTER_MARGIN", 0.05))
+FAST_ROUTER_SHADOW_RATE = float(os.getenv("FAST_ROUTER_SHADOW_RATE", 0.05))
+ROUTER_REPLAY_PATH = os.getenv("ROUTER_REPLAY_PATH", os.path.join(os.getcwd(), "data", "router_replay.jsonl"))
+# Bắt đầu truy xuất song song với bước định tuyến ý định (bị hủy nếu route không cần ngữ cảnh)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+# Ngân sách token cho từng phần của prompt sinh câu trả lời (đếm bằng tiktoken với TOKENIZER_ENCODING)
+PROMPT_BUDGET_SYSTEM = int(os.getenv("PROMPT_BUDGET_SYSTEM", 600))
+PROMPT_BUDGET_CONTEXT = int(os.getenv("PROMPT_BUDGET_CONTEXT", 3000))
+PROMPT_BUDGET_TOOL_OUTPUT = int(os.getenv("PROMPT_BUDGET_TOOL_OUTPUT", 1500))
+PROMPT_BUDGET_HISTORY = int(os.getenv("PROMPT_BUDGET_HISTORY", 1200))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+# Tóm tắt hội thoại cuốn chiếu: prompt mang bản tóm tắt + CONVERSATION_RECENT_TURNS lượt gần nhất nguyên văn;
+# tóm tắt được cập nhật ở nền mỗi khi có thêm CONVERSATION_SUMMARY_BATCH_TURNS lượt nằm ngoài cửa sổ đó
+CONVERSATION_SUMMARY_ENABLED = os.getenv("CONVERSATION_SUMMARY_ENABLED", "true").lower() == "true"
+CONVERSATION_RECENT_TURNS = int(os.getenv("CONVERSATION_RECENT_TURNS", 3))
+CONVERSATION_SUMMARY_BATCH_TURNS = int(os.getenv("CONVERSATION_SUMMARY_BATCH_TURNS", 2))
+CONVERSATION_SUMMARY_MAX_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", 400))
+# Gộp các /ask và lời gọi tool giống hệt nhau đang chạy đồng thời (vd. cả lớp cùng gửi một yêu cầu) thành một lần tính
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+# Cache câu trả lời theo ngữ nghĩa: ngưỡng cosine giữa hai câu hỏi để dùng lại câu trả lời, thời gian sống,
+# số entry tối đa (LRU) và các route được cache ("RAG", "DIRECT" hoặc "TOOL:<tên tool>")
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.92))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2000))
+ANSWER_CACHE_ROUTES = [route.strip() for route in os.getenv("ANSWER_CACHE_ROUTES", "RAG,DIRECT").split(",") if route.strip()]
+
+# Tracing độ trễ từng stage: số span gần nhất giữ trong bộ nhớ (xem /admin/tracing/*), gửi thêm span qua
+# OpenTelemetry (cần opentelemetry-api và một TracerProvider được cấu hình, vd. opentelemetry-instrument)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 20000))
+TRACING_OTEL_ENABLED = os.getenv("TRACING_OTEL_ENABLED", "false").lower() == "true"
 
 # --- API Configuration ---
 API_PORT = int(os.getenv("API_PORT", 5000))
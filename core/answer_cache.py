@@ -0,0 +1,137 @@
+"""Cache câu trả lời theo ngữ nghĩa: câu hỏi diễn đạt khác nhau nhưng cùng ý dùng lại câu trả lời đã sinh.
+
+Mỗi entry gồm embedding (đã chuẩn hóa) của câu hỏi, câu trả lời và nguồn. Entry được gom theo scope
+(phiên bản collection, embedding model, route): câu trả lời RAG chỉ dùng lại khi index chưa đổi, câu hỏi
+được định tuyến khác (vd. DIRECT và RAG) không dùng câu trả lời của nhau, và embedding của các model
+khác nhau không bao giờ được so với nhau. Tra cứu chọn entry có cosine cao nhất trong scope, trúng khi
+>= threshold.
+
+Câu hỏi phụ thuộc lịch sử hội thoại ("còn cái đó thì sao?", "giải thích thêm") không được tra cứu cũng
+không được lưu, vì cùng một câu chữ có nghĩa khác nhau tùy lịch sử.
+"""
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from config import settings as config
+
+# Từ tham chiếu tới lượt trước: câu hỏi chứa chúng chỉ có nghĩa khi đọc cùng lịch sử hội thoại
+_HISTORY_REFERENCE = re.compile(
+    r'(?<!\w)(?:nó|cái (?:đó|này|kia)|điều (?:đó|này)|ở trên|bên trên|vừa rồi|vừa nãy|lúc nãy|câu trước|'
+    r'câu (?:đó|này)|ý (?:đó|này)|phần (?:đó|này)|tiếp tục|tiếp đi|thêm nữa|giải thích thêm|nói thêm|'
+    r'chi tiết hơn|ví dụ khác|còn .{0,30} thì sao|thế còn|vậy còn|'
+    r'it|that|this|those|these|above|previous|continue|more detail|what about|and then)(?!\w)',
+    re.IGNORECASE,
+)
+# Câu hỏi quá ngắn (vd. "tại sao?", "ví dụ?") thường là câu hỏi nối tiếp
+_MIN_STANDALONE_WORDS = 3
+
+
+def depends_on_history(question: str, chat_history: str) -> bool:
+    """True nếu có lịch sử hội thoại và câu hỏi có vẻ tham chiếu tới nó."""
+    if not chat_history or not chat_history.strip():
+        return False
+    if len(question.split()) < _MIN_STANDALONE_WORDS:
+        return True
+    return bool(_HISTORY_REFERENCE.search(question))
+
+
+class AnswerCache:
+    """LRU + TTL trong bộ nhớ, tra cứu theo cosine giữa embedding câu hỏi trong cùng scope."""
+
+    def __init__(self, threshold: float = config.ANSWER_CACHE_THRESHOLD,
+                 ttl_seconds: float = config.ANSWER_CACHE_TTL_SECONDS,
+                 max_entries: int = config.ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # entry_id -> entry, theo thứ tự dùng gần nhất (cuối = mới nhất)
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # scope -> các entry_id thuộc scope đó
+        self._scopes: Dict[Tuple[str, str, str], List[int]] = {}
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._scopes[entry["scope"]]
+        ids.remove(entry_id)
+        if not ids:
+            del self._scopes[entry["scope"]]
+
+    def lookup(self, scope: Tuple[str, str, str], embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Entry gần nhất trong scope (kèm "similarity") nếu vượt threshold, ngược lại None."""
+        now = time.monotonic()
+        with self._lock:
+            self.stats["lookups"] += 1
+            ids = list(self._scopes.get(scope, ()))
+            for entry_id in ids:
+                if now - self._entries[entry_id]["created"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    self.stats["expired"] += 1
+            ids = self._scopes.get(scope, [])
+            if not ids:
+                self.stats["misses"] += 1
+                return None
+            matrix = np.vstack([self._entries[entry_id]["embedding"] for entry_id in ids])
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            self.stats["hits"] += 1
+            entry = self._entries[entry_id]
+            return {"question": entry["question"], "response": entry["response"], "sources": entry["sources"],
+                    "similarity": round(similarity, 4)}
+
+    def store(self, scope: Tuple[str, str, str], embedding: np.ndarray, question: str, response: str,
+              sources: Optional[List[Dict[str, Any]]]):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "scope": scope,
+                "embedding": np.asarray(embedding, dtype=np.float32),
+                "question": question,
+                "response": response,
+                "sources": sources or [],
+                "created": time.monotonic(),
+            }
+            self._scopes.setdefault(scope, []).append(entry_id)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._scopes.clear()
+            return removed
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            entries = len(self._entries)
+            scopes = len(self._scopes)
+        lookups = stats["lookups"]
+        return {
+            **stats,
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "scopes": scopes,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+        }
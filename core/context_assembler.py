@@ -0,0 +1,161 @@
+"""Ghép prompt sinh câu trả lời trong giới hạn token cho từng phần (system, ngữ cảnh, kết quả tool, lịch sử).
+
+Khi vượt ngân sách, phần ít quan trọng bị cắt trước:
+- Ngữ cảnh: các chunk được giữ theo thứ tự xếp hạng của retriever; chunk đầu tiên không vừa bị cắt bớt
+  (nếu còn đủ chỗ), các chunk xếp hạng thấp hơn bị bỏ.
+- Lịch sử: tóm tắt hội thoại (nếu có) đứng đầu, tối đa nửa ngân sách; các lượt gần nhất được giữ nguyên,
+  lượt cũ hơn được rút gọn còn phần đầu, rồi bị bỏ khi hết chỗ.
+- Kết quả tool: giữ phần đầu, cắt phần đuôi.
+
+Token được đếm bằng tiktoken (TOKENIZER_ENCODING, gần với tokenizer của Llama 3 trên Groq); nếu chưa
+cài tiktoken thì ước lượng theo số byte UTF-8 (thiên về đếm dư để không tràn context của model).
+"""
+import math
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from config import settings as config
+
+logger = logging.getLogger(__name__)
+
+_TRUNCATION_MARK = " …[đã rút gọn]"
+# Không chèn chunk bị cắt nếu chỉ còn ít hơn số token này (đoạn quá ngắn không giúp ích gì)
+_MIN_PARTIAL_TOKENS = 48
+# Tin nhắn cũ hơn CONVERSATION_RECENT_TURNS lượt gần nhất chỉ giữ tối đa số token này
+_OLD_MESSAGE_TOKENS = 80
+# Ước lượng khi không có tiktoken: ~3 byte UTF-8 mỗi token (tiếng Việt có dấu tốn nhiều byte hơn tiếng Anh)
+_BYTES_PER_TOKEN = 3
+
+
+class TokenCounter:
+    """Đếm và cắt văn bản theo token."""
+
+    def __init__(self, encoding_name: str = config.TOKENIZER_ENCODING):
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding_name)
+            self.exact = True
+        except Exception as e:  # chưa cài tiktoken hoặc không tải được encoding
+            logger.warning(f"tiktoken encoding '{encoding_name}' unavailable ({e}), estimating token counts")
+            self._encoding = None
+            self.exact = False
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text.encode("utf-8")) / _BYTES_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cắt text còn tối đa max_tokens token (kể cả dấu rút gọn)."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        keep = max(0, max_tokens - self.count(_TRUNCATION_MARK))
+        if self._encoding is not None:
+            head = self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:keep])
+        else:
+            head = text.encode("utf-8")[:keep * _BYTES_PER_TOKEN].decode("utf-8", errors="ignore")
+        return head.rstrip() + _TRUNCATION_MARK
+
+
+class ContextAssembler:
+    """Áp ngân sách token cho từng phần của prompt và ghi lại số token mỗi phần đã dùng."""
+
+    def __init__(self, counter: Optional[TokenCounter] = None,
+                 system_budget: int = config.PROMPT_BUDGET_SYSTEM,
+                 context_budget: int = config.PROMPT_BUDGET_CONTEXT,
+                 tool_output_budget: int = config.PROMPT_BUDGET_TOOL_OUTPUT,
+                 history_budget: int = config.PROMPT_BUDGET_HISTORY):
+        self.counter = counter or TokenCounter()
+        self.budgets = {
+            "system": system_budget,
+            "context": context_budget,
+            "tool_output": tool_output_budget,
+            "history": history_budget,
+        }
+
+    def assemble_context(self, chunks: List[str]) -> Tuple[str, int, Dict[str, Any]]:
+        """Ghép các chunk (đã theo thứ tự xếp hạng) thành "[Nguồn i]: ...".
+
+        Trả về (context, số chunk được dùng, usage).
+        """
+        budget = self.budgets["context"]
+        parts: List[str] = []
+        used = 0
+        truncated = 0
+        for i, chunk in enumerate(chunks):
+            part = f"[Nguồn {i+1}]: {chunk.strip()}"
+            tokens = self.counter.count(part) + (2 if parts else 0)  # "\n\n" giữa các chunk
+            if used + tokens <= budget:
+                parts.append(part)
+                used += tokens
+                continue
+            remaining = budget - used - (2 if parts else 0)
+            if remaining >= _MIN_PARTIAL_TOKENS:
+                part = self.counter.truncate(part, remaining)
+                parts.append(part)
+                used += self.counter.count(part) + (2 if len(parts) > 1 else 0)
+                truncated = 1
+            break
+        usage = {"tokens": used, "budget": budget, "chunks": len(parts),
+                 "dropped_chunks": len(chunks) - len(parts), "truncated_chunks": truncated}
+        return "\n\n".join(parts), len(parts), usage
+
+    def assemble_history(self, messages: List[Dict[str, str]], summary: str = "") -> Tuple[str, Dict[str, Any]]:
+        """Ghép tóm tắt hội thoại và các tin nhắn gần đây (cũ -> mới), ưu tiên các lượt gần nhất."""
+        budget = self.budgets["history"]
+        summary_text = ""
+        summary_tokens = 0
+        if summary:
+            summary_text = self.counter.truncate(f"Tóm tắt hội thoại trước đó: {summary.strip()}", budget // 2)
+            summary_tokens = self.counter.count(summary_text) + 1
+            budget -= summary_tokens
+        lines: List[str] = []
+        used = 0
+        compressed = 0
+        recent_messages = config.CONVERSATION_RECENT_TURNS * 2
+        # Duyệt từ mới nhất về cũ nhất, dừng khi hết ngân sách
+        for age, message in enumerate(reversed(messages)):
+            line = f"{message.get('role', 'user').capitalize()}: {message.get('content', '')}"
+            if age >= recent_messages:
+                short = self.counter.truncate(line, _OLD_MESSAGE_TOKENS)
+                compressed += short != line
+                line = short
+            tokens = self.counter.count(line) + (1 if lines else 0)
+            if used + tokens > budget:
+                remaining = budget - used - (1 if lines else 0)
+                if remaining >= _MIN_PARTIAL_TOKENS:
+                    line = self.counter.truncate(line, remaining)
+                    lines.append(line)
+                    used += self.counter.count(line) + (1 if len(lines) > 1 else 0)
+                    compressed += 1
+                break
+            lines.append(line)
+            used += tokens
+        usage = {"tokens": used + summary_tokens, "budget": self.budgets["history"], "summary_tokens": summary_tokens,
+                 "messages": len(lines), "dropped_messages": len(messages) - len(lines),
+                 "compressed_messages": compressed}
+        if summary_text:
+            lines.append(summary_text)
+        return "\n".join(reversed(lines)), usage
+
+    def fit_tool_output(self, text: str) -> Tuple[str, Dict[str, Any]]:
+        budget = self.budgets["tool_output"]
+        original = self.counter.count(text)
+        fitted = self.counter.truncate(text, budget) if original > budget else text
+        tokens = self.counter.count(fitted) if fitted is not text else original
+        return fitted, {"tokens": tokens, "budget": budget, "truncated": fitted is not text,
+                        "original_tokens": original}
+
+    def measure(self, section: str, text: str) -> Dict[str, Any]:
+        """Chỉ đếm (không cắt) một phần của prompt, cảnh báo khi vượt ngân sách của phần đó."""
+        tokens = self.counter.count(text)
+        usage: Dict[str, Any] = {"tokens": tokens}
+        budget = self.budgets.get(section)
+        if budget is not None:
+            usage["budget"] = budget
+            if tokens > budget:
+                logger.warning(f"Prompt section '{section}' uses {tokens} tokens, over its budget of {budget}")
+        return usage
@@ -0,0 +1,52 @@
+"""Phân loại cảm xúc nhanh tại chỗ (không gọi LLM) cho câu hỏi của người dùng.
+
+Dùng từ điển từ khóa tiếng Việt/tiếng Anh; trả về cùng dạng dict với phân tích bằng LLM
+(emotion, intensity, triggers, suggested_tone) để bước sinh câu trả lời dùng chung.
+"""
+import re
+from typing import Dict, Any
+
+NEUTRAL_EMOTION = {"emotion": "neutral", "intensity": 5, "triggers": "unknown", "suggested_tone": "balanced"}
+
+# emotion -> (từ khóa, tông giọng gợi ý)
+_LEXICON = {
+    "buồn": (["buồn", "chán", "mệt mỏi", "nản", "tuyệt vọng", "cô đơn", "sad", "tired", "bored", "depressed"],
+             "ấm áp, động viên"),
+    "thất vọng": (["thất vọng", "trượt", "rớt môn", "điểm kém", "không làm được", "thi hỏng", "disappointed", "failed"],
+                  "đồng cảm, khích lệ"),
+    "tức giận": (["tức", "bực", "khó chịu", "điên", "ghét", "angry", "annoyed", "hate"],
+                 "bình tĩnh, tôn trọng"),
+    "lo lắng": (["lo", "sợ", "căng thẳng", "áp lực", "sắp thi", "stress", "worried", "anxious", "nervous"],
+                "trấn an, rõ ràng"),
+    "bối rối": (["không hiểu", "chưa hiểu", "khó hiểu", "rối", "bối rối", "confused", "lost", "stuck"],
+                "kiên nhẫn, giải thích từng bước"),
+    "vui": (["vui", "tuyệt", "cảm ơn", "thích", "hay quá", "happy", "great", "thanks", "thank you", "awesome"],
+            "vui vẻ, thân thiện"),
+    "phấn khích": (["phấn khích", "háo hức", "đậu rồi", "qua môn", "excited", "can't wait"],
+                   "nhiệt tình"),
+    "tò mò": (["tại sao", "vì sao", "như thế nào", "làm sao", "là gì", "why", "how", "what is"],
+              "rõ ràng, khơi gợi"),
+}
+
+_PATTERNS = {
+    emotion: re.compile(r'(?<!\w)(?:' + "|".join(re.escape(word) for word in words) + r')(?!\w)', re.IGNORECASE)
+    for emotion, (words, _) in _LEXICON.items()
+}
+
+
+def analyze_emotion_local(text: str) -> Dict[str, Any]:
+    """Chọn cảm xúc có nhiều từ khóa khớp nhất; không khớp gì thì trả về neutral."""
+    best_emotion, best_matches = None, []
+    for emotion, pattern in _PATTERNS.items():
+        matches = pattern.findall(text)
+        if len(matches) > len(best_matches):
+            best_emotion, best_matches = emotion, matches
+    if best_emotion is None:
+        return dict(NEUTRAL_EMOTION)
+    intensity = min(10, 4 + 2 * len(best_matches) + min(text.count("!"), 3))
+    return {
+        "emotion": best_emotion,
+        "intensity": intensity,
+        "triggers": ", ".join(dict.fromkeys(match.lower() for match in best_matches)),
+        "suggested_tone": _LEXICON[best_emotion][1],
+    }
@@ -0,0 +1,267 @@
+"""Bộ định tuyến cục bộ (không gọi LLM) đứng trước bước phân tích ý định bằng LLM.
+
+Hai tầng:
+1. Luật regex cho các trường hợp hiển nhiên (lời chào/cảm ơn -> DIRECT, "tạo quiz" -> Quiz_Generator...);
+   luật của tool chỉ khớp với câu yêu cầu (động từ mệnh lệnh / ngôi thứ nhất), không khớp câu hỏi nội dung.
+2. Phân loại theo centroid gần nhất: mỗi nhãn (tên tool, RAG, DIRECT) có một tập câu ví dụ, centroid là
+   trung bình embedding (đã chuẩn hóa) của các câu đó; câu hỏi được gán nhãn có cosine cao nhất.
+
+Chỉ khi độ tin cậy >= threshold (và cách nhãn thứ hai ít nhất margin) thì kết quả mới được dùng; còn lại
+LLM quyết định như trước. Các lần LLM định tuyến được ghi vào replay log (JSONL) cùng dự đoán của bộ định
+tuyến cục bộ để đánh giá:
+
+    python -m core.fast_router [--replay PATH] [--thresholds 0.5 0.6 0.7]
+    python -m core.fast_router --fixture   # kiểm tra luật regex trên RULE_FIXTURE
+"""
+import os
+import re
+import sys
+import json
+import random
+import argparse
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Callable, Iterable
+import numpy as np
+from config import settings as config
+
+logger = logging.getLogger(__name__)
+
+# Động từ tạo ra sản phẩm hoặc yêu cầu kèm số lượng đứng trước tên sản phẩm của tool ("tạo quiz", "cho mình
+# 10 câu trắc nghiệm"). Luật tool chỉ khớp khi có cụm này để câu hỏi nội dung có nhắc tới từ khóa ("quiz là gì",
+# "cho tôi biết về quiz trong tài liệu", "giúp mình giải câu trắc nghiệm") vẫn đi qua luật RAG/centroid/LLM.
+# "cho/giúp tôi", "tôi muốn/cần" chỉ tính khi theo sau là số lượng; có động từ tạo thì động từ đó đã khớp.
+_REQUEST = (r'(?:^\W*ra\b|\b(?:tạo|làm(?! sao| thế nào| cách nào)|soạn|lập|vẽ|xây dựng|lên|'
+            r'make|create|generate|build|give me)\b|'
+            r'\b(?:(?:cho|giúp) (?:tôi|mình|em)|(?:tôi|mình|em) (?:muốn|cần)) (?:\d+|vài|mấy)\b)[^?.!]{0,40}?')
+# Câu hỏi nội dung (định nghĩa, cách làm, lý do): không bao giờ dùng luật tool, kể cả khi có động từ
+# ("làm quiz là gì?", "làm sao để làm tốt bài trắc nghiệm?")
+_CONTENT_QUESTION = re.compile(r'\b(?:là gì|là sao|nghĩa là|làm sao|làm thế nào|tại sao|vì sao|'
+                               r'what (?:is|are|does)|meaning of|how (?:to|do|does|can)|why)\b', re.IGNORECASE)
+
+# (pattern, action, confidence) — pattern khớp thì dùng luôn, không cần embedding
+ROUTE_RULES = [
+    (re.compile(r'^\W*(?:xin chào|chào|hello|hi|hey|alo|cảm ơn|cám ơn|thanks?(?: you)?|tạm biệt|bye|ok(?:ay)?|oke)'
+                r'(?:\s+(?:bạn|bot|edumentor|nhé|nha|nhiều|ạ|à|nhé bạn))*\W*$', re.IGNORECASE), "DIRECT", 0.99),
+    (re.compile(_REQUEST + r'\b(?:quiz|trắc nghiệm|câu hỏi ôn tập|đề kiểm tra)\b', re.IGNORECASE), "Quiz_Generator", 0.95),
+    (re.compile(_REQUEST + r'\b(?:flash ?cards?|thẻ ghi nhớ|thẻ học)\b', re.IGNORECASE), "Flashcard_Generator", 0.95),
+    (re.compile(_REQUEST + r'\b(?:sơ đồ tư duy|mind ?map)\b', re.IGNORECASE), "Mind_Map_Creator", 0.95),
+    (re.compile(_REQUEST + r'\b(?:kế hoạch học|lộ trình học|lịch học|study plan)\b', re.IGNORECASE), "Study_Plan_Creator", 0.9),
+    # Tiến độ chỉ khi hỏi/cập nhật tiến độ của chính người dùng
+    (re.compile(r'\b(?:tiến độ(?: học(?: tập)?)?(?: môn [\w ]{1,30}?)? của (?:tôi|mình|em)|cập nhật tiến độ|'
+                r'(?:my|update(?: my)?) (?:learning |study )?progress)\b', re.IGNORECASE), "Progress_Tracker", 0.9),
+    (re.compile(r'\b(?:tìm trên (?:mạng|web|internet)|search (?:web|google)|tra google|tin tức mới nhất)\b', re.IGNORECASE), "Web_Search", 0.9),
+    (re.compile(r'\b(?:(?:slide|trang|chương)\s*\d+|tài liệu|bài giảng)\b', re.IGNORECASE), "RAG", 0.85),
+]
+
+# Câu ví dụ cho từng nhãn, dùng để tính centroid
+ROUTE_EXAMPLES: Dict[str, List[str]] = {
+    "DIRECT": [
+        "Xin chào", "Chào bạn, bạn khỏe không?", "Cảm ơn bạn nhiều", "Bạn là ai?", "Bạn có thể làm gì?",
+        "Hôm nay mình mệt quá", "Tạm biệt nhé", "Hello", "Thank you", "Bạn tên gì?",
+    ],
+    "RAG": [
+        "Tóm tắt slide 5", "Trong tài liệu nói gì về đạo hàm?", "Chương 2 trình bày nội dung gì?",
+        "Giải thích đoạn trong bài giảng về mạng nơ-ron", "Theo tài liệu, định nghĩa của thuật toán là gì?",
+        "Trang 10 nói về vấn đề gì?", "Nội dung chính của bài học hôm nay là gì?",
+        "Công thức tính phương sai trong tài liệu là gì?", "What does the lecture say about recursion?",
+    ],
+    "Quiz_Generator": [
+        "Tạo quiz về chương 3", "Cho mình 10 câu trắc nghiệm về lịch sử", "Kiểm tra kiến thức của tôi về Python",
+        "Ra đề kiểm tra về xác suất", "Make a quiz about linear algebra",
+    ],
+    "Flashcard_Generator": [
+        "Tạo flashcard từ vựng tiếng Anh", "Làm thẻ ghi nhớ về các khái niệm hóa học", "Create flashcards for biology terms",
+    ],
+    "Mind_Map_Creator": [
+        "Vẽ sơ đồ tư duy về machine learning", "Tạo mind map cho chủ đề kinh tế vi mô", "Sơ đồ hóa các ý chính của bài",
+    ],
+    "Study_Plan_Creator": [
+        "Lập kế hoạch học toán trong 2 tuần", "Tạo lộ trình học lập trình web", "Giúp mình lên lịch ôn thi cuối kỳ",
+    ],
+    "Progress_Tracker": [
+        "Tiến độ học của tôi thế nào?", "Cập nhật tiến độ môn vật lý lên 50%", "Tôi đã học được bao nhiêu rồi?",
+    ],
+    "Web_Search": [
+        "Tìm trên mạng tin tức mới nhất về AI", "Hôm nay thời tiết thế nào?", "Mai là thứ mấy?",
+        "Giá vàng hôm nay bao nhiêu?", "Search the web for Python 3.13 release notes",
+    ],
+    "Summary_Generator": [
+        "Tóm tắt chủ đề chiến tranh thế giới thứ hai", "Viết tóm tắt về thuyết tiến hóa", "Summarize the topic of photosynthesis",
+    ],
+    "Concept_Explainer": [
+        "Giải thích khái niệm entropy", "Khái niệm đệ quy là gì?", "Explain the concept of polymorphism",
+    ],
+}
+
+
+# Fixture nhỏ có nhãn cho các luật regex (mỗi câu phải được một luật quyết định đúng), gồm cả các câu hỏi nội
+# dung từng bị luật tool bắt nhầm:  python -m core.fast_router --fixture
+RULE_FIXTURE: List[Dict[str, str]] = [
+    {"question": "Xin chào", "llm_action": "DIRECT"},
+    {"question": "Cảm ơn bạn nhiều nhé", "llm_action": "DIRECT"},
+    {"question": "Tạo quiz về chương 3", "llm_action": "Quiz_Generator"},
+    {"question": "Cho mình 10 câu trắc nghiệm về lịch sử", "llm_action": "Quiz_Generator"},
+    {"question": "Giúp mình tạo đề kiểm tra chương 2 trong tài liệu", "llm_action": "Quiz_Generator"},
+    {"question": "Ra đề kiểm tra về xác suất", "llm_action": "Quiz_Generator"},
+    {"question": "Tôi muốn 5 câu hỏi ôn tập về đạo hàm", "llm_action": "Quiz_Generator"},
+    {"question": "Make a quiz about linear algebra", "llm_action": "Quiz_Generator"},
+    {"question": "Làm thẻ ghi nhớ về các khái niệm hóa học", "llm_action": "Flashcard_Generator"},
+    {"question": "Vẽ sơ đồ tư duy về machine learning", "llm_action": "Mind_Map_Creator"},
+    {"question": "Lập kế hoạch học toán trong 2 tuần", "llm_action": "Study_Plan_Creator"},
+    {"question": "Tiến độ học của tôi thế nào?", "llm_action": "Progress_Tracker"},
+    {"question": "Cho tôi biết về quiz trong tài liệu", "llm_action": "RAG"},
+    {"question": "Giúp mình giải bài tập trắc nghiệm câu 3 trong tài liệu", "llm_action": "RAG"},
+    {"question": "Giúp tôi hiểu phần sơ đồ tư duy ở slide 4", "llm_action": "RAG"},
+    {"question": "Tôi cần hiểu lộ trình học trong chương 1", "llm_action": "RAG"},
+    {"question": "Làm quiz là gì trong tài liệu?", "llm_action": "RAG"},
+    {"question": "Điều gì xảy ra với trắc nghiệm ở chương 5?", "llm_action": "RAG"},
+    {"question": "Tóm tắt slide 3", "llm_action": "RAG"},
+]
+
+
+class FastRouter:
+    """Định tuyến câu hỏi bằng luật + centroid embedding; trả về None-action khi không đủ tự tin."""
+
+    def __init__(self, model_getter: Callable[[], Any], allowed_actions: Optional[Iterable[str]] = None,
+                 threshold: float = config.FAST_ROUTER_THRESHOLD, margin: float = config.FAST_ROUTER_MARGIN,
+                 replay_path: Optional[str] = config.ROUTER_REPLAY_PATH):
+        self.model_getter = model_getter
+        allowed = set(allowed_actions) | {"RAG", "DIRECT"} if allowed_actions is not None else None
+        self.rules = [rule for rule in ROUTE_RULES if allowed is None or rule[1] in allowed]
+        self.examples = {label: texts for label, texts in ROUTE_EXAMPLES.items() if allowed is None or label in allowed}
+        self.threshold = threshold
+        self.margin = margin
+        self.replay_path = replay_path
+        self._lock = threading.Lock()
+        self._centroids = None  # (model, labels, ma trận centroid)
+        self.stats = {"rule": 0, "centroid": 0, "fallback": 0}
+
+    def _centroid_matrix(self, model):
+        # Tính lại khi embedding model đổi (vd. sau khi index được rebuild bằng model khác)
+        with self._lock:
+            if self._centroids is None or self._centroids[0] is not model:
+                labels = list(self.examples)
+                rows = []
+                for label in labels:
+                    embeddings = np.asarray(model.encode(self.examples[label], normalize_embeddings=True))
+                    centroid = embeddings.mean(axis=0)
+                    rows.append(centroid / (np.linalg.norm(centroid) or 1.0))
+                self._centroids = (model, labels, np.vstack(rows))
+            return self._centroids[1], self._centroids[2]
+
+    def classify(self, question: str) -> Dict[str, Any]:
+        """Trả về {"action", "confidence", "source", "accepted"}; chạy đồng bộ (encode tốn CPU)."""
+        content_question = _CONTENT_QUESTION.search(question) is not None
+        for pattern, action, confidence in self.rules:
+            if content_question and action not in ("RAG", "DIRECT"):
+                continue
+            if pattern.search(question):
+                self.stats["rule"] += 1
+                return {"action": action, "confidence": confidence, "source": "rule", "accepted": True}
+
+        model = self.model_getter()
+        if model is None or not self.examples:
+            self.stats["fallback"] += 1
+            return {"action": None, "confidence": 0.0, "source": "none", "accepted": False}
+        labels, centroids = self._centroid_matrix(model)
+        query = np.asarray(model.encode(question, normalize_embeddings=True))
+        scores = centroids @ query
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else -1.0
+        accepted = best >= self.threshold and best - runner_up >= self.margin
+        self.stats["centroid" if accepted else "fallback"] += 1
+        return {"action": labels[order[0]], "confidence": round(best, 4), "margin": round(best - runner_up, 4),
+                "source": "centroid", "accepted": accepted}
+
+    def log_replay(self, question: str, prediction: Dict[str, Any], llm_action: str):
+        """Ghi một mẫu (câu hỏi, dự đoán cục bộ, nhãn của LLM) vào replay log."""
+        if not self.replay_path:
+            return
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "question": question,
+            "llm_action": llm_action,
+            "fast_action": prediction.get("action"),
+            "fast_confidence": prediction.get("confidence"),
+            "fast_source": prediction.get("source"),
+            "fast_accepted": prediction.get("accepted"),
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.replay_path)), exist_ok=True)
+            with self._lock, open(self.replay_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write router replay log: {e}")
+
+    @staticmethod
+    def should_shadow(rate: float = config.FAST_ROUTER_SHADOW_RATE) -> bool:
+        """Lấy mẫu các câu đã được định tuyến cục bộ để chạy thêm LLM router (ghi replay log)."""
+        return random.random() < rate
+
+
+def evaluate(router: FastRouter, records: List[Dict[str, Any]], thresholds: List[float]) -> List[Dict[str, Any]]:
+    """So sánh bộ định tuyến cục bộ với nhãn của LLM trên replay log, theo từng ngưỡng."""
+    predictions = [router.classify(record["question"]) for record in records]
+    results = []
+    for threshold in thresholds:
+        covered = correct = 0
+        for record, prediction in zip(records, predictions):
+            accepted = prediction["source"] == "rule" or (
+                prediction["source"] == "centroid" and prediction["confidence"] >= threshold
+                and prediction.get("margin", 0.0) >= router.margin)
+            if accepted:
+                covered += 1
+                correct += prediction["action"] == record["llm_action"]
+        results.append({
+            "threshold": threshold,
+            "samples": len(records),
+            "coverage": round(covered / len(records), 4) if records else 0.0,
+            "accuracy_on_covered": round(correct / covered, 4) if covered else 0.0,
+        })
+    top1 = sum(p["action"] == r["llm_action"] for r, p in zip(records, predictions))
+    for result in results:
+        result["top1_agreement"] = round(top1 / len(records), 4) if records else 0.0
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Evaluate the local fast-path router against logged LLM routing decisions")
+    parser.add_argument("--replay", type=str, default=config.ROUTER_REPLAY_PATH, help="Replay log (JSONL)")
+    parser.add_argument("--model", type=str, default=config.EMBEDDING_MODEL, help="Embedding model for the centroids")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8])
+    parser.add_argument("--fixture", action="store_true", help="Check the regex rules against RULE_FIXTURE (no model needed)")
+    args = parser.parse_args(argv)
+
+    if args.fixture:
+        router = FastRouter(lambda: None, replay_path=None)
+        result = evaluate(router, RULE_FIXTURE, [1.0])[0]
+        for record in RULE_FIXTURE:
+            prediction = router.classify(record["question"])
+            if prediction["action"] != record["llm_action"]:
+                print(f"MISMATCH {record['question']!r}: expected {record['llm_action']}, got {prediction['action']}")
+        print(f"{result['samples']} fixture samples: coverage {result['coverage']:.1%}, "
+              f"accuracy on covered {result['accuracy_on_covered']:.1%}")
+        sys.exit(0 if result["coverage"] == 1.0 and result["accuracy_on_covered"] == 1.0 else 1)
+
+    if not os.path.exists(args.replay):
+        print(f"Replay log not found: {args.replay}")
+        sys.exit(1)
+    with open(args.replay, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records = [record for record in records if record.get("question") and record.get("llm_action")]
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(args.model)
+    router = FastRouter(lambda: model, replay_path=None)
+    print(f"{len(records)} replay samples, model {args.model}")
+    for result in evaluate(router, records, args.thresholds):
+        print(f"threshold {result['threshold']:.2f}: coverage {result['coverage']:.1%}, "
+              f"accuracy on covered {result['accuracy_on_covered']:.1%} "
+              f"(top-1 agreement {result['top1_agreement']:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,23 +3,36 @@ import json
 import re
 import asyncio
 import logging
+import time
 import uuid
-from typing import List, Dict, Any, Optional, TypedDict
+from typing import List, Dict, Any, Optional, Tuple, TypedDict, Annotated, AsyncIterator
 from datetime import datetime, timezone
 from langchain.memory import ConversationBufferMemory
-from groq import Groq
 from langgraph.graph import StateGraph, END
+from pymongo import ReturnDocument
 from pymongo.collection import Collection
 from bson import ObjectId
 from config import settings as config
 from retrievers.ensemble_retriever import EnsembleRetriever
 from tools.tool_registry import ToolRegistry
 from tools import register_all_tools
+from core.emotion import analyze_emotion_local, NEUTRAL_EMOTION
+from core.llm_client import LLMClient
+from core.fast_router import FastRouter
+from core.answer_cache import AnswerCache, depends_on_history
+from core.context_assembler import ContextAssembler
+from utils.single_flight import SingleFlight, normalize_text
+from utils.tracing import tracer
 
 logging.basicConfig(level=config.LOGGING_LEVEL, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+def _merge_dicts(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reducer gộp theo key các dict mà mỗi node trả về (thời gian từng stage, số token từng phần prompt)."""
+    return {**(left or {}), **(right or {})}
+
+
 class AssistantState(TypedDict):
     question: str
     chat_history: str
@@ -30,47 +43,12 @@ class AssistantState(TypedDict):
     route_decision: Optional[str]
     selected_tool_name: Optional[str]
     needs_context_for_tool: Optional[bool]
-    emotion: Optional[Dict[str, Any]] 
-
-class _LLMWrapper:
-    def __init__(self, client, model, temperature):
-        self.client = client
-        self.model = model
-        self.temperature = temperature
-
-    async def ainvoke(self, prompt: str) -> str:
-        # Support both simple string prompt and potential object with .content
-        if hasattr(prompt, 'content'):
-            content = prompt.content
-        else:
-            content = str(prompt)
-        
-        # Use print for guaranteed visibility in console during debugging
-        # print(f"\n[DEBUG] _LLMWrapper: Invoking Groq with model={self.model}, temp={self.temperature}", flush=True)
-        # print(f"[DEBUG] _LLMWrapper: Prompt preview: {content[:200]}...", flush=True) 
-
-        try:
-             response = await asyncio.to_thread(
-                lambda: self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "user", "content": content}
-                    ],
-                    temperature=self.temperature,
-                )
-            )
-             result_content = response.choices[0].message.content
-             if result_content is None:
-                 # print("[DEBUG] _LLMWrapper: Received None content from Groq API!", flush=True)
-                 return ""
-                 
-             stripped_content = result_content.strip()
-             # print(f"[DEBUG] _LLMWrapper: Received response length: {len(stripped_content)}", flush=True)
-             # print(f"[DEBUG] _LLMWrapper: Response preview: {stripped_content[:200]}...", flush=True)
-             return stripped_content
-        except Exception as e:
-            # print(f"[ERROR] _LLMWrapper: Error calling Groq API: {e}", flush=True)
-            raise e
+    route_source: Optional[str]  # "rule" / "centroid" (FastRouter), "llm" hoặc "fallback" (định tuyến lỗi, mặc định RAG)
+    emotion: Optional[Dict[str, Any]]
+    answer_cache: Optional[Dict[str, Any]]  # {"status": "hit"/"miss"/"bypass", ...} của AnswerCache
+    degraded: Optional[bool]  # Một stage bị lỗi: câu trả lời không được đưa vào cache
+    stage_timings: Annotated[Dict[str, float], _merge_dicts]
+    token_usage: Annotated[Dict[str, Any], _merge_dicts]
 
 class LearningAssistant:
     # Modify __init__ to accept mongo_collection
@@ -79,26 +57,44 @@ class LearningAssistant:
                  collection_name: str = config.CHROMA_COLLECTION,
                  model_name: str = config.LLM_GROQ_MODEL or 'llama-3.3-70b-versatile',
                  api_key: Optional[str] = config.GROQ_API_KEY,
-                 temperature: float = config.LLM_TEMPERATURE):
+                 temperature: float = config.LLM_TEMPERATURE,
+                 embedding_model: str = config.EMBEDDING_MODEL,
+                 emotion_mode: str = config.EMOTION_ANALYSIS_MODE):
         self.api_key = api_key
+        # "off" | "llm" | "local": cách phân tích cảm xúc của câu hỏi (xem _analyze_emotion_node)
+        self.emotion_mode = emotion_mode
         self.model_name = model_name
         self.temperature = temperature
-        self.groq_client = Groq(api_key=self.api_key)
-        # Initialize llm wrapper for tools expecting it
-        self.llm = _LLMWrapper(self.groq_client, self.model_name, self.temperature)
+        # Một client async dùng chung (pool kết nối keep-alive) cho mọi node và tool
+        self.llm_client = LLMClient(self.api_key, self.model_name, self.temperature)
+        # Các tool gọi assistant.llm.ainvoke(prompt)
+        self.llm = self.llm_client
 
         self.retriever = EnsembleRetriever(
             collection_name=collection_name,
-            model_name=config.EMBEDDING_MODEL,
+            model_name=embedding_model,
             vector_weight=config.VECTOR_WEIGHT,
             bm25_weight=config.BM25_WEIGHT,
             top_k=config.RETRIEVER_TOP_K
         )
         # Keep Langchain memory for now, might phase out later
         self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=False, output_key="response")
+        # Giới hạn token cho ngữ cảnh, kết quả tool và lịch sử trong prompt
+        self.context_assembler = ContextAssembler()
         self.tool_registry = ToolRegistry(self)
         self._register_default_tools()
         self.workflow = self._setup_workflow()
+        # Định tuyến cục bộ (luật + centroid embedding) trước khi hỏi LLM
+        self.fast_router = FastRouter(lambda: self.retriever.model, self.tool_registry.get_tool_names()) \
+            if config.FAST_ROUTER_ENABLED else None
+        # Cache câu trả lời theo ngữ nghĩa, tách theo phiên bản collection và route
+        self.answer_cache = AnswerCache() if config.ANSWER_CACHE_ENABLED else None
+        # Gộp các câu hỏi / lời gọi tool giống hệt nhau đang chạy đồng thời thành một lần tính
+        self.single_flight = SingleFlight() if config.SINGLE_FLIGHT_ENABLED else None
+        # Giữ tham chiếu tới các task nền (vd. shadow routing) để không bị GC giữa chừng
+        self._background_tasks = set()
+        # _id các hội thoại đang được cập nhật tóm tắt
+        self._summarizing = set()
         # Store the passed-in MongoDB collection
         self.mongo_collection = mongo_collection
         # Fix: Instead of direct boolean check, compare with None
@@ -113,18 +109,21 @@ class LearningAssistant:
 
     def _setup_workflow(self) -> StateGraph:
         workflow = StateGraph(AssistantState)
-        workflow.add_node("analyze_intent", self._analyze_intent_node)
-        workflow.add_node("retrieve_context", self._retrieve_context_node)
-        workflow.add_node("execute_tool", self._execute_tool_node)
-        workflow.add_node("generate_response", self._generate_response_node)
-        workflow.add_node("format_sources", self._format_sources_node)
-        workflow.set_entry_point("analyze_intent")
+        workflow.add_node("fan_out", self._timed("fan_out", self._fan_out_node))
+        workflow.add_node("retrieve_context", self._timed("retrieve_context", self._retrieve_context_node))
+        workflow.add_node("execute_tool", self._timed("execute_tool", self._execute_tool_node))
+        workflow.add_node("generate_response", self._timed("generate_response", self._generate_response_node))
+        workflow.add_node("format_sources", self._timed("format_sources", self._format_sources_node))
+        workflow.set_entry_point("fan_out")
         workflow.add_conditional_edges(
-            "analyze_intent",
-            self._route_after_intent,
+            "fan_out",
+            self._route_after_cache,
             {
+                "cache_hit": END,
                 "retrieve_for_rag": "retrieve_context",
                 "retrieve_for_tool": "retrieve_context",
+                "context_ready_for_rag": "generate_response",
+                "context_ready_for_tool": "execute_tool",
                 "execute_tool_direct": "execute_tool",
                 "generate_direct": "generate_response"
             }
@@ -139,22 +138,147 @@ class LearningAssistant:
         workflow.add_edge("format_sources", END)
         return workflow.compile()
 
+    @staticmethod
+    def _timed(stage: str, node):
+        """Bọc một node để ghi thời gian chạy (ms) vào state["stage_timings"][stage] và một span graph.<stage>."""
+        async def run(state: AssistantState) -> Dict[str, Any]:
+            started = time.perf_counter()
+            with tracer.span(f"graph.{stage}"):
+                update = dict(await node(state) or {})
+            # Giữ thời gian của các bước con mà node tự ghi (vd. fan_out)
+            update["stage_timings"] = {**update.get("stage_timings", {}), stage: round((time.perf_counter() - started) * 1000, 1)}
+            return update
+        return run
+
+    def _route_after_cache(self, state: AssistantState) -> str:
+        if (state.get("answer_cache") or {}).get("status") == "hit":
+            return "cache_hit"
+        return self._route_after_intent(state)
+
     def _route_after_intent(self, state: AssistantState) -> str:
         decision = state.get("route_decision")
         tool_name = state.get("selected_tool_name")
         needs_context = state.get("needs_context_for_tool", False)
+        # Ngữ cảnh đã có sẵn nhờ truy xuất song song trong fan_out thì bỏ qua retrieve_context
+        context_ready = state.get("context") is not None
         if decision == "TOOL" and tool_name:
-            return "retrieve_for_tool" if needs_context else "execute_tool_direct"
-        elif decision == "RAG":
-            return "retrieve_for_rag"
+            if not needs_context:
+                return "execute_tool_direct"
+            return "context_ready_for_tool" if context_ready else "retrieve_for_tool"
         elif decision == "DIRECT":
             return "generate_direct"
-        return "retrieve_for_rag"
+        return "context_ready_for_rag" if context_ready else "retrieve_for_rag"
+
+    async def _fan_out_node(self, state: AssistantState) -> Dict[str, Any]:
+        """Chạy đồng thời phân tích ý định, phân tích cảm xúc và truy xuất ngữ cảnh.
+
+        Phần lớn câu hỏi đi theo nhánh RAG nên việc truy xuất được bắt đầu ngay, không chờ kết quả
+        định tuyến. Khi ý định là DIRECT hoặc tool không cần ngữ cảnh, lượt truy xuất bị hủy và
+        kết quả (nếu đã có) bị bỏ qua. Tắt bằng SPECULATIVE_RETRIEVAL=false để chỉ truy xuất sau
+        khi đã biết route.
+
+        Cache câu trả lời được tra ngay khi biết route (embedding câu hỏi được tính song song với định
+        tuyến), trước khi chờ truy xuất: trúng cache thì lượt truy xuất và phân tích cảm xúc
+        (nếu chưa xong) bị hủy và graph kết thúc.
+        """
+        timings: Dict[str, float] = {}
+
+        async def timed(stage: str, coro):
+            started = time.perf_counter()
+            try:
+                with tracer.span(f"graph.{stage}"):
+                    return await coro
+            finally:
+                timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+        intent_task = asyncio.create_task(timed("analyze_intent", self._analyze_intent_node(state)))
+        emotion_task = asyncio.create_task(timed("analyze_emotion", self._analyze_emotion_node(state)))
+        embedding_task = None
+        if self._answer_cache_applies(state):
+            embedding_task = asyncio.create_task(self._embed_for_answer_cache(state["question"]))
+        retrieval_task = None
+        if config.SPECULATIVE_RETRIEVAL:
+            retrieval_task = asyncio.create_task(timed("speculative_retrieval", self._retrieve_context_node(state)))
+
+        update: Dict[str, Any] = {}
+        try:
+            update.update(await intent_task)
+            update.update(await timed("answer_cache", self._lookup_answer_cache({**state, **update}, embedding_task)))
+            cache_hit = (update["answer_cache"] or {}).get("status") == "hit"
+            needs_context = not cache_hit and (update["route_decision"] == "RAG" or (
+                update["route_decision"] == "TOOL" and update["needs_context_for_tool"]))
+            if retrieval_task is not None:
+                if needs_context:
+                    update.update(await retrieval_task)
+                else:
+                    retrieval_task.cancel()
+                    reason = "answer cache hit" if cache_hit else f"route {update['route_decision']}"
+                    logger.info(f"Discarded speculative retrieval for {reason}")
+            # Trúng cache thì không sinh câu trả lời nên không chờ phân tích cảm xúc (có thể là một lần
+            # gọi LLM): chỉ lấy kết quả nếu đã xong, task chưa xong bị hủy ở finally
+            if not cache_hit:
+                update.update(await emotion_task)
+            elif emotion_task.done() and not emotion_task.cancelled() and emotion_task.exception() is None:
+                update.update(emotion_task.result())
+        finally:
+            for task in (intent_task, emotion_task, embedding_task, retrieval_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        update["stage_timings"] = timings
+        return update
 
     def _route_after_retrieval(self, state: AssistantState) -> str:
         return "to_tool" if state.get("route_decision") == "TOOL" else "to_response"
 
     async def _analyze_intent_node(self, state: AssistantState) -> Dict[str, Any]:
+        """Chọn route cho câu hỏi; lỗi bất ngờ khi định tuyến không làm hỏng request mà mặc định về RAG."""
+        try:
+            return await self._route_question(state)
+        except Exception as e:
+            logger.exception(f"Error in intent analysis, defaulting to RAG: {e}")
+            return {**self._route_from_action(None), "route_source": "fallback"}
+
+    async def _route_question(self, state: AssistantState) -> Dict[str, Any]:
+        question = state["question"]
+        prediction = None
+        if self.fast_router is not None:
+            # Định tuyến cục bộ trước; chỉ gọi LLM khi không đủ tự tin (hoặc khi router cục bộ lỗi)
+            try:
+                prediction = await asyncio.to_thread(self.fast_router.classify, question)
+            except Exception as e:
+                logger.warning(f"Fast router failed, asking the LLM router: {e}")
+            if prediction is not None and prediction["accepted"]:
+                if self.fast_router.should_shadow():
+                    task = asyncio.create_task(self._shadow_llm_route(state, prediction))
+                    self._background_tasks.add(task)
+                    task.add_done_callback(self._background_tasks.discard)
+                return {**self._route_from_action(prediction["action"]), "route_source": prediction["source"]}
+
+        action = await self._llm_route_action(state)
+        if prediction is not None and action is not None:
+            self.fast_router.log_replay(question, prediction, action)
+        return {**self._route_from_action(action), "route_source": "llm"}
+
+    async def _shadow_llm_route(self, state: AssistantState, prediction: Dict[str, Any]):
+        """Chạy thêm LLM router cho một mẫu câu đã định tuyến cục bộ, chỉ để ghi replay log."""
+        action = await self._llm_route_action(state)
+        if action is not None:
+            self.fast_router.log_replay(state["question"], prediction, action)
+
+    def _route_from_action(self, action: Optional[str]) -> Dict[str, Any]:
+        if action == "RAG" or action is None:
+            return {"route_decision": "RAG", "selected_tool_name": None, "needs_context_for_tool": False}
+        if action == "DIRECT":
+            return {"route_decision": "DIRECT", "selected_tool_name": None, "needs_context_for_tool": False}
+        if self.tool_registry.has_tool(action):
+            return {"route_decision": "TOOL", "selected_tool_name": action,
+                    "needs_context_for_tool": self.tool_registry.get_tool_needs_context(action)}
+        logger.warning(f"Invalid action '{action}', defaulting to RAG")
+        return {"route_decision": "RAG", "selected_tool_name": None, "needs_context_for_tool": False}
+
+    async def _llm_route_action(self, state: AssistantState) -> Optional[str]:
+        """Hỏi LLM chọn hành động (tên tool, RAG hoặc DIRECT); None nếu lời gọi lỗi."""
         question = state["question"]
         chat_history = state.get("chat_history", "")
         available_tools = list(self.tool_registry.get_tool_names())
@@ -186,23 +310,17 @@ class LearningAssistant:
         user_prompt = f"Lịch sử hội thoại:\n{chat_history}\n\nCâu hỏi người dùng:\n{question}"
 
         try:
-            response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    lambda: self.groq_client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        temperature=self.temperature,
-                        max_tokens=1024
-                    )
+            response_text = await asyncio.wait_for(
+                self.llm_client.chat(
+                    [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    max_tokens=1024
                 ),
                 timeout=20.0
             )
             
-            response_text = response.choices[0].message.content.strip()
-            
             # Remove markdown code blocks if present
             if response_text.startswith("```"):
                 response_text = response_text.split("```")[1]
@@ -215,37 +333,11 @@ class LearningAssistant:
                 result_json = json.loads(response_text)
             except json.JSONDecodeError:
                 logger.warning(f"Could not parse JSON from response: {response_text}")
-                result_json = {"action": "RAG", "confidence": 0.5, "reasoning": "Parse error"}
-            
-            action = result_json.get("action")
-            if action == "RAG":
-                route_decision = "RAG"
-                selected_tool_name = None
-                needs_context = False
-            elif action == "DIRECT":
-                route_decision = "DIRECT"
-                selected_tool_name = None
-                needs_context = False
-            elif self.tool_registry.has_tool(action):
-                route_decision = "TOOL"
-                selected_tool_name = action
-                needs_context = self.tool_registry.get_tool_needs_context(action)
-            else:
-                route_decision = "RAG"
-                selected_tool_name = None
-                needs_context = False
-                logger.warning(f"Invalid action '{action}', defaulting to RAG")
+                return None
+            return result_json.get("action")
         except Exception as e:
             logger.exception(f"Error in intent analysis: {e}")
-            route_decision = "RAG"
-            selected_tool_name = None
-            needs_context = False
-
-        return {
-            "route_decision": route_decision,
-            "selected_tool_name": selected_tool_name,
-            "needs_context_for_tool": needs_context
-        }
+            return None
 
 
     async def _retrieve_context_node(self, state: AssistantState) -> Dict[str, Any]:
@@ -253,16 +345,26 @@ class LearningAssistant:
         try:
             results = await asyncio.wait_for(self.retriever.search(question, top_k=config.RETRIEVER_TOP_K), timeout=15.0)
             if results:
-                context = "\n\n".join([f"[Nguồn {i+1}]: {doc.get('text', '').strip()}" for i, doc in enumerate(results)])
-                return {"context": context, "sources": results}
+                context, used, usage = self.context_assembler.assemble_context([doc.get('text', '') for doc in results])
+                # Chỉ giữ nguồn của các chunk thực sự nằm trong ngữ cảnh
+                return {"context": context, "sources": results[:used], "token_usage": {"context": usage}}
             return {"context": "Không tìm thấy thông tin liên quan.", "sources": []}
         except Exception as e:
             logger.exception(f"Error retrieving context: {e}")
-            return {"context": f"Lỗi khi truy xuất: {str(e)}", "sources": []}
-    # Add this in the imports section
+            return {"context": f"Lỗi khi truy xuất: {str(e)}", "sources": [], "degraded": True}
 
+    async def _analyze_emotion_node(self, state: AssistantState) -> Dict[str, Any]:
+        """Phân tích cảm xúc đúng một lần mỗi request; kết quả nằm trong state["emotion"]."""
+        if state.get("emotion") is not None:
+            return {}
+        if self.emotion_mode == "llm":
+            emotion = await self._analyze_emotion(state["question"])
+        elif self.emotion_mode == "local":
+            emotion = analyze_emotion_local(state["question"])
+        else:
+            emotion = dict(NEUTRAL_EMOTION)
+        return {"emotion": emotion}
 
-    # Add this method to the LearningAssistant class after _analyze_intent_node
     async def _analyze_emotion(self, text: str) -> Dict[str, Any]:
         """Analyzes the emotional content of user input."""
         prompt = f"""Analyze the emotional state reflected in this text:
@@ -280,23 +382,17 @@ class LearningAssistant:
             """
         
         try:
-            response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    lambda: self.groq_client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
-                            {"role": "system", "content": "You are an emotional analysis assistant. Return only valid JSON."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=self.temperature,
-                        max_tokens=512
-                    )
+            response_text = await asyncio.wait_for(
+                self.llm_client.chat(
+                    [
+                        {"role": "system", "content": "You are an emotional analysis assistant. Return only valid JSON."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=512
                 ),
                 timeout=10.0
             )
             
-            response_text = response.choices[0].message.content.strip()
-            
             # Remove markdown code blocks if present
             if response_text.startswith("```"):
                 response_text = response_text.split("```")[1]
@@ -310,33 +406,114 @@ class LearningAssistant:
                 return result
             except json.JSONDecodeError:
                 logger.warning(f"Could not parse emotion JSON: {response_text}")
-                return {
-                    "emotion": "neutral",
-                    "intensity": 5,
-                    "triggers": "unknown",
-                    "suggested_tone": "balanced"
-                }
+                return dict(NEUTRAL_EMOTION)
         except Exception as e:
             logger.warning(f"Emotion analysis failed: {e}")
-            return {
-                "emotion": "neutral",
-                "intensity": 5,
-                "triggers": "unknown",
-                "suggested_tone": "balanced"
-            }
+            return dict(NEUTRAL_EMOTION)
+
+    def _answer_cache_route(self, state: AssistantState) -> str:
+        if state.get("route_decision") == "TOOL":
+            return f"TOOL:{state.get('selected_tool_name')}"
+        return state.get("route_decision") or "DIRECT"
+
+    async def collection_version(self) -> str:
+        """Phiên bản nội dung index: tên collection (đổi khi rebuild) + số chunk (đổi khi thêm/xóa tài liệu)."""
+        collection = self.retriever.collection
+        if collection is None:
+            return f"{self.retriever.collection_name}@unavailable"
+        count = await asyncio.to_thread(collection.count)
+        return f"{self.retriever.collection_name}@{count}"
+
+    def _answer_cache_applies(self, state: AssistantState) -> bool:
+        """Có thể tra cache cho câu hỏi này không (chưa tính route, vốn chỉ biết sau định tuyến)."""
+        return (self.answer_cache is not None and self.retriever.collection is not None
+                and not depends_on_history(state["question"], state.get("chat_history", "")))
+
+    async def _embed_for_answer_cache(self, question: str) -> Tuple[Any, str]:
+        """(embedding đã chuẩn hóa của câu hỏi, tên embedding model đã dùng)."""
+        model_name, model = self.retriever.model_name, self.retriever.model
+        embedding = await asyncio.to_thread(model.encode, question, normalize_embeddings=True)
+        return embedding, model_name
+
+    async def _lookup_answer_cache(self, state: AssistantState, embedding_task: Optional[asyncio.Task]) -> Dict[str, Any]:
+        """Tra cứu câu trả lời đã sinh cho câu hỏi tương tự; state đã có kết quả định tuyến.
+
+        Scope gồm phiên bản index, embedding model và route: embedding của model khác (vd. sau khi
+        đổi model) không bao giờ được so với nhau. Khi trượt, scope và embedding được giữ trong state
+        để lưu câu trả lời mới sau khi graph chạy xong.
+        """
+        if self.answer_cache is None or self.retriever.collection is None:
+            return {"answer_cache": None}
+        route = self._answer_cache_route(state)
+        if route not in config.ANSWER_CACHE_ROUTES:
+            if embedding_task is not None:
+                embedding_task.cancel()
+            return {"answer_cache": {"status": "bypass", "reason": "route"}}
+        question = state["question"]
+        if embedding_task is None:
+            self.answer_cache.record_bypass()
+            return {"answer_cache": {"status": "bypass", "reason": "history"}}
+        try:
+            uses_context = route == "RAG" or (route.startswith("TOOL:") and state.get("needs_context_for_tool"))
+            # Câu trả lời không dựa vào tài liệu thì không phụ thuộc phiên bản index
+            version = await self.collection_version() if uses_context else "-"
+            embedding, model_name = await embedding_task
+            scope = (version, model_name, route)
+            cached = self.answer_cache.lookup(scope, embedding)
+        except Exception as e:
+            logger.warning(f"Answer cache lookup skipped: {e}")
+            return {"answer_cache": None}
+        if cached is None:
+            return {"answer_cache": {"status": "miss", "scope": scope, "embedding": embedding}}
+        logger.info(f"Answer cache hit ({cached['similarity']}) for '{question}' ~ '{cached['question']}'")
+        return {
+            "response": cached["response"],
+            "sources": cached["sources"],
+            "answer_cache": {"status": "hit", "similarity": cached["similarity"], "cached_question": cached["question"]},
+        }
+
+    def _store_in_answer_cache(self, state: AssistantState):
+        """Lưu câu trả lời vừa sinh vào cache (dùng chung mọi người dùng).
+
+        Chỉ lưu câu trả lời sinh ra khi chưa có lịch sử hội thoại (kể cả tóm tắt): câu trả lời trong một
+        hội thoại có thể dựa vào ngữ cảnh riêng của người dùng đó dù câu hỏi không nhắc tới lịch sử.
+        """
+        cache_state = state.get("answer_cache") or {}
+        if self.answer_cache is None or cache_state.get("status") != "miss" or state.get("degraded"):
+            return
+        if (state.get("chat_history") or "").strip():
+            return
+        if state.get("response"):
+            self.answer_cache.store(cache_state["scope"], cache_state["embedding"], state["question"],
+                                    state["response"], state.get("sources"))
+
+    @staticmethod
+    def _answer_cache_metadata(state: AssistantState) -> Optional[Dict[str, Any]]:
+        """Phần trả về client của state["answer_cache"] (bỏ embedding và scope)."""
+        cache_state = state.get("answer_cache")
+        if not cache_state:
+            return None
+        return {key: value for key, value in cache_state.items() if key not in ("scope", "embedding")}
 
     async def _execute_tool_node(self, state: AssistantState) -> Dict[str, Any]:
         tool_name = state.get("selected_tool_name")
         if not tool_name:
             return {"tool_outputs": {"error": "Không có công cụ nào được chọn."}}
-        tool_kwargs = {k: v for k, v in state.items() if v is not None}
+        tool_kwargs = {k: v for k, v in state.items()
+                       if v is not None and k not in ("stage_timings", "token_usage", "answer_cache")}
         try:
             result = await self.tool_registry.execute_tool(tool_name, **tool_kwargs)
             return {"tool_outputs": {tool_name: result}}
         except Exception as e:
-            return {"tool_outputs": {tool_name: f"Lỗi khi thực thi công cụ '{tool_name}': {str(e)}"}}
+            return {"tool_outputs": {tool_name: f"Lỗi khi thực thi công cụ '{tool_name}': {str(e)}"}, "degraded": True}
 
-    async def _generate_response_node(self, state: AssistantState) -> Dict[str, Any]:
+    def _build_response_messages(self, state: AssistantState) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """Prompt sinh câu trả lời cuối (dùng chung cho answer và answer_stream) và số token từng phần.
+
+        Ngữ cảnh và lịch sử đã được cắt theo ngân sách khi truy xuất / khi nạp lịch sử; ở đây chỉ cắt
+        kết quả tool và đếm phần còn lại.
+        """
+        usage: Dict[str, Any] = {}
         question = state["question"]
         context = state.get("context")
         chat_history = state.get("chat_history", "")
@@ -344,7 +521,7 @@ class LearningAssistant:
         route_decision = state.get("route_decision", "DIRECT")
         selected_tool_name = state.get("selected_tool_name")
 
-        emotion_data = await self._analyze_emotion(question)
+        emotion_data = state.get("emotion") or NEUTRAL_EMOTION
         emotion = emotion_data.get("emotion", "neutral")
         emotion_intensity = emotion_data.get("intensity", 5)
         suggested_tone = emotion_data.get("suggested_tone", "balanced")
@@ -362,10 +539,11 @@ class LearningAssistant:
             human_parts.append(context or "Không có ngữ cảnh.")
             human_parts.append("--- Kết thúc ngữ cảnh ---")
         elif route_decision == "TOOL" and tool_outputs and selected_tool_name:
-            tool_result = tool_outputs.get(selected_tool_name, "Công cụ bị lỗi.")
+            tool_result, usage["tool_output"] = self.context_assembler.fit_tool_output(
+                str(tool_outputs.get(selected_tool_name, "Công cụ bị lỗi.")))
             system_message += f"\nSử dụng kết quả từ công cụ '{selected_tool_name}'."
             human_parts.append(f"--- Kết quả từ '{selected_tool_name}' ---")
-            human_parts.append(str(tool_result))
+            human_parts.append(tool_result)
             human_parts.append("--- Kết thúc kết quả ---")
             if context:
                 human_parts.append("\n--- Ngữ cảnh bổ sung ---")
@@ -380,28 +558,27 @@ class LearningAssistant:
             human_parts.append("--- Kết thúc lịch sử ---")
 
         human_message = "\n\n".join(human_parts) + "\n\nCâu trả lời của EduMentor:"
+        counter = self.context_assembler.counter
+        usage["system"] = self.context_assembler.measure("system", system_message)
+        usage["question"] = {"tokens": counter.count(question)}
+        usage["prompt_total"] = {"tokens": usage["system"]["tokens"] + counter.count(human_message),
+                                 "exact": counter.exact}
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": human_message}
+        ], usage
 
+    async def _generate_response_node(self, state: AssistantState) -> Dict[str, Any]:
         try:
-            response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    lambda: self.groq_client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
-                            {"role": "system", "content": system_message},
-                            {"role": "user", "content": human_message}
-                        ],
-                        temperature=self.temperature,
-                        max_tokens=2048
-                    )
-                ),
+            messages, usage = self._build_response_messages(state)
+            response_text = await asyncio.wait_for(
+                self.llm_client.chat(messages, max_tokens=2048),
                 timeout=30.0
             )
-            
-            response_text = response.choices[0].message.content.strip()
-            return {"response": response_text}
+            return {"response": response_text, "token_usage": usage}
         except Exception as e:
             logger.exception(f"Error generating response: {e}")
-            return {"response": f"Lỗi khi tạo phản hồi: {str(e)}"}
+            return {"response": f"Lỗi khi tạo phản hồi: {str(e)}", "degraded": True}
 
     async def _format_sources_node(self, state: AssistantState) -> Dict[str, Any]:
         response = state.get("response", "")
@@ -528,14 +705,18 @@ class LearningAssistant:
             }
             
             # Update conversation with new messages
-            conversations_collection.update_one(
+            updated_conversation = conversations_collection.find_one_and_update(
                 {"_id": active_conversation["_id"]},
                 {
                     "$push": {"messages": {"$each": [user_message, assistant_message]}},
                     "$inc": {"message_count": 2},
                     "$set": {"updated_at": now_utc}
-                }
+                },
+                projection={"message_count": 1, "summary_upto": 1},
+                return_document=ReturnDocument.AFTER
             )
+            if updated_conversation:
+                self._schedule_summary_update(updated_conversation)
             
             # Build update data for user
             update_data = {
@@ -560,53 +741,131 @@ class LearningAssistant:
         except Exception as e:
             logger.error(f"Failed to save chat history for user {username}: {e}")
 
-    async def _load_chat_history(self, username: str, limit: int = 10) -> str:
-        """Loads recent chat history from MongoDB conversations collection for the user."""
+    def _find_recent_conversation(self, username: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        conversations_collection = self.mongo_collection.database["conversations"]
+        # Find the most recent active conversation
+        conversation = conversations_collection.find_one(
+            {"username": username, "is_active": True},
+            projection,
+            sort=[("updated_at", -1)]
+        )
+        if not conversation:
+            # Try to find any recent conversation (even if archived)
+            conversation = conversations_collection.find_one(
+                {"username": username},
+                projection,
+                sort=[("updated_at", -1)]
+            )
+        return conversation
+
+    async def _load_chat_history(self, username: str, limit: int = 10) -> Tuple[str, List[Dict[str, str]]]:
+        """Loads the conversation summary and the recent chat messages ({"role", "content"}) for the user.
+
+        Khi có tóm tắt hội thoại (CONVERSATION_SUMMARY_ENABLED), chỉ các tin nhắn chưa được tóm tắt
+        được trả về (tối đa CONVERSATION_RECENT_TURNS + CONVERSATION_SUMMARY_BATCH_TURNS lượt), nên
+        kích thước prompt không tăng theo độ dài hội thoại. Nếu tắt, trả về ``limit`` lượt gần nhất.
+        """
         if self.mongo_collection is None or not username:
-            return ""
+            return "", []
 
         try:
-            db = self.mongo_collection.database
-            conversations_collection = db["conversations"]
-            
-            # Find the most recent active conversation
-            conversation = conversations_collection.find_one(
-                {"username": username, "is_active": True},
-                sort=[("updated_at", -1)]
+            if config.CONVERSATION_SUMMARY_ENABLED:
+                limit = config.CONVERSATION_RECENT_TURNS + config.CONVERSATION_SUMMARY_BATCH_TURNS
+            # Chỉ lấy phần đuôi của mảng messages từ MongoDB thay vì cả hội thoại
+            conversation = self._find_recent_conversation(
+                username,
+                {"messages": {"$slice": -limit*2},  # *2 because each turn has 2 messages (user + assistant)
+                 "message_count": 1, "summary": 1, "summary_upto": 1}
             )
-            
-            if not conversation:
-                # Try to find any recent conversation (even if archived)
-                conversation = conversations_collection.find_one(
-                    {"username": username},
-                    sort=[("updated_at", -1)]
-                )
-            
-            if conversation and "messages" in conversation:
-                messages = conversation["messages"]
-                # Get last 'limit' messages
-                recent_messages = messages[-limit*2:]  # *2 because each turn has 2 messages (user + assistant)
-                
-                history_str = "\n".join([
-                    f"{msg['role'].capitalize()}: {msg['content']}"
-                    for msg in recent_messages
-                ])
-                return history_str
-            
-            return ""
+            if not conversation or not conversation.get("messages"):
+                return "", []
+
+            recent_messages = conversation["messages"]
+            summary = ""
+            if config.CONVERSATION_SUMMARY_ENABLED:
+                summary = conversation.get("summary") or ""
+                summary_upto = conversation.get("summary_upto", 0)
+                # Vị trí (trong toàn hội thoại) của tin nhắn đầu tiên trong phần đuôi vừa lấy
+                first_position = conversation.get("message_count", len(recent_messages)) - len(recent_messages)
+                recent_messages = recent_messages[max(0, summary_upto - first_position):]
+            return summary, [{"role": msg["role"], "content": msg["content"]} for msg in recent_messages]
         except Exception as e:
             logger.error(f"Failed to load chat history for user {username}: {e}")
-            return ""
+            return "", []
 
-    # Modify answer method to accept username
-    async def answer(self, question: str, username: Optional[str] = None) -> Dict[str, Any]:
-        if not question or not isinstance(question, str) or not question.strip():
-            return {"response": "Vui lòng cung cấp câu hỏi hợp lệ.", "sources": [], "tool_outputs": {}, "metadata": {"error": "invalid_input"}}
+    def _schedule_summary_update(self, conversation: Dict[str, Any]):
+        """Chạy cập nhật tóm tắt ở nền khi số tin nhắn chưa tóm tắt vượt cửa sổ giữ nguyên văn + một batch."""
+        if not config.CONVERSATION_SUMMARY_ENABLED:
+            return
+        pending = conversation.get("message_count", 0) - conversation.get("summary_upto", 0)
+        if pending < (config.CONVERSATION_RECENT_TURNS + config.CONVERSATION_SUMMARY_BATCH_TURNS) * 2:
+            return
+        conversation_id = conversation["_id"]
+        # Mỗi hội thoại chỉ có một lượt tóm tắt chạy tại một thời điểm
+        if conversation_id in self._summarizing:
+            return
+        self._summarizing.add(conversation_id)
+        task = asyncio.create_task(self._update_conversation_summary(conversation_id))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        task.add_done_callback(lambda _: self._summarizing.discard(conversation_id))
+
+    async def _update_conversation_summary(self, conversation_id: ObjectId):
+        """Gộp các tin nhắn cũ hơn cửa sổ CONVERSATION_RECENT_TURNS vào tóm tắt lưu trên hội thoại."""
+        with tracer.span("conversation.summary_update"):
+            try:
+                conversations_collection = self.mongo_collection.database["conversations"]
+                conversation = conversations_collection.find_one(
+                    {"_id": conversation_id}, {"message_count": 1, "summary": 1, "summary_upto": 1}
+                )
+                if not conversation:
+                    return
+                summary_upto = conversation.get("summary_upto", 0)
+                target = conversation.get("message_count", 0) - config.CONVERSATION_RECENT_TURNS * 2
+                if target <= summary_upto:
+                    return
+                page = conversations_collection.find_one(
+                    {"_id": conversation_id}, {"messages": {"$slice": [summary_upto, target - summary_upto]}}
+                )
+                new_messages = (page or {}).get("messages", [])
+                if not new_messages:
+                    return
+
+                transcript = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in new_messages)
+                previous = conversation.get("summary") or "(chưa có)"
+                system_prompt = (
+                    "Bạn duy trì bản tóm tắt ngắn gọn của một cuộc hội thoại giữa người học và trợ lý học tập EduMentor. "
+                    "Cập nhật bản tóm tắt hiện có bằng các tin nhắn mới: giữ lại chủ đề, mục tiêu học tập, tài liệu/khái niệm "
+                    "đã nhắc tới, câu hỏi còn bỏ ngỏ và thông tin cá nhân người học đã chia sẻ; bỏ chi tiết không cần thiết. "
+                    f"Viết bằng tiếng Việt, tối đa khoảng {config.CONVERSATION_SUMMARY_MAX_TOKENS} token. Chỉ trả về bản tóm tắt."
+                )
+                user_prompt = f"Tóm tắt hiện có:\n{previous}\n\nTin nhắn mới:\n{transcript}"
+                summary = await self.llm_client.chat(
+                    [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+                    max_tokens=config.CONVERSATION_SUMMARY_MAX_TOKENS, temperature=0.2
+                )
+                if not summary:
+                    return
+                # Chỉ ghi nếu chưa có lượt tóm tắt nào khác cập nhật trong lúc chờ LLM
+                result = conversations_collection.update_one(
+                    {"_id": conversation_id, "summary_upto": conversation.get("summary_upto")},
+                    {"$set": {"summary": summary, "summary_upto": target,
+                              "summary_updated_at": datetime.now(timezone.utc)}}
+                )
+                if result.modified_count:
+                    logger.info(f"Updated summary of conversation {conversation_id} up to message {target}")
+            except Exception as e:
+                logger.error(f"Failed to update summary of conversation {conversation_id}: {e}")
 
+    async def _initial_state(self, question: str, username: Optional[str]) -> AssistantState:
         # Load chat history from MongoDB if username is provided
-        chat_history_str = await self._load_chat_history(username) if username else ""
-        emotion_data = await self._analyze_emotion(question)
-        initial_state = AssistantState(
+        started = time.perf_counter()
+        with tracer.span("mongo.load_history"):
+            summary, history_messages = await self._load_chat_history(username) if username else ("", [])
+        # Tóm tắt + các lượt chưa tóm tắt; lượt cũ bị rút gọn/bỏ để lịch sử nằm trong PROMPT_BUDGET_HISTORY
+        chat_history_str, history_usage = self.context_assembler.assemble_history(history_messages, summary=summary)
+        load_history_ms = round((time.perf_counter() - started) * 1000, 1)
+        return AssistantState(
             question=question,
             chat_history=chat_history_str, # Use loaded history
             context=None,
@@ -616,38 +875,200 @@ class LearningAssistant:
             route_decision=None,
             selected_tool_name=None,
             needs_context_for_tool=None,
-            emotion=emotion_data
+            route_source=None,
+            emotion=None,
+            answer_cache=None,
+            degraded=None,
+            stage_timings={"load_history": load_history_ms},
+            token_usage={"history": history_usage}
         )
 
-        try:
-            final_state = await self.workflow.ainvoke(initial_state, config={"recursion_limit": 15})
-
-            # Save chat history to MongoDB if username is provided and response exists
-            final_response = final_state.get("response")
-            if username and final_response:
-                await self._save_chat_history(
-                    username, 
-                    question, 
-                    final_response,
-                    route_decision=final_state.get("route_decision"),
-                    selected_tool=final_state.get("selected_tool_name"),
-                    sources=final_state.get("sources")
-                )
+    async def _run_workflow(self, state: AssistantState) -> Tuple[Dict[str, Any], bool]:
+        """Chạy graph; trả về (final_state, shared).
 
-            return {
-                "response": final_response or "Lỗi không xác định",
-                "sources": final_state.get("sources", []),
-                "tool_outputs": final_state.get("tool_outputs", {}),
-                "metadata": {
-                    "route_decision": final_state.get("route_decision"),
-                    "selected_tool": final_state.get("selected_tool_name"),
-                    "emotion": final_state.get("emotion") 
+        Chỉ câu hỏi không kèm lịch sử hội thoại (và tóm tắt) nào mới được gộp theo (câu hỏi đã chuẩn hóa,
+        phiên bản index), để câu trả lời dùng chung không chứa lịch sử hay thông tin riêng của người khác:
+        các request trùng đến trong lúc một request đang chạy sẽ chờ và dùng chung kết quả của nó
+        (shared=True). Nếu request dẫn đầu được định tuyến tới tool không gộp được (vd. Progress_Tracker,
+        kết quả theo từng người dùng), người đến sau tự chạy lại graph. Việc lưu lịch sử vẫn do từng
+        người gọi tự làm.
+        """
+        run = lambda: self.workflow.ainvoke(state, config={"recursion_limit": 15})
+        if self.single_flight is None or state.get("chat_history"):
+            return await run(), False
+        key = ("ask", normalize_text(state["question"]), await self.collection_version())
+        final_state, shared = await self.single_flight.run(key, run)
+        if shared and not self._shareable_result(final_state):
+            logger.info(f"Re-running '{state['question'][:50]}': routed tool {final_state.get('selected_tool_name')} is not coalescible")
+            return await run(), False
+        return final_state, shared
+
+    def _shareable_result(self, final_state: Dict[str, Any]) -> bool:
+        tool_name = final_state.get("selected_tool_name")
+        if final_state.get("route_decision") != "TOOL" or not tool_name:
+            return True
+        tool = self.tool_registry.get_tool(tool_name)
+        return tool is None or tool.coalescible
+
+    # Modify answer method to accept username
+    async def answer(self, question: str, username: Optional[str] = None) -> Dict[str, Any]:
+        if not question or not isinstance(question, str) or not question.strip():
+            return {"response": "Vui lòng cung cấp câu hỏi hợp lệ.", "sources": [], "tool_outputs": {}, "metadata": {"error": "invalid_input"}}
+
+        with tracer.span("ask") as span:
+            initial_state = await self._initial_state(question, username)
+
+            try:
+                final_state, coalesced = await self._run_workflow(initial_state)
+                stage_timings = final_state.get("stage_timings", {})
+                span.set("route_decision", final_state.get("route_decision"))
+                span.set("coalesced", coalesced)
+                if coalesced:
+                    logger.info(f"Answer shared with a concurrent identical question: '{question[:50]}'")
+                else:
+                    logger.info(f"Stage timings (ms): {stage_timings}")
+                    self._store_in_answer_cache(final_state)
+
+                # Save chat history to MongoDB if username is provided and response exists
+                final_response = final_state.get("response")
+                if username and final_response:
+                    with tracer.span("mongo.save_history"):
+                        await self._save_chat_history(
+                            username, 
+                            question, 
+                            final_response,
+                            route_decision=final_state.get("route_decision"),
+                            selected_tool=final_state.get("selected_tool_name"),
+                            sources=final_state.get("sources")
+                        )
+
+                return {
+                    "response": final_response or "Lỗi không xác định",
+                    "sources": final_state.get("sources", []),
+                    "tool_outputs": final_state.get("tool_outputs", {}),
+                    "metadata": {
+                        "route_decision": final_state.get("route_decision"),
+                        "selected_tool": final_state.get("selected_tool_name"),
+                        "route_source": final_state.get("route_source"),
+                        "emotion": final_state.get("emotion"),
+                        "answer_cache": self._answer_cache_metadata(final_state),
+                        "token_usage": final_state.get("token_usage", {}),
+                        "coalesced": coalesced,
+                        "stage_timings": stage_timings
+                    }
                 }
-            }
-        except Exception as e:
-            logger.exception(f"Error in workflow: {e}")
-            return {"response": f"Lỗi hệ thống: {str(e)}", "sources": [], "tool_outputs": {}, "metadata": {"error": "workflow_exception"}}
+            except Exception as e:
+                logger.exception(f"Error in workflow: {e}")
+                return {"response": f"Lỗi hệ thống: {str(e)}", "sources": [], "tool_outputs": {}, "metadata": {"error": "workflow_exception"}}
+
+    async def answer_stream(self, question: str, username: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Phiên bản streaming của answer, sinh lần lượt các sự kiện {"event": ..., "data": ...}:
+
+        - ``route``: kết quả định tuyến (route_decision, selected_tool) ngay sau fan_out.
+        - ``sources``: tài liệu truy xuất được, ngay khi truy xuất xong (chỉ với RAG/tool cần ngữ cảnh).
+        - ``token``: từng đoạn câu trả lời ({"delta": ...}) từ completion streaming của Groq.
+        - ``footer``: phần "Nguồn tham khảo" được nối vào cuối câu trả lời.
+        - ``done``: metadata cuối (route, emotion, answer_cache, token_usage, stage_timings), hoặc ``error`` nếu có lỗi.
+
+        Khi trúng cache câu trả lời, toàn bộ câu trả lời (đã gồm phần nguồn) được gửi trong một sự kiện ``token``.
+
+        Chạy cùng các node với graph của answer, theo đúng thứ tự định tuyến của graph.
+        """
+        if not question or not isinstance(question, str) or not question.strip():
+            yield {"event": "error", "data": {"message": "Vui lòng cung cấp câu hỏi hợp lệ."}}
+            return
+
+        with tracer.span("ask_stream") as span:
+            state = await self._initial_state(question, username)
+            timings = state["stage_timings"]
+
+            async def run(stage: str, node):
+                started = time.perf_counter()
+                with tracer.span(f"graph.{stage}"):
+                    update = dict(await node(state) or {})
+                timings.update(update.pop("stage_timings", {}))
+                state["token_usage"] = {**state["token_usage"], **update.pop("token_usage", {})}
+                timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+                state.update(update)
+
+            try:
+                await run("fan_out", self._fan_out_node)
+                route = self._route_after_cache(state)
+                span.set("route_decision", state.get("route_decision"))
+                yield {"event": "route", "data": {"route_decision": state.get("route_decision"),
+                                                  "selected_tool": state.get("selected_tool_name")}}
+
+                if route == "cache_hit":
+                    # Câu trả lời đã có sẵn (kèm phần nguồn): gửi một lần thay vì stream từng token
+                    yield {"event": "sources", "data": state.get("sources") or []}
+                    yield {"event": "token", "data": {"delta": state["response"]}}
+                else:
+                    if route in ("retrieve_for_rag", "retrieve_for_tool"):
+                        await run("retrieve_context", self._retrieve_context_node)
+                    if route not in ("generate_direct", "execute_tool_direct"):
+                        yield {"event": "sources", "data": state.get("sources") or []}
+                    if state.get("route_decision") == "TOOL" and state.get("selected_tool_name"):
+                        await run("execute_tool", self._execute_tool_node)
+
+                    started = time.perf_counter()
+                    parts: List[str] = []
+                    # current=False: code của bên tiêu thụ stream chạy xen giữa các lần yield
+                    with tracer.span("graph.generate_response", current=False) as generate_span:
+                        try:
+                            messages, usage = self._build_response_messages(state)
+                            state["token_usage"] = {**state["token_usage"], **usage}
+                            async for delta in self.llm_client.chat_stream(messages, max_tokens=2048):
+                                if not parts:
+                                    timings["first_token"] = round((time.perf_counter() - started) * 1000, 1)
+                                    generate_span.set("first_token_ms", timings["first_token"])
+                                parts.append(delta)
+                                yield {"event": "token", "data": {"delta": delta}}
+                        except Exception as e:
+                            logger.exception(f"Error streaming response: {e}")
+                            error_text = f"Lỗi khi tạo phản hồi: {str(e)}"
+                            state["degraded"] = True
+                            generate_span.set("degraded", True)
+                            parts.append(error_text)
+                            yield {"event": "token", "data": {"delta": error_text}}
+                    timings["generate_response"] = round((time.perf_counter() - started) * 1000, 1)
+                    state["response"] = "".join(parts).strip()
+
+                    answer_text = state["response"]
+                    await run("format_sources", self._format_sources_node)
+                    footer = state["response"][len(answer_text):]
+                    if footer:
+                        yield {"event": "footer", "data": {"text": footer}}
+
+                self._store_in_answer_cache(state)
+                logger.info(f"Stage timings (ms): {timings}")
+                if username and state["response"]:
+                    with tracer.span("mongo.save_history"):
+                        await self._save_chat_history(
+                            username,
+                            question,
+                            state["response"],
+                            route_decision=state.get("route_decision"),
+                            selected_tool=state.get("selected_tool_name"),
+                            sources=state.get("sources")
+                        )
+                yield {"event": "done", "data": {
+                    "route_decision": state.get("route_decision"),
+                    "selected_tool": state.get("selected_tool_name"),
+                    "route_source": state.get("route_source"),
+                    "emotion": state.get("emotion"),
+                    "answer_cache": self._answer_cache_metadata(state),
+                    "token_usage": state["token_usage"],
+                    "stage_timings": timings
+                }}
+            except Exception as e:
+                logger.exception(f"Error in streaming workflow: {e}")
+                yield {"event": "error", "data": {"message": f"Lỗi hệ thống: {str(e)}"}}
 
     def close(self):
         if hasattr(self.retriever, 'close'):
             self.retriever.close()
+
+    async def aclose(self):
+        """Đóng pool kết nối của LLM client rồi giải phóng các tài nguyên còn lại."""
+        await self.llm_client.aclose()
+        self.close()
@@ -0,0 +1,141 @@
+import time
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, AsyncIterator
+import httpx
+from groq import AsyncGroq
+from config import settings as config
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx cần gói h2 cho HTTP/2, cài bằng httpx[http2])
+        return True
+    except ImportError:
+        return False
+
+
+class LLMClient:
+    """Client Groq bất đồng bộ dùng chung cho mọi node của graph và các tool.
+
+    Các lời gọi chạy trực tiếp trên event loop (AsyncGroq + một httpx.AsyncClient giữ kết nối
+    keep-alive, HTTP/2 nếu có h2) thay vì chiếm một thread của executor mặc định. Số lời gọi
+    đồng thời bị giới hạn bởi max_concurrency; lời gọi vượt quá phải xếp hàng và được đếm
+    trong gauge ``queued``.
+    """
+
+    def __init__(self, api_key: Optional[str], model: str, temperature: float,
+                 max_concurrency: int = config.LLM_MAX_CONCURRENCY,
+                 max_connections: int = config.LLM_MAX_CONNECTIONS,
+                 http2: bool = config.LLM_HTTP2,
+                 timeout: float = config.LLM_REQUEST_TIMEOUT):
+        self.model = model
+        self.temperature = temperature
+        self.max_concurrency = max_concurrency
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested for the LLM client but 'h2' is not installed, using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._http = httpx.AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self.client = AsyncGroq(api_key=api_key, http_client=self._http)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.stats = {"calls": 0, "failed": 0, "queue_wait_seconds": 0.0, "call_seconds": 0.0, "max_queue_wait_seconds": 0.0}
+
+    async def _acquire(self, span=None) -> float:
+        """Chờ tới lượt (giới hạn max_concurrency), trả về thời điểm bắt đầu gọi."""
+        queued_at = time.perf_counter()
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        started = time.perf_counter()
+        waited = started - queued_at
+        self.stats["queue_wait_seconds"] += waited
+        self.stats["max_queue_wait_seconds"] = max(self.stats["max_queue_wait_seconds"], waited)
+        if span is not None:
+            span.set("queue_wait_ms", round(waited * 1000, 1))
+        self.in_flight += 1
+        return started
+
+    def _release(self, started: float):
+        self.in_flight -= 1
+        self.stats["calls"] += 1
+        self.stats["call_seconds"] += time.perf_counter() - started
+        self._semaphore.release()
+
+    def _request_kwargs(self, messages, max_tokens: Optional[int], temperature: Optional[float]) -> Dict[str, Any]:
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature if temperature is None else temperature,
+        }
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        return kwargs
+
+    async def chat(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None,
+                   temperature: Optional[float] = None) -> str:
+        """Gọi chat completion, trả về nội dung (chuỗi rỗng nếu model không trả về gì)."""
+        with tracer.span("llm.chat", model=self.model, max_tokens=max_tokens) as span:
+            started = await self._acquire(span)
+            try:
+                response = await self.client.chat.completions.create(**self._request_kwargs(messages, max_tokens, temperature))
+                return (response.choices[0].message.content or "").strip()
+            except Exception:
+                self.stats["failed"] += 1
+                raise
+            finally:
+                self._release(started)
+
+    async def chat_stream(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None,
+                          temperature: Optional[float] = None) -> AsyncIterator[str]:
+        """Gọi chat completion dạng stream, sinh lần lượt các đoạn nội dung mới (delta)."""
+        # current=False: bên tiêu thụ chạy xen giữa các lần yield, span của nó không phải con của span này
+        with tracer.span("llm.chat_stream", current=False, model=self.model, max_tokens=max_tokens) as span:
+            started = await self._acquire(span)
+            try:
+                stream = await self.client.chat.completions.create(
+                    stream=True, **self._request_kwargs(messages, max_tokens, temperature)
+                )
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+            except Exception:
+                self.stats["failed"] += 1
+                raise
+            finally:
+                self._release(started)
+
+    async def ainvoke(self, prompt: Any) -> str:
+        """Giao diện cũ mà các tool dùng: một prompt (chuỗi hoặc object có .content) -> nội dung trả lời."""
+        content = prompt.content if hasattr(prompt, "content") else str(prompt)
+        return await self.chat([{"role": "user", "content": content}])
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        calls = stats["calls"]
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "http2": self.http2,
+            "calls": calls,
+            "failed": stats["failed"],
+            "avg_call_ms": round(stats["call_seconds"] * 1000 / calls, 1) if calls else 0.0,
+            "avg_queue_wait_ms": round(stats["queue_wait_seconds"] * 1000 / calls, 1) if calls else 0.0,
+            "max_queue_wait_ms": round(stats["max_queue_wait_seconds"] * 1000, 1),
+        }
+
+    async def aclose(self):
+        await self._http.aclose()
@@ -0,0 +1,232 @@
+"""Index hàng loạt một thư mục tài liệu.
+
+Cách dùng:
+    python -m indexing.bulk_ingest <thư_mục> [--workers 4] [--batch-size 512] [--manifest data/bulk_ingest_manifest.json]
+
+- Trích xuất + chunking chạy song song trên process pool (mỗi worker xử lý một file).
+- Tiến trình chính gom chunk của nhiều file thành batch lớn để embed và ghi vào Chroma.
+- Manifest (theo collection, embedding model và hash nội dung file) ghi lại các file đã xong để
+  lần chạy sau bỏ qua khi bị ngắt giữa chừng; đổi collection/model (rebuild index) thì file được
+  index lại vào collection mới. ID chunk là xác định nên ghi lại (upsert) không tạo bản trùng.
+- Chunk được đánh dấu ``origin="bulk_ingest"``: tài liệu chung không có bản ghi user_files nên
+  không bị thống kê index tính là mồ côi.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, List, Optional
+from config import settings
+from indexing.document_indexer import DocumentIndexer
+from indexing.chroma_writer import ChromaBatchWriter
+from indexing.ocr_cache import OCRPageCache
+from indexing.index_versions import IndexRegistry, create_chroma_client, resolve_active_index
+
+DEFAULT_MANIFEST_PATH = os.path.join(os.getcwd(), "data", "bulk_ingest_manifest.json")
+
+# Giá trị field "origin" của chunk do bulk ingest ghi (xem indexing.index_stats)
+BULK_INGEST_ORIGIN = "bulk_ingest"
+
+# Indexer chỉ-trích-xuất, tạo một lần cho mỗi worker process
+_worker_indexer: Optional[DocumentIndexer] = None
+
+
+def _extract_file(file_path: str, content_hash: str, chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+    """Chạy trong worker: trích xuất và chunk một file (hash nội dung đã tính sẵn), trả về chunk kèm ID xác định."""
+    global _worker_indexer
+    if _worker_indexer is None:
+        _worker_indexer = DocumentIndexer(chunk_size=chunk_size, chunk_overlap=chunk_overlap, extract_only=True)
+
+    file_ext = os.path.splitext(file_path)[1].lower()
+    filename = os.path.basename(file_path)
+    base_metadata = {"title": "Unknown", "original_filename": filename, "filename": filename,
+                     "origin": BULK_INGEST_ORIGIN}
+
+    pages = 0
+    chunks = []
+    section_context: Dict[str, Any] = {}
+    for content, page_metadata in _worker_indexer._iter_pages(file_path, file_ext, base_metadata):
+        pages += 1
+        chunks.extend(_worker_indexer._chunk_documents(content, file_path, page_metadata, section_context))
+    for i, chunk in enumerate(chunks):
+        chunk["id"] = f"{content_hash[:32]}-{i}"
+
+    return {"path": file_path, "content_hash": content_hash, "pages": pages, "chunks": chunks}
+
+
+class IngestManifest:
+    """Lưu trạng thái các file đã index xong, key theo (collection, embedding model, hash nội dung file)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(collection_name: str, model_name: str, content_hash: str) -> str:
+        return f"{collection_name}|{model_name}|{content_hash}"
+
+    def is_done(self, key: str) -> bool:
+        return self.entries.get(key, {}).get("status") == "done"
+
+    def mark_done(self, key: str, file_path: str, pages: int, chunks: int):
+        self.entries[key] = {"status": "done", "path": file_path, "pages": pages, "chunks": chunks}
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def find_files(directory: str) -> List[str]:
+    """Liệt kê (đệ quy) các file có định dạng mà DocumentIndexer hỗ trợ."""
+    files = []
+    for path in sorted(Path(directory).rglob("*")):
+        if path.is_file() and path.suffix.lower() in DocumentIndexer.SUPPORTED_EXTENSIONS:
+            files.append(str(path))
+    return files
+
+
+def bulk_ingest(directory: str, workers: int = 4, batch_size: int = 512,
+                manifest_path: str = DEFAULT_MANIFEST_PATH,
+                collection_name: Optional[str] = None) -> Dict[str, Any]:
+    # Mặc định ghi vào collection đang active, embed bằng đúng model của collection đó
+    model_name = settings.EMBEDDING_MODEL
+    if collection_name is None:
+        active_index = resolve_active_index(create_chroma_client(), IndexRegistry())
+        collection_name, model_name = active_index["collection"], active_index["model"]
+
+    manifest = IngestManifest(manifest_path)
+    pending_files = []
+    seen_hashes = set()
+    skipped = 0
+    for file_path in find_files(directory):
+        content_hash = OCRPageCache.hash_file(file_path)
+        # Bỏ qua file đã index xong vào collection này ở lần chạy trước và file trùng nội dung trong cùng thư mục
+        if manifest.is_done(IngestManifest.key(collection_name, model_name, content_hash)) or content_hash in seen_hashes:
+            skipped += 1
+        else:
+            seen_hashes.add(content_hash)
+            pending_files.append((file_path, content_hash))
+    print(f"Found {len(pending_files) + skipped} files, {skipped} already indexed into {collection_name}, "
+          f"{len(pending_files)} to process")
+
+    stats = {"files": 0, "failed": 0, "skipped": skipped, "pages": 0, "chunks": 0}
+    if not pending_files:
+        return stats
+
+    def mark_done(content_hash: str, file_path: str, pages: int, chunks: int):
+        manifest.mark_done(IngestManifest.key(collection_name, model_name, content_hash), file_path, pages, chunks)
+
+    indexer = DocumentIndexer(collection_name=collection_name, model_name=model_name,
+                              chunk_size=settings.CHUNK_SIZE, chunk_overlap=settings.CHUNK_OVERLAP)
+    buffer: List[Dict[str, Any]] = []
+    # Prefix ID chunk -> thông tin file; file chỉ được đánh dấu xong khi mọi chunk của nó đã ghi vào Chroma
+    pending: Dict[str, Dict[str, Any]] = {}
+
+    def flush():
+        if not buffer:
+            return
+        ChromaBatchWriter.wait(indexer._add_batch(buffer))
+        stats["chunks"] += len(buffer)
+        for chunk in buffer:
+            pending[chunk["id"].rsplit("-", 1)[0]]["remaining"] -= 1
+        buffer.clear()
+        for key in [k for k, entry in pending.items() if entry["remaining"] == 0]:
+            entry = pending.pop(key)
+            mark_done(entry["content_hash"], entry["path"], entry["pages"], entry["chunks"])
+
+    started = time.perf_counter()
+    files_iter = iter(pending_files)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Giới hạn số file đang xử lý để bộ nhớ không tăng theo số file
+        in_flight = set()
+        for file_path, content_hash in files_iter:
+            in_flight.add(pool.submit(_extract_file, file_path, content_hash, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP))
+            if len(in_flight) >= workers * 2:
+                break
+
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                next_file = next(files_iter, None)
+                if next_file:
+                    in_flight.add(pool.submit(_extract_file, *next_file, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP))
+                try:
+                    result = future.result()
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"Failed to extract file: {e}")
+                    continue
+
+                stats["files"] += 1
+                stats["pages"] += result["pages"]
+                chunks = result["chunks"]
+                print(f"Extracted {os.path.basename(result['path'])}: {result['pages']} pages, {len(chunks)} chunks")
+                if not chunks:
+                    mark_done(result["content_hash"], result["path"], result["pages"], 0)
+                    continue
+
+                pending[result["content_hash"][:32]] = {
+                    "path": result["path"], "content_hash": result["content_hash"],
+                    "pages": result["pages"], "chunks": len(chunks), "remaining": len(chunks),
+                }
+                for chunk in chunks:
+                    buffer.append(chunk)
+                    if len(buffer) >= batch_size:
+                        flush()
+        flush()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    stats["seconds"] = round(elapsed, 2)
+    stats["pages_per_second"] = round(stats["pages"] / elapsed, 2)
+    stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 2)
+    stats["chroma_writes"] = indexer.writer.throughput()
+    if indexer.embedder.cache is not None:
+        stats["embedding_cache"] = indexer.embedder.cache.snapshot()
+    indexer.close()
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bulk index a directory of course documents into ChromaDB")
+    parser.add_argument("directory", type=str, help="Directory to scan (recursively) for documents")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                        help="Number of extraction worker processes")
+    parser.add_argument("--batch-size", type=int, default=512,
+                        help="Number of chunks per embedding + Chroma write batch")
+    parser.add_argument("--manifest", type=str, default=DEFAULT_MANIFEST_PATH,
+                        help="Manifest file used to resume interrupted runs")
+    parser.add_argument("--collection", type=str, default=None,
+                        help="Chroma collection name (default: the active index version)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}")
+        sys.exit(1)
+
+    stats = bulk_ingest(args.directory, workers=args.workers, batch_size=args.batch_size,
+                        manifest_path=args.manifest, collection_name=args.collection)
+    print(f"\nIndexed {stats['files']} files ({stats['failed']} failed, {stats['skipped']} skipped)")
+    if "seconds" in stats:
+        print(f"{stats['pages']} pages, {stats['chunks']} chunks in {stats['seconds']}s "
+              f"-> {stats['pages_per_second']} pages/s, {stats['chunks_per_second']} chunks/s")
+        writes = stats["chroma_writes"]
+        print(f"Chroma writes: {writes['records']} records in {writes['batches']} batches "
+              f"({writes['records_per_second']} records/s, {writes['retries']} retries)")
+        if "embedding_cache" in stats:
+            cache = stats["embedding_cache"]
+            print(f"Embedding cache: {cache['hits']} hits, {cache['misses']} misses "
+                  f"(hit rate {cache['hit_rate']:.1%}), {cache['entries']} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import time
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from config import settings
+
+
+class ChromaBatchWriter:
+    """Ghi vào Chroma theo batch, nhiều batch chạy song song, tự retry batch lỗi.
+
+    Mỗi lời gọi ``submit`` được chia thành các batch giới hạn cả số bản ghi lẫn kích thước
+    payload ước tính, để tài liệu lớn không thành một request HTTP khổng lồ. Các batch được
+    gửi trên thread pool (dùng chung kết nối keep-alive của client) với số batch đang chạy bị
+    chặn bởi max_in_flight. Mọi lần ghi đều là ``upsert`` với ID cố định nên retry sau timeout
+    (khi server có thể đã ghi một phần) không tạo bản trùng.
+    """
+
+    def __init__(self, collection, batch_size: int = settings.CHROMA_WRITE_BATCH_SIZE,
+                 max_in_flight: int = settings.CHROMA_WRITE_CONCURRENCY,
+                 max_payload_bytes: int = settings.CHROMA_WRITE_MAX_PAYLOAD_BYTES,
+                 max_retries: int = settings.CHROMA_WRITE_RETRIES, max_batch_size: Optional[int] = None):
+        self.collection = collection
+        # Không vượt quá giới hạn batch của server Chroma (nếu client cho biết)
+        self.batch_size = min(batch_size, max_batch_size) if max_batch_size else batch_size
+        self.max_payload_bytes = max_payload_bytes
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="chroma-writer")
+        self._stats_lock = threading.Lock()
+        self.stats = {"records": 0, "batches": 0, "retries": 0, "failed_batches": 0, "payload_bytes": 0, "write_seconds": 0.0}
+        # Thời gian thực có ít nhất một batch đang ghi (để tính throughput khi các batch chạy song song)
+        self._active = 0
+        self._active_since = 0.0
+        self._active_seconds = 0.0
+
+    @staticmethod
+    def _estimate_bytes(document: str, embedding: List[float], metadata: Dict[str, Any]) -> int:
+        # Ước lượng kích thước JSON: ~10 byte mỗi số float của embedding
+        return len(document.encode("utf-8")) + len(embedding) * 10 + len(json.dumps(metadata, ensure_ascii=False)) + 64
+
+    def _split(self, ids, documents, embeddings, metadatas) -> List[tuple]:
+        batches = []
+        start, payload = 0, 0
+        for i in range(len(ids)):
+            size = self._estimate_bytes(documents[i], embeddings[i], metadatas[i])
+            if i > start and (i - start >= self.batch_size or payload + size > self.max_payload_bytes):
+                batches.append((start, i, payload))
+                start, payload = i, 0
+            payload += size
+        if start < len(ids):
+            batches.append((start, len(ids), payload))
+        return [(ids[a:b], documents[a:b], embeddings[a:b], metadatas[a:b], payload) for a, b, payload in batches]
+
+    def submit(self, ids: List[str], documents: List[str], embeddings: List[List[float]],
+               metadatas: List[Dict[str, Any]]) -> List[Future]:
+        """Đưa các bản ghi vào hàng đợi ghi; chặn khi đã có max_in_flight batch đang chạy."""
+        futures = []
+        for batch in self._split(ids, documents, embeddings, metadatas):
+            self._slots.acquire()
+            try:
+                future = self._executor.submit(self._write, *batch)
+            except Exception:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+        return futures
+
+    def _write(self, ids, documents, embeddings, metadatas, payload_bytes) -> int:
+        started = time.perf_counter()
+        with self._stats_lock:
+            if self._active == 0:
+                self._active_since = started
+            self._active += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        with self._stats_lock:
+                            self.stats["failed_batches"] += 1
+                        raise
+                    with self._stats_lock:
+                        self.stats["retries"] += 1
+                    print(f"Chroma write of {len(ids)} records failed ({e}), retrying")
+                    time.sleep(min(0.5 * 2 ** attempt, 8.0))
+            with self._stats_lock:
+                self.stats["records"] += len(ids)
+                self.stats["batches"] += 1
+                self.stats["payload_bytes"] += payload_bytes
+            return len(ids)
+        finally:
+            finished = time.perf_counter()
+            with self._stats_lock:
+                self.stats["write_seconds"] += finished - started
+                self._active -= 1
+                if self._active == 0:
+                    self._active_seconds += finished - self._active_since
+
+    @staticmethod
+    def wait(futures: List[Future]) -> int:
+        """Chờ các batch đã submit ghi xong, trả về số bản ghi; ném lỗi của batch thất bại đầu tiên."""
+        written, error = 0, None
+        for future in futures:
+            try:
+                written += future.result()
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return written
+
+    def throughput(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+            active_seconds = self._active_seconds
+            if self._active:
+                active_seconds += time.perf_counter() - self._active_since
+        stats["records_per_second"] = round(stats["records"] / active_seconds, 2) if active_seconds else 0.0
+        stats["avg_batch_size"] = round(stats["records"] / stats["batches"], 1) if stats["batches"] else 0.0
+        stats["avg_batch_latency_ms"] = round(stats["write_seconds"] * 1000 / stats["batches"], 1) if stats["batches"] else 0.0
+        stats["write_seconds"] = round(stats["write_seconds"], 3)
+        stats["active_seconds"] = round(active_seconds, 3)
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -1,125 +1,401 @@
 import os
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator, Tuple
 import chromadb
 from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from mistralai import Mistral
-from pathlib import Path
 from dotenv import load_dotenv
 import json
 import docx2txt
 import uuid
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future
+from contextlib import contextmanager, nullcontext
 from docx import Document
 from config import settings
+from indexing.ocr_cache import OCRPageCache, get_ocr_client
+from indexing.extractors import extract_pptx_slides
+from indexing.embedding_queue import EmbeddingQueue
+from indexing.embedding_cache import EmbeddingCache
+from indexing.chroma_writer import ChromaBatchWriter
+from indexing.text_chunker import TextChunker
+from indexing.transcripts import is_transcript_file, iter_transcript_segments, iter_transcript_windows, format_timestamp
+from utils.metadata_extractor import MetadataExtractor
+from utils.workload_scheduler import WorkloadScheduler
 
 load_dotenv()
 
 class DocumentIndexer:
-    def __init__(self, collection_name: str = settings.CHROMA_COLLECTION, model_name: str = "all-MiniLM-L6-v2", 
-                 chunk_size: int = 500, chunk_overlap: int = 50):
-        # Khởi tạo ChromaDB Client
-        if settings.CHROMA_SERVER_HOST and settings.CHROMA_SERVER_PORT:
-            print(f"Connecting to ChromaDB Server at {settings.CHROMA_SERVER_HOST}:{settings.CHROMA_SERVER_PORT}")
-            self.client = chromadb.HttpClient(host=settings.CHROMA_SERVER_HOST, port=int(settings.CHROMA_SERVER_PORT))
-        else:
-            print(f"using local ChromaDB at {settings.CHROMA_DB_PATH}")
-            self.client = chromadb.PersistentClient(path=str(settings.CHROMA_DB_PATH))
+    SUPPORTED_EXTENSIONS = {'.pdf', '.docx', '.txt', '.pptx', '.csv'}
+    # Metadata được lưu thêm dưới dạng field phẳng trong Chroma để lọc được bằng `where`
+    FILTERABLE_METADATA_KEYS = ("title", "chapter", "section", "part", "section_title", "start_time", "end_time")
+
+    def __init__(self, collection_name: str = settings.CHROMA_COLLECTION, model_name: str = settings.EMBEDDING_MODEL, 
+                 chunk_size: int = 500, chunk_overlap: int = 50, ocr_client=None, ocr_cache: Optional[OCRPageCache] = None,
+                 batch_size: int = settings.INDEX_BATCH_SIZE, extract_only: bool = False,
+                 chunking_mode: str = settings.CHUNKING_MODE, scheduler: Optional[WorkloadScheduler] = None):
+        """
+        Args:
+            chunking_mode: "fixed" chia theo số ký tự, "structure" chia theo ranh giới chương/mục/tiêu đề
+                trước rồi mới chia theo số ký tự trong từng phần.
+            extract_only: Chỉ dùng phần trích xuất + chunking (vd. trong worker của bulk ingest),
+                không kết nối ChromaDB, không load embedding model và chạy trích xuất ngay trong tiến trình hiện tại.
+            scheduler: Nếu có, việc index chạy như tác vụ bulk (giới hạn đồng thời/CPU, nhường cho truy vấn).
+        """
         self.collection_name = collection_name
-        self.collection = self.client.get_or_create_collection(name=collection_name)
+        self.model_name = model_name
+        self.extract_only = extract_only
+        self.scheduler = scheduler
+        self.client = None
+        self.collection = None
+        self.model = None
+        self.embedder = None
+        self.writer = None
+        # Collection phụ (đang được re-embed bằng model mới) nhận bản ghi song song khi index
+        self._shadow = None
+        # Đồng bộ _add_batch với việc gắn/đổi/tháo collection phụ: batch đọc (embedder, writer, shadow)
+        # cùng lúc dưới lock, còn promote/detach chờ các batch đang chạy xong rồi mới đổi và đóng bộ cũ
+        self._swap_cond = threading.Condition()
+        self._in_flight = 0
+        self._swapping = False
+        if not extract_only:
+            # Khởi tạo ChromaDB Client
+            if settings.CHROMA_SERVER_HOST and settings.CHROMA_SERVER_PORT:
+                print(f"Connecting to ChromaDB Server at {settings.CHROMA_SERVER_HOST}:{settings.CHROMA_SERVER_PORT}")
+                self.client = chromadb.HttpClient(host=settings.CHROMA_SERVER_HOST, port=int(settings.CHROMA_SERVER_PORT))
+            else:
+                print(f"using local ChromaDB at {settings.CHROMA_DB_PATH}")
+                self.client = chromadb.PersistentClient(path=str(settings.CHROMA_DB_PATH))
+            self.collection = self.client.get_or_create_collection(
+                name=collection_name, metadata={"embedding_model": model_name}
+            )
+            self.model = SentenceTransformer(model_name)
+            # Embed qua hàng đợi chung để gom chunk của các tài liệu được index đồng thời
+            cache = EmbeddingCache(model_name) if settings.EMBEDDING_CACHE_ENABLED else None
+            self.embedder = EmbeddingQueue(self.model, cache=cache)
+            self.writer = self._create_writer(self.collection)
         
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.model = SentenceTransformer(model_name)
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len, add_start_index=True
-        )
+        self.batch_size = batch_size
+        self.chunking_mode = chunking_mode
+        # Chunker theo offset, cùng ranh giới chunk với RecursiveCharacterTextSplitter nhưng không copy chuỗi trung gian
+        self.text_chunker = TextChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        # OCR client có thể thay bằng LocalOCRClient để chạy/test offline
+        self.ocr_client = ocr_client or get_ocr_client()
+        self.ocr_cache = ocr_cache or OCRPageCache()
+        # Process pool cho các bước trích xuất nặng CPU (vd. parse slide), tạo khi cần
+        self._extract_pool: Optional[ProcessPoolExecutor] = None
+
+    def _run_in_extract_pool(self, func, *args):
+        """Chạy hàm trích xuất trong worker pool để file lớn không chiếm GIL của tiến trình API."""
+        if self.extract_only:
+            return func(*args)
+        if self._extract_pool is None:
+            self._extract_pool = ProcessPoolExecutor(max_workers=settings.INDEX_EXTRACT_WORKERS)
+        return self._extract_pool.submit(func, *args).result()
+
+    def _iter_pdf_pages(self, file_path: str) -> Iterator[str]:
+        """OCR PDF thành markdown theo trang, dùng cache theo hash nội dung file nếu đã có.
+
+        Khi cache hit, các trang được đọc lần lượt từ đĩa nên không giữ cả tài liệu trong RAM. Đọc đúng
+        page_count trang theo manifest; nếu một trang thiếu hoặc hỏng thì OCR lại cả file (và ghi đè
+        cache) rồi tiếp tục từ trang đó, thay vì coi tài liệu đã hết.
+        """
+        backend = getattr(self.ocr_client, "backend", "default")
+        content_hash = OCRPageCache.hash_file(file_path)
+        yielded = 0
+        page_count = self.ocr_cache.page_count(backend, content_hash)
+        if page_count is not None:
+            print(f"OCR cache hit for {os.path.basename(file_path)}")
+            for page_num in range(1, page_count + 1):
+                page = self.ocr_cache.get_page(backend, content_hash, page_num)
+                if page is None:
+                    print(f"OCR cache page {page_num}/{page_count} of {os.path.basename(file_path)} unreadable, re-running OCR")
+                    break
+                yield page
+                yielded += 1
+            else:
+                return
+
+        pages = self.ocr_client.extract_pages(file_path)
+        self.ocr_cache.put_pages(backend, content_hash, pages, source=file_path)
+        yield from pages[yielded:]
+
+    def _iter_pages(self, file_path: str, file_ext: str, base_metadata: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Sinh lần lượt (nội dung, metadata) cho từng trang/phần của tài liệu."""
+        if file_ext == '.pdf':
+            for page_num, content in enumerate(self._iter_pdf_pages(file_path), 1):
+                page_metadata = base_metadata.copy()
+                page_metadata.update({"doc_type": "pdf", "slide_number": page_num})
+                yield content, page_metadata
+        elif file_ext == '.docx':
+            doc = Document(file_path)
+            content = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+            yield content, {**base_metadata, "doc_type": "docx"}
+        elif file_ext == '.pptx':
+            for slide in self._run_in_extract_pool(extract_pptx_slides, file_path):
+                parts = [part for part in (slide["title"], slide["text"]) if part]
+                if slide["notes"]:
+                    parts.append(f"Ghi chú của người trình bày: {slide['notes']}")
+                if not parts:
+                    continue
+                slide_metadata = base_metadata.copy()
+                slide_metadata.update({
+                    "doc_type": "pptx",
+                    "slide_number": slide["slide_number"],
+                    "slide_title": slide["title"],
+                    "has_speaker_notes": bool(slide["notes"]),
+                })
+                yield "\n".join(parts), slide_metadata
+        elif file_ext == '.csv' or (file_ext == '.txt' and is_transcript_file(file_path)):
+            # Transcript: mỗi "trang" là một cửa sổ thời gian gồm các đoạn liên tiếp, dài tối đa chunk_size
+            segments = iter_transcript_segments(file_path)
+            for window in iter_transcript_windows(segments, chunk_size=self.chunk_size):
+                window_metadata = base_metadata.copy()
+                window_metadata.update({
+                    "doc_type": "transcript",
+                    "start_time": round(window["start"], 3),
+                    "end_time": round(window["end"], 3),
+                    "timestamp": f"{format_timestamp(window['start'])} - {format_timestamp(window['end'])}",
+                })
+                yield window["text"], window_metadata
+        elif file_ext == '.txt':
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read()
+            yield content, {**base_metadata, "doc_type": "txt"}
+
+    def _split_sections(self, text: str, section_context: Dict[str, Any]) -> List[Tuple[int, int, Dict[str, Any]]]:
+        """Chia văn bản thành các phần (start, end, metadata) tại các dòng tiêu đề.
+
+        section_context giữ chapter/section/part/section_title hiện tại và được cập nhật tại chỗ,
+        để trang sau (không có tiêu đề ở đầu) vẫn thuộc đúng chương/mục của trang trước.
+        """
+        sections = []
+        section_start = 0
+        starts_at_heading = False
+        for boundary in MetadataExtractor.find_section_boundaries(text):
+            body = text[section_start:boundary["start"]].strip()
+            # Tiêu đề đứng liền tiêu đề (vd. "# Chương 2" rồi "## Mục 2.1") được gộp vào phần sau; phần mở đầu
+            # chỉ một dòng (không phải tiêu đề) vẫn là một phần riêng với metadata của nó
+            heading_only = starts_at_heading and "\n" not in body
+            if body and not heading_only:
+                sections.append((section_start, boundary["start"], dict(section_context)))
+                section_start = boundary["start"]
+            starts_at_heading = True
+            if "chapter" in boundary:
+                section_context.pop("section", None)
+            section_context.update({k: v for k, v in boundary.items() if k != "start"})
+        sections.append((section_start, len(text), dict(section_context)))
+        return sections
+
+    def _chunk_documents(self, text: str, source_path: str, doc_metadata: Optional[Dict[str, Any]] = None,
+                         section_context: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        if self.chunking_mode == "structure":
+            sections = self._split_sections(text, section_context if section_context is not None else {})
+        else:
+            sections = [(0, len(text), {})]
 
-    def _chunk_documents(self, text: str, source_path: str, doc_metadata: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-        langchain_docs = self.text_splitter.create_documents([text])
         chunks_data = []
-        for doc in langchain_docs:
-            chunk_metadata = {
-                "source": os.path.basename(source_path) if isinstance(source_path, str) else "unknown",
-                "start_index": doc.metadata.get("start_index", -1),
-            }
-            if doc_metadata:
-                chunk_metadata.update(doc_metadata)
-            text_content = doc.page_content  # Chroma không giới hạn độ dài nghiêm ngặt như Milvus VARCHAR
-            chunks_data.append({"text": text_content, "metadata": chunk_metadata})
+        for section_start, section_end, section_metadata in sections:
+            for start_index, text_content in self.text_chunker.create_chunks(text[section_start:section_end]):
+                chunk_metadata = {
+                    "source": os.path.basename(source_path) if isinstance(source_path, str) else "unknown",
+                    "start_index": section_start + start_index,
+                }
+                if doc_metadata:
+                    chunk_metadata.update(doc_metadata)
+                chunk_metadata.update(section_metadata)
+                # Chroma không giới hạn độ dài nghiêm ngặt như Milvus VARCHAR
+                chunks_data.append({"text": text_content, "metadata": chunk_metadata})
         return chunks_data
 
+    def _iter_chunk_batches(self, file_path: str, file_ext: str, base_metadata: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        """Pipeline trang -> chunk -> batch kích thước cố định; chỉ giữ tối đa một trang và một batch trong RAM."""
+        batch = []
+        section_context: Dict[str, Any] = {}
+        for content, page_metadata in self._iter_pages(file_path, file_ext, base_metadata):
+            for chunk in self._chunk_documents(content, file_path, page_metadata, section_context):
+                batch.append(chunk)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _create_writer(self, collection) -> ChromaBatchWriter:
+        max_batch_size = None
+        try:
+            max_batch_size = self.client.get_max_batch_size()
+        except Exception:
+            pass  # Client cũ không có giới hạn batch
+        return ChromaBatchWriter(collection, max_batch_size=max_batch_size)
+
+    def _add_batch(self, chunks: List[Dict[str, Any]]) -> List[Future]:
+        """Embed một batch chunk và đưa vào hàng đợi ghi Chroma để phần đã index có thể tìm kiếm sớm.
+
+        Việc ghi chạy nền (ChromaBatchWriter) nên batch tiếp theo được embed trong lúc batch này
+        đang ghi; dùng ``ChromaBatchWriter.wait`` trên kết quả trả về để chờ ghi xong.
+        Chunk có thể thuộc nhiều file khác nhau. Nếu chunk có sẵn "id" (ID xác định) thì dùng lại;
+        mọi lần ghi đều là upsert nên ghi lại nhiều lần vẫn idempotent.
+        """
+        with self._batch_targets() as (embedder, writer, shadow):
+            return self._add_batch_to(chunks, embedder, writer, shadow)
+
+    @contextmanager
+    def _batch_targets(self):
+        """Lấy (embedder, writer, shadow) nhất quán cho một batch; giữ chúng không bị đóng tới khi batch đã submit."""
+        with self._swap_cond:
+            self._swap_cond.wait_for(lambda: not self._swapping)
+            self._in_flight += 1
+            targets = (self.embedder, self.writer, self._shadow)
+        try:
+            yield targets
+        finally:
+            with self._swap_cond:
+                self._in_flight -= 1
+                self._swap_cond.notify_all()
+
+    @contextmanager
+    def _swap_targets(self):
+        """Chặn batch mới và chờ các batch đang embed/submit xong trước khi đổi collection."""
+        with self._swap_cond:
+            self._swap_cond.wait_for(lambda: not self._swapping)
+            self._swapping = True
+            self._swap_cond.wait_for(lambda: self._in_flight == 0)
+        try:
+            yield
+        finally:
+            with self._swap_cond:
+                self._swapping = False
+                self._swap_cond.notify_all()
+
+    def _add_batch_to(self, chunks: List[Dict[str, Any]], embedder: EmbeddingQueue,
+                      writer: ChromaBatchWriter, shadow: Optional[Tuple]) -> List[Future]:
+        texts = [chunk["text"] for chunk in chunks]
+        embeddings = embedder.encode(texts)
+
+        ids = []
+        metadatas = []
+        for chunk in chunks:
+            # Tạo ID duy nhất
+            ids.append(chunk.get("id") or str(uuid.uuid4()))
+
+            # Metadata trong Chroma nên phẳng (flat), nhưng code cũ dùng json string cho field 'metadata'
+            # Để tương thích với code retriever cũ (parse json từ metadata), ta sẽ lưu:
+            # 1. 'source': filename
+            # 2. 'metadata': json string của toàn bộ metadata gốc
+            meta_json = json.dumps(chunk["metadata"], ensure_ascii=False)
+            chroma_metadata = {
+                "source": chunk["metadata"]["source"],
+                "metadata": meta_json  # Giữ tương thích với retriever cũ
+            }
+            # 3. chapter/section/title... dạng field phẳng để retriever lọc theo chương/mục
+            for key in self.FILTERABLE_METADATA_KEYS:
+                value = chunk["metadata"].get(key)
+                if isinstance(value, (str, int, float, bool)):
+                    chroma_metadata[key] = value
+            # 4. Nguồn gốc của tài liệu không gắn với upload của người dùng (vd. "bulk_ingest")
+            if chunk["metadata"].get("origin"):
+                chroma_metadata["origin"] = chunk["metadata"]["origin"]
+            metadatas.append(chroma_metadata)
+
+        futures = writer.submit(ids, texts, embeddings, metadatas)
+
+        if shadow is not None:
+            # Ghi cùng ID vào collection đang rebuild; upsert nên trùng với lượt quét lại không tạo bản sao
+            _, shadow_embedder, shadow_writer = shadow
+            for future in shadow_writer.submit(ids, texts, shadow_embedder.encode(texts), metadatas):
+                future.add_done_callback(self._log_shadow_failure)
+        return futures
+
+    @staticmethod
+    def _log_shadow_failure(future: Future):
+        if future.exception() is not None:
+            print(f"Error writing to shadow collection: {future.exception()}")
+
+    def attach_shadow_collection(self, collection, embedder: EmbeddingQueue):
+        """Bắt đầu ghi song song mọi batch mới vào collection đang được rebuild (embed bằng embedder riêng)."""
+        shadow = (collection, embedder, self._create_writer(collection))
+        with self._swap_cond:
+            self._shadow = shadow
+
+    def detach_shadow_collection(self):
+        with self._swap_targets():
+            shadow, self._shadow = self._shadow, None
+        if shadow is not None:
+            # Không còn batch nào đang dùng bộ phụ: chờ các lần ghi đã submit rồi giải phóng
+            _, embedder, writer = shadow
+            writer.close()
+            embedder.close()
+
+    def promote_shadow_collection(self, collection_name: str, model_name: str):
+        """Dùng collection phụ làm collection chính (sau khi rebuild xong và retriever đã chuyển sang)."""
+        with self._swap_targets():
+            if self._shadow is None:
+                raise RuntimeError("No shadow collection attached")
+            collection, embedder, writer = self._shadow
+            old_embedder, old_writer = self.embedder, self.writer
+            self.collection, self.embedder, self.model, self.writer = collection, embedder, embedder.model, writer
+            self.collection_name, self.model_name = collection_name, model_name
+            self._shadow = None
+        # Các batch đang chạy đã submit xong vào bộ cũ, batch mới dùng bộ mới:
+        # chờ các lần ghi còn dở rồi giải phóng thread của bộ cũ
+        old_writer.close()
+        old_embedder.close()
+
+    def bulk_slot(self):
+        return self.scheduler.bulk_slot() if self.scheduler else nullcontext()
+
+    def bulk_checkpoint(self):
+        if self.scheduler:
+            self.scheduler.checkpoint()
+
     def index_document(self, file_path: str, file_type: Optional[str] = None, 
                    chunk_size: Optional[int] = None, doc_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        documents_added = 0
+        futures: List[Future] = []
         try:
             file_ext = os.path.splitext(file_path)[1].lower()
+            if file_ext == '.ppt':
+                return {"success": False, "documents_added": 0, "error": "Legacy .ppt is not supported, please convert the file to .pptx"}
+            if file_ext not in self.SUPPORTED_EXTENSIONS:
+                return {"success": False, "documents_added": 0, "error": f"Unsupported file type: {file_ext}"}
+
             base_metadata = doc_metadata or {"title": "Unknown"}
             base_metadata["filename"] = os.path.basename(file_path)
 
-            # Đọc nội dung theo loại file
-            if file_ext == '.pdf':
-                client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
-                pdf_file = Path(file_path)
-                uploaded_file = client.files.upload(file={"file_name": pdf_file.name, "content": pdf_file.read_bytes()}, purpose="ocr")
-                signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
-                ocr_response = client.ocr.process(model="mistral-ocr-latest", document={"type": "document_url", "document_url": signed_url.url})
-                chunks_data = []
-                for page_num, page in enumerate(ocr_response.pages, 1):
-                    content = page.markdown
-                    page_metadata = base_metadata.copy()
-                    page_metadata.update({"doc_type": "pdf", "slide_number": page_num})
-                    chunks_data.extend(self._chunk_documents(content, file_path, page_metadata))
-            elif file_ext == '.docx':
-                doc = Document(file_path)
-                content = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-                base_metadata["doc_type"] = "docx"
-                chunks_data = self._chunk_documents(content, file_path, base_metadata)
-            elif file_ext == '.txt':
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                base_metadata["doc_type"] = "txt"
-                chunks_data = self._chunk_documents(content, file_path, base_metadata)
-            else:
-                return {"success": False, "documents_added": 0, "error": f"Unsupported file type: {file_ext}"}
+            # Mỗi batch được embed và đưa đi ghi ngay khi đủ kích thước, ghi chạy song song với batch kế tiếp.
+            # Slot bulk chỉ giữ trong lúc đọc/tách chunk cho một batch (phần tốn CPU của thread này); việc
+            # embed chờ trên EmbeddingQueue dùng chung nằm ngoài slot để batch của nhiều upload (và rebuild)
+            # được gom chung. Checkpoint sau mỗi batch điều tiết theo thời gian đọc + embed của batch đó.
+            batches = self._iter_chunk_batches(file_path, file_ext, base_metadata)
+            while True:
+                with self.bulk_slot():
+                    batch = next(batches, None)
+                if batch is None:
+                    break
+                futures.extend(self._add_batch(batch))
+                self.bulk_checkpoint()
+            documents_added = ChromaBatchWriter.wait(futures)
 
-            if not chunks_data:
+            if not documents_added:
                  return {"success": False, "documents_added": 0, "error": "No content to index"}
 
-            # Chuẩn bị dữ liệu cho ChromaDB
-            texts = [chunk["text"] for chunk in chunks_data]
-            embeddings = self.model.encode(texts, batch_size=32).tolist()
-            
-            ids = []
-            metadatas = []
-            
-            for i, chunk in enumerate(chunks_data):
-                # Tạo ID duy nhất
-                chunk_id = str(uuid.uuid4())
-                ids.append(chunk_id)
-                
-                # Metadata trong Chroma nên phẳng (flat), nhưng code cũ dùng json string cho field 'metadata'
-                # Để tương thích với code retriever cũ (parse json từ metadata), ta sẽ lưu:
-                # 1. 'source': filename
-                # 2. 'metadata': json string của toàn bộ metadata gốc
-                orig_metadata = chunk["metadata"]
-                meta_json = json.dumps(orig_metadata, ensure_ascii=False)
-                
-                metadatas.append({
-                    "source": os.path.basename(file_path),
-                    "metadata": meta_json  # Giữ tương thích với retriever cũ
-                })
-
-            # Thêm vào Chroma
-            if ids:
-                self.collection.add(
-                    documents=texts,
-                    embeddings=embeddings,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-                return {"success": True, "documents_added": len(ids)}
-            
-            return {"success": True, "documents_added": 0}
+            print(f"Chroma writer: {self.writer.throughput()}")
+            if self.embedder.cache is not None:
+                print(f"Embedding cache: {self.embedder.cache.snapshot()}")
+            return {"success": True, "documents_added": documents_added}
 
         except Exception as e:
             print(f"Error indexing document: {str(e)}")
-            return {"success": False, "documents_added": 0, "error": str(e)}
\ No newline at end of file
+            # Các batch đã ghi trước khi lỗi vẫn nằm trong Chroma
+            documents_added = sum(future.result() for future in futures if future.exception() is None)
+            return {"success": False, "documents_added": documents_added, "error": str(e)}
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.embedder is not None:
+            self.embedder.close()
+        if self._extract_pool is not None:
+            self._extract_pool.shutdown(wait=False)
+            self._extract_pool = None
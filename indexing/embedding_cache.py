@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional, Dict, Any
+import numpy as np
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khóa giữa các thread trong cùng process
+    fcntl = None
+
+_DIGEST_SIZE = 16
+
+
+class EmbeddingCache:
+    """Cache vector embedding trên đĩa, key = hash nội dung chunk, tách riêng theo embedding model.
+
+    Mỗi model có một thư mục gồm:
+    - ``vectors.f32``: các vector float32 nối tiếp nhau, đọc qua numpy memmap (không load vào RAM).
+    - ``keys.bin``: digest BLAKE2b 16 byte của từng chunk, cùng thứ tự với vectors.
+    - ``meta.json``: tên model và số chiều vector.
+
+    Chỉ ghi nối thêm: vector được ghi trước, key sau, nên khi tiến trình bị ngắt giữa chừng
+    phần thừa ở cuối file được cắt bỏ ở lần ghi tiếp theo.
+
+    Nhiều process có thể dùng chung một thư mục (vd. API và ``python -m indexing.bulk_ingest``): mọi
+    lần ghi giữ file lock ``.lock`` và trước khi ghi nạp các bản ghi process khác đã nối thêm, nên
+    vector mới luôn nằm đúng hàng của key. Khi đọc, các bản ghi hoàn chỉnh mới (key đã ghi, nghĩa là
+    vector đã ghi trước đó) được nạp mà không cần lock.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = settings.EMBEDDING_CACHE_DIR):
+        slug = re.sub(r'[^a-zA-Z0-9._-]+', '_', model_name).strip('_') or "model"
+        self.model_name = model_name
+        self.dir = Path(cache_dir) / slug
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.dir / "vectors.f32"
+        self._keys_path = self.dir / "keys.bin"
+        self._meta_path = self.dir / "meta.json"
+        self._lock_path = self.dir / ".lock"
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        # Số hàng trong file (có thể lớn hơn len(self._rows) nếu file có key trùng)
+        self._count = 0
+        self._mmap: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        with self._lock, self._file_lock():
+            self._sync(truncate=True)
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=_DIGEST_SIZE).digest()
+
+    @contextmanager
+    def _file_lock(self):
+        """Lock độc quyền giữa các process dùng chung thư mục cache."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _sync(self, truncate: bool = False):
+        """Nạp các bản ghi hoàn chỉnh chưa có trong self._rows (do process này hoặc process khác ghi).
+
+        truncate=True (chỉ khi đang giữ file lock): cắt bỏ bản ghi ghi dở ở cuối file, vd. vector đã
+        ghi nhưng key chưa kịp ghi.
+        """
+        if self.dim is None:
+            if not self._meta_path.exists():
+                return
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        key_bytes = os.path.getsize(self._keys_path) if self._keys_path.exists() else 0
+        vector_bytes = os.path.getsize(self._vectors_path) if self._vectors_path.exists() else 0
+        count = min(key_bytes // _DIGEST_SIZE, vector_bytes // (self.dim * 4))
+        if truncate:
+            if key_bytes != count * _DIGEST_SIZE:
+                os.truncate(self._keys_path, count * _DIGEST_SIZE)
+            if vector_bytes != count * self.dim * 4:
+                os.truncate(self._vectors_path, count * self.dim * 4)
+        known = self._count
+        if count <= known:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(known * _DIGEST_SIZE)
+            keys = f.read((count - known) * _DIGEST_SIZE)
+        for offset in range(count - known):
+            self._rows[keys[offset * _DIGEST_SIZE:(offset + 1) * _DIGEST_SIZE]] = known + offset
+        self._count = count
+
+    def _vectors(self) -> np.memmap:
+        # Map lại khi file đã được ghi thêm sau lần map trước
+        if self._mmap is None or self._mmap.shape[0] < self._count:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._count, self.dim))
+        return self._mmap
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Trả về vector đã cache cho từng text (None nếu chưa có)."""
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            self._sync()
+            rows = [self._rows.get(key) for key in keys]
+            vectors = self._vectors() if self._rows else None
+            results = [vectors[row].tolist() if row is not None else None for row in rows]
+            hits = sum(row is not None for row in rows)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(rows) - hits
+        return results
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]):
+        if not texts:
+            return
+        with self._lock, self._file_lock():
+            # Nạp phần process khác đã ghi để không ghi trùng và để hàng mới nối đúng sau các hàng đó
+            self._sync(truncate=True)
+            if self.dim is None:
+                self.dim = len(embeddings[0])
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim}, f)
+            new_keys, new_vectors, seen = [], [], set()
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                if key in self._rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_vectors.append(embedding)
+            if not new_keys:
+                return
+            array = np.asarray(new_vectors, dtype=np.float32).reshape(len(new_keys), self.dim)
+            with open(self._vectors_path, "ab") as f:
+                f.write(array.tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = self._count + offset
+            self._count += len(new_keys)
+            self.stats["writes"] += len(new_keys)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            entries = len(self._rows)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["entries"] = entries
+        stats["size_bytes"] = entries * (self.dim or 0) * 4
+        stats["model"] = self.model_name
+        return stats
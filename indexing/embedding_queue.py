@@ -0,0 +1,142 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Tuple, Optional
+from config import settings
+from indexing.embedding_cache import EmbeddingCache
+
+
+class EmbeddingQueue:
+    """Hàng đợi embedding dùng chung cho mọi tài liệu đang được index.
+
+    Các lời gọi ``encode`` từ nhiều thread (mỗi upload chạy một background task) được gom
+    lại trong một khoảng chờ ngắn, sắp xếp theo độ dài rồi chia thành batch theo ngân sách
+    token: văn bản ngắn được gom batch lớn, văn bản dài batch nhỏ hơn để tránh padding.
+    Kết quả được trả về đúng thứ tự cho từng lời gọi. Nếu có ``cache``, chỉ các chunk chưa
+    từng được embed (theo hash nội dung) mới được đưa vào model.
+    """
+
+    def __init__(self, model, max_batch_tokens: int = settings.EMBED_MAX_BATCH_TOKENS,
+                 max_batch_size: int = settings.EMBED_MAX_BATCH_SIZE,
+                 max_wait_ms: int = settings.EMBED_MAX_WAIT_MS, cache: Optional[EmbeddingCache] = None):
+        self.model = model
+        self.cache = cache
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_seq_length = getattr(model, "max_seq_length", None) or 512
+        # None là tín hiệu dừng worker (xem close)
+        self._requests: "queue.Queue[Optional[Tuple[List[str], Future]]]" = queue.Queue()
+        self._close_lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="embedding-queue", daemon=True)
+        self._worker.start()
+        self.stats = {"requests": 0, "texts": 0, "batches": 0}
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """Embed danh sách văn bản, chặn cho tới khi batch chứa chúng được xử lý xong."""
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._encode_uncached(list(texts))
+
+        embeddings = self.cache.get_many(texts)
+        # Chunk trùng nhau trong cùng lời gọi chỉ embed một lần
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            computed = self._encode_uncached(missing)
+            self.cache.put_many(missing, computed)
+            by_text = dict(zip(missing, computed))
+            embeddings = [embedding if embedding is not None else by_text[text] for text, embedding in zip(texts, embeddings)]
+        return embeddings
+
+    def _encode_uncached(self, texts: List[str]) -> List[List[float]]:
+        future: Future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("EmbeddingQueue is closed")
+            self._requests.put((texts, future))
+        return future.result()
+
+    def close(self):
+        """Dừng worker sau khi xử lý xong các request đã nhận."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._requests.put(None)
+
+    def _estimate_tokens(self, text: str) -> int:
+        # Ước lượng rẻ (~4 ký tự/token), bị chặn bởi độ dài tối đa mà model xử lý
+        return min(len(text) // 4 + 2, self.max_seq_length)
+
+    def _collect(self) -> Optional[List[Tuple[List[str], Future]]]:
+        """Chờ request đầu tiên, sau đó gom thêm các request tới trong khoảng max_wait; None khi đã close."""
+        first = self._requests.get()
+        if first is None:
+            return None
+        requests = [first]
+        pending_texts = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while pending_texts < self.max_batch_size * 4:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Xử lý nốt các request đã gom, worker dừng ở vòng lặp sau
+                self._requests.put(None)
+                break
+            requests.append(request)
+            pending_texts += len(request[0])
+        return requests
+
+    def _plan_batches(self, items: List[Tuple[int, int, str]]) -> List[List[Tuple[int, int, str]]]:
+        """Chia các item (đã sắp theo độ dài) thành batch sao cho batch_size * max_len <= max_batch_tokens."""
+        batches = []
+        current: List[Tuple[int, int, str]] = []
+        current_max = 0
+        for item in items:
+            tokens = self._estimate_tokens(item[2])
+            longest = max(current_max, tokens)
+            if current and (len(current) >= self.max_batch_size or longest * (len(current) + 1) > self.max_batch_tokens):
+                batches.append(current)
+                current, longest = [], tokens
+            current.append(item)
+            current_max = longest
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            if requests is None:
+                return
+            results = [[None] * len(texts) for texts, _ in requests]
+            items = [(req_idx, pos, text) for req_idx, (texts, _) in enumerate(requests) for pos, text in enumerate(texts)]
+            items.sort(key=lambda item: len(item[2]))
+
+            failed = {}
+            for batch in self._plan_batches(items):
+                try:
+                    embeddings = self.model.encode([text for _, _, text in batch], batch_size=len(batch))
+                except Exception as e:
+                    for req_idx, _, _ in batch:
+                        failed[req_idx] = e
+                    continue
+                for (req_idx, pos, _), embedding in zip(batch, embeddings):
+                    results[req_idx][pos] = embedding.tolist()
+                self.stats["batches"] += 1
+
+            for req_idx, (texts, future) in enumerate(requests):
+                self.stats["requests"] += 1
+                self.stats["texts"] += len(texts)
+                if req_idx in failed:
+                    future.set_exception(failed[req_idx])
+                else:
+                    future.set_result(results[req_idx])
@@ -0,0 +1,52 @@
+"""Các hàm trích xuất nội dung ở mức module (picklable) để chạy được trong process pool."""
+from typing import List, Dict, Any
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+
+def _iter_shape_texts(shapes):
+    """Lấy text từ mọi shape của slide, kể cả bảng và shape lồng trong group."""
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from _iter_shape_texts(shape.shapes)
+        elif getattr(shape, "has_table", False) and shape.has_table:
+            for row in shape.table.rows:
+                cells = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+                if cells:
+                    yield " | ".join(cells)
+        elif getattr(shape, "has_text_frame", False) and shape.has_text_frame:
+            text = shape.text_frame.text.strip()
+            if text:
+                yield text
+
+
+def extract_pptx_slides(file_path: str) -> List[Dict[str, Any]]:
+    """Trích xuất từng slide của file .pptx.
+
+    Returns:
+        Danh sách dict gồm slide_number (bắt đầu từ 1), title, text (nội dung slide,
+        không gồm tiêu đề) và notes (ghi chú của người trình bày).
+    """
+    presentation = Presentation(file_path)
+    slides = []
+    for slide_number, slide in enumerate(presentation.slides, 1):
+        title_shape = slide.shapes.title
+        title = title_shape.text.strip() if title_shape is not None and title_shape.has_text_frame else ""
+
+        body_parts = []
+        for text in _iter_shape_texts(slide.shapes):
+            if title and text == title:
+                continue
+            body_parts.append(text)
+
+        notes = ""
+        if slide.has_notes_slide and slide.notes_slide.notes_text_frame is not None:
+            notes = slide.notes_slide.notes_text_frame.text.strip()
+
+        slides.append({
+            "slide_number": slide_number,
+            "title": title,
+            "text": "\n".join(body_parts),
+            "notes": notes,
+        })
+    return slides
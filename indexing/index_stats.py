@@ -0,0 +1,246 @@
+"""Thống kê sức khỏe index: kích thước, phân bố độ dài chunk, tỷ lệ trùng lặp, chunk mồ côi, BM25, bộ nhớ.
+
+Collection được đọc theo từng trang (chỉ documents + metadatas, không kéo embedding về). Với
+collection lớn hơn max_scan_chunks, chỉ các trang rải đều trên toàn collection được đọc và các
+tỷ lệ được ước lượng từ mẫu (``sampled=True``).
+
+Chạy: python -m indexing.index_stats [--collection NAME] [--json]
+"""
+import re
+import sys
+import json
+import math
+import hashlib
+import argparse
+from collections import Counter
+from typing import Dict, Any, Optional, List, Iterable, Iterator, Set
+from config import settings
+
+# Cùng cách tách từ với EnsembleRetriever._preprocess_text
+_TOKEN_PATTERN = re.compile(r'\b\w+\b')
+LENGTH_BUCKETS = (100, 250, 500, 1000, 2000)
+# Ước lượng bộ nhớ CPython: một entry trong dict tần suất từ của BM25Okapi, một từ trong idf
+_BM25_POSTING_BYTES = 100
+_BM25_VOCAB_BYTES = 150
+# Số liên kết mỗi node của HNSW (Chroma mặc định M=16, tầng 0 có 2*M liên kết)
+_HNSW_M = 16
+
+
+def _percentile(ordered: List[int], fraction: float) -> int:
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _page_offsets(total: int, page_size: int, max_scan_chunks: int) -> List[int]:
+    """Offset của các trang cần đọc: toàn bộ, hoặc các trang rải đều khi collection quá lớn."""
+    pages = math.ceil(total / page_size)
+    if total <= max_scan_chunks:
+        return [i * page_size for i in range(pages)]
+    sample_pages = max(1, max_scan_chunks // page_size)
+    stride = pages / sample_pages
+    return sorted({int(i * stride) * page_size for i in range(sample_pages)})
+
+
+def iter_collection_pages(collection, page_size: int, offsets: Iterable[int]) -> Iterator[Dict[str, Any]]:
+    for offset in offsets:
+        page = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        if not page.get("ids"):
+            break
+        yield page
+
+
+def collect_index_stats(collection, known_sources: Optional[Set[str]] = None, retriever=None,
+                        page_size: int = 1000, max_scan_chunks: int = 200_000,
+                        bm25_max_docs: int = 10000) -> Dict[str, Any]:
+    """Tính thống kê cho một collection Chroma.
+
+    Args:
+        known_sources: Tên file (field ``filename`` trong user_files) còn tồn tại; chunk có ``source``
+            không nằm trong tập này bị tính là mồ côi, trừ chunk có field ``origin`` (vd. tài liệu chung
+            do bulk_ingest ghi, vốn không có bản ghi user_files). None thì bỏ qua phần mồ côi.
+        retriever: EnsembleRetriever đang chạy (nếu có) để lấy số liệu BM25 thực tế; nếu không thì
+            BM25 được ước lượng từ bm25_max_docs chunk đầu tiên (đúng phần mà retriever nạp).
+    """
+    total = collection.count()
+    offsets = _page_offsets(total, page_size, max_scan_chunks)
+
+    lengths: List[int] = []
+    text_bytes = 0
+    metadata_bytes = 0
+    seen_hashes: Set[bytes] = set()
+    duplicates = 0
+    chunks_per_source: Counter = Counter()
+    # Nguồn có chunk không đến từ upload của người dùng (field "origin"), không xét mồ côi
+    shared_sources: Set[str] = set()
+    vocabulary: Set[str] = set()
+    postings = 0
+    bm25_docs = 0
+
+    for page_offset, page in zip(offsets, iter_collection_pages(collection, page_size, offsets)):
+        for position, (document, metadata) in enumerate(zip(page["documents"], page["metadatas"])):
+            document = document or ""
+            metadata = metadata or {}
+            lengths.append(len(document))
+            encoded = document.encode("utf-8")
+            text_bytes += len(encoded)
+            metadata_bytes += len(json.dumps(metadata, ensure_ascii=False))
+            digest = hashlib.blake2b(encoded, digest_size=16).digest()
+            if digest in seen_hashes:
+                duplicates += 1
+            else:
+                seen_hashes.add(digest)
+            chunks_per_source[metadata.get("source", "unknown")] += 1
+            if metadata.get("origin"):
+                shared_sources.add(metadata.get("source", "unknown"))
+            if retriever is None and page_offset + position < bm25_max_docs:
+                tokens = set(_TOKEN_PATTERN.findall(document.lower()))
+                vocabulary.update(tokens)
+                postings += len(tokens)
+                bm25_docs += 1
+
+    scanned = len(lengths)
+    # Hệ số ngoại suy từ mẫu ra toàn bộ collection
+    scale = total / scanned if scanned else 0.0
+    ordered = sorted(lengths)
+    histogram = {}
+    lower = 0
+    for upper in LENGTH_BUCKETS:
+        histogram[f"{lower}-{upper}"] = sum(lower <= length < upper for length in ordered)
+        lower = upper
+    histogram[f"{lower}+"] = sum(length >= lower for length in ordered)
+
+    stats: Dict[str, Any] = {
+        "collection": collection.name,
+        "total_chunks": total,
+        "scanned_chunks": scanned,
+        "sampled": scanned < total,
+        "sources": len(chunks_per_source),
+        "chunk_length": {
+            "min": ordered[0] if ordered else 0,
+            "mean": round(sum(ordered) / scanned, 1) if scanned else 0.0,
+            "p50": _percentile(ordered, 0.5),
+            "p90": _percentile(ordered, 0.9),
+            "p99": _percentile(ordered, 0.99),
+            "max": ordered[-1] if ordered else 0,
+            "histogram": histogram,
+        },
+        "duplicates": {
+            "duplicate_chunks": duplicates,
+            "duplicate_ratio": round(duplicates / scanned, 4) if scanned else 0.0,
+        },
+        "largest_sources": chunks_per_source.most_common(10),
+    }
+
+    if known_sources is not None:
+        orphans = {source: count for source, count in chunks_per_source.items()
+                   if source not in known_sources and source not in shared_sources}
+        orphan_chunks = sum(orphans.values())
+        stats["orphans"] = {
+            "orphan_chunks": orphan_chunks,
+            "orphan_ratio": round(orphan_chunks / scanned, 4) if scanned else 0.0,
+            "orphan_sources": len(orphans),
+            "shared_sources": len(shared_sources),
+            "top_orphan_sources": Counter(orphans).most_common(10),
+        }
+
+    if retriever is not None:
+        bm25 = retriever.bm25
+        vocab_size = len(bm25.idf) if bm25 is not None else 0
+        docs = bm25.corpus_size if bm25 is not None else 0
+        live_postings = sum(len(freqs) for freqs in bm25.doc_freqs) if bm25 is not None else 0
+        stats["bm25"] = {"source": "live", "documents": docs, "vocabulary_size": vocab_size,
+                         "memory_bytes_estimate": live_postings * _BM25_POSTING_BYTES + vocab_size * _BM25_VOCAB_BYTES}
+    else:
+        stats["bm25"] = {"source": "estimated", "documents": bm25_docs, "vocabulary_size": len(vocabulary),
+                         "memory_bytes_estimate": postings * _BM25_POSTING_BYTES + len(vocabulary) * _BM25_VOCAB_BYTES}
+
+    dimension = 0
+    probe = collection.get(limit=1, include=["embeddings"])
+    embeddings = probe.get("embeddings")
+    if embeddings is not None and len(embeddings) > 0:
+        dimension = len(embeddings[0])
+    vector_bytes = total * dimension * 4
+    stats["memory"] = {
+        "embedding_dimension": dimension,
+        "vector_bytes": vector_bytes,
+        "hnsw_link_bytes_estimate": total * _HNSW_M * 2 * 4,
+        "document_bytes_estimate": int(text_bytes * scale),
+        "metadata_bytes_estimate": int(metadata_bytes * scale),
+    }
+    stats["memory"]["total_bytes_estimate"] = sum(
+        value for key, value in stats["memory"].items() if key.endswith("bytes") or key.endswith("bytes_estimate")
+    ) + stats["bm25"]["memory_bytes_estimate"]
+    return stats
+
+
+def load_known_sources() -> Optional[Set[str]]:
+    """Tên file của mọi bản ghi trong user_files, hoặc None nếu không kết nối được MongoDB."""
+    try:
+        from auth.utils import get_mongo_connection
+        files_collection = get_mongo_connection().database["user_files"]
+        return set(files_collection.distinct("filename"))
+    except Exception as e:
+        print(f"Could not load user_files, skipping orphan detection: {e}")
+        return None
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Report size and health statistics of a Chroma collection")
+    parser.add_argument("--collection", type=str, default=None,
+                        help="Chroma collection name (default: the active index version)")
+    parser.add_argument("--page-size", type=int, default=1000, help="Number of chunks read per page")
+    parser.add_argument("--max-scan", type=int, default=200_000,
+                        help="Sample evenly spaced pages when the collection is larger than this")
+    parser.add_argument("--no-orphans", action="store_true", help="Skip the user_files lookup")
+    parser.add_argument("--json", action="store_true", help="Print the raw statistics as JSON")
+    args = parser.parse_args(argv)
+
+    from indexing.index_versions import IndexRegistry, create_chroma_client, resolve_active_index
+    client = create_chroma_client()
+    collection_name = args.collection or resolve_active_index(client, IndexRegistry())["collection"]
+    try:
+        collection = client.get_collection(name=collection_name)
+    except Exception as e:
+        print(f"Collection {collection_name} not found: {e}")
+        sys.exit(1)
+
+    known_sources = None if args.no_orphans else load_known_sources()
+    stats = collect_index_stats(collection, known_sources=known_sources, page_size=args.page_size,
+                                max_scan_chunks=args.max_scan)
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return
+
+    length = stats["chunk_length"]
+    print(f"Collection {stats['collection']}: {stats['total_chunks']} chunks from {stats['sources']} sources"
+          + (f" (sampled {stats['scanned_chunks']})" if stats["sampled"] else ""))
+    print(f"Chunk length: min {length['min']}, mean {length['mean']}, p50 {length['p50']}, "
+          f"p90 {length['p90']}, p99 {length['p99']}, max {length['max']}")
+    print("Length histogram: " + ", ".join(f"{bucket}: {count}" for bucket, count in length["histogram"].items()))
+    duplicates = stats["duplicates"]
+    print(f"Duplicates: {duplicates['duplicate_chunks']} chunks ({duplicates['duplicate_ratio']:.1%})")
+    if "orphans" in stats:
+        orphans = stats["orphans"]
+        print(f"Orphans: {orphans['orphan_chunks']} chunks ({orphans['orphan_ratio']:.1%}) "
+              f"from {orphans['orphan_sources']} sources without a user_files record")
+    bm25 = stats["bm25"]
+    print(f"BM25 ({bm25['source']}): {bm25['documents']} documents, vocabulary {bm25['vocabulary_size']}, "
+          f"~{_format_bytes(bm25['memory_bytes_estimate'])}")
+    memory = stats["memory"]
+    print(f"Memory: vectors {_format_bytes(memory['vector_bytes'])} (dim {memory['embedding_dimension']}), "
+          f"documents ~{_format_bytes(memory['document_bytes_estimate'])}, "
+          f"metadata ~{_format_bytes(memory['metadata_bytes_estimate'])}, "
+          f"total ~{_format_bytes(memory['total_bytes_estimate'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Phiên bản hóa collection Chroma theo embedding model (blue/green re-embedding).
+
+Registry (file JSON) ghi collection đang phục vụ search cùng embedding model của nó. Khi
+``EMBEDDING_MODEL`` khác model của collection đang active, một collection mới được dựng ở
+background bằng cách embed lại text đã lưu sẵn trong collection cũ (không phải OCR/trích xuất
+lại file). Trong lúc dựng, search vẫn chạy trên collection cũ và các upload mới được ghi song
+song vào cả hai; khi xong, retriever và indexer được chuyển sang collection mới cùng lúc.
+"""
+import os
+import re
+import json
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+import chromadb
+from sentence_transformers import SentenceTransformer
+from config import settings
+from indexing.embedding_queue import EmbeddingQueue
+from indexing.embedding_cache import EmbeddingCache
+from indexing.chroma_writer import ChromaBatchWriter
+
+logger = logging.getLogger(__name__)
+
+# Model mà indexer dùng cố định trước khi có registry; collection cũ không ghi lại model nên mặc định là model này
+LEGACY_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+def create_chroma_client():
+    if settings.CHROMA_SERVER_HOST and settings.CHROMA_SERVER_PORT:
+        return chromadb.HttpClient(host=settings.CHROMA_SERVER_HOST, port=int(settings.CHROMA_SERVER_PORT))
+    return chromadb.PersistentClient(path=str(settings.CHROMA_DB_PATH))
+
+
+def versioned_collection_name(base_name: str, model_name: str) -> str:
+    """Tên collection cho một phiên bản index, vd. learning_docs__all-mpnet-base-v2__20240101120000.
+
+    Chroma giới hạn tên 3-63 ký tự [a-zA-Z0-9._-], bắt đầu và kết thúc bằng chữ/số.
+    """
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    slug = re.sub(r'[^a-zA-Z0-9]+', '-', model_name.split('/')[-1]).strip('-').lower() or "model"
+    max_slug = max(1, 63 - len(base_name) - len(stamp) - 4)
+    return f"{base_name}__{slug[:max_slug].strip('-')}__{stamp}"
+
+
+class IndexRegistry:
+    """Lưu collection đang active, lịch sử các phiên bản và tiến độ lần rebuild gần nhất."""
+
+    def __init__(self, path: str = settings.INDEX_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data: Dict[str, Any] = {"active": None, "build": None, "history": []}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data.update(json.load(f))
+
+    def active(self) -> Optional[Dict[str, Any]]:
+        return self.data.get("active")
+
+    def build(self) -> Optional[Dict[str, Any]]:
+        return self.data.get("build")
+
+    def set_active(self, collection_name: str, model_name: str):
+        with self._lock:
+            previous = self.data.get("active")
+            if previous:
+                self.data["history"].append(previous)
+            self.data["active"] = {
+                "collection": collection_name,
+                "model": model_name,
+                "activated_at": datetime.now(timezone.utc).isoformat(),
+            }
+            self._save()
+
+    def update_build(self, **fields):
+        with self._lock:
+            if fields.get("status") == "building" and "started_at" not in fields:
+                fields["started_at"] = datetime.now(timezone.utc).isoformat()
+            self.data["build"] = {**(self.data.get("build") or {}), **fields}
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def resolve_active_index(client, registry: IndexRegistry) -> Dict[str, Any]:
+    """Trả về collection/model đang active, khởi tạo registry ở lần chạy đầu tiên.
+
+    Lần đầu: collection là CHROMA_COLLECTION; model lấy từ metadata của collection nếu có,
+    collection rỗng thì dùng luôn EMBEDDING_MODEL, còn lại là model cũ mà indexer từng dùng.
+    """
+    active = registry.active()
+    if active:
+        return active
+
+    model_name = settings.EMBEDDING_MODEL
+    try:
+        collection = client.get_collection(name=settings.CHROMA_COLLECTION)
+        if collection.count() > 0:
+            model_name = (collection.metadata or {}).get("embedding_model", LEGACY_EMBEDDING_MODEL)
+    except Exception:
+        pass  # Chưa có collection: sẽ được tạo với EMBEDDING_MODEL
+    registry.set_active(settings.CHROMA_COLLECTION, model_name)
+    return registry.active()
+
+
+class IndexVersionManager:
+    """Dựng lại index bằng embedding model mới ở background rồi chuyển retriever/indexer sang."""
+
+    def __init__(self, client, indexer, retriever, registry: Optional[IndexRegistry] = None,
+                 batch_size: int = settings.INDEX_REBUILD_BATCH_SIZE):
+        self.client = client
+        self.indexer = indexer
+        self.retriever = retriever
+        self.registry = registry or IndexRegistry()
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_building(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": self.registry.active(),
+            "build": self.registry.build(),
+            "building": self.is_building,
+            "configured_model": settings.EMBEDDING_MODEL,
+        }
+
+    def ensure_current_model(self) -> Optional[Dict[str, Any]]:
+        """Tiếp tục lần rebuild bị ngắt, hoặc bắt đầu rebuild nếu EMBEDDING_MODEL đã đổi."""
+        build = self.registry.build()
+        if build and build.get("status") == "building":
+            logger.info(f"Resuming interrupted index rebuild into {build['collection']}")
+            return self._start(build["collection"], build["model"], resume_from=build.get("done", 0))
+        if self.registry.active()["model"] != settings.EMBEDDING_MODEL:
+            logger.warning(f"Active index uses {self.registry.active()['model']}, "
+                           f"EMBEDDING_MODEL is {settings.EMBEDDING_MODEL}: starting background rebuild")
+            return self.start_rebuild(settings.EMBEDDING_MODEL)
+        return None
+
+    def start_rebuild(self, model_name: str) -> Dict[str, Any]:
+        """Bắt đầu dựng collection mới cho model_name; RuntimeError nếu đang có lần rebuild khác chạy."""
+        if self.is_building:
+            raise RuntimeError("An index rebuild is already running")
+        target = versioned_collection_name(settings.CHROMA_COLLECTION, model_name)
+        return self._start(target, model_name)
+
+    def _start(self, target: str, model_name: str, resume_from: int = 0) -> Dict[str, Any]:
+        with self._lock:
+            if self.is_building:
+                raise RuntimeError("An index rebuild is already running")
+            source = self.registry.active()["collection"]
+            self.registry.update_build(collection=target, model=model_name, source=source,
+                                       status="building", done=resume_from, error=None, finished_at=None)
+            self._thread = threading.Thread(target=self._run_build, args=(source, target, model_name, resume_from),
+                                            name="index-rebuild", daemon=True)
+            self._thread.start()
+        return self.status()
+
+    def _run_build(self, source_name: str, target_name: str, model_name: str, offset: int):
+        try:
+            model = SentenceTransformer(model_name)
+            # Rebuild bị ngắt rồi chạy tiếp không phải embed lại phần đã làm
+            embedder = EmbeddingQueue(model, cache=EmbeddingCache(model_name) if settings.EMBEDDING_CACHE_ENABLED else None)
+            target = self.client.get_or_create_collection(name=target_name, metadata={"embedding_model": model_name})
+            # Upload mới từ thời điểm này được ghi vào cả hai collection
+            self.indexer.attach_shadow_collection(target, embedder)
+
+            source = self.client.get_collection(name=source_name)
+            total = source.count()
+            self.registry.update_build(total=total)
+            logger.info(f"Re-embedding {total} chunks from {source_name} into {target_name} with {model_name}")
+            writer = ChromaBatchWriter(target)
+            # Trang tiếp theo được đọc + embed trong lúc trang trước đang ghi; tiến độ chỉ tính phần đã ghi xong
+            pending, pending_end = [], offset
+            while True:
+                # Rebuild là tác vụ bulk: nhường CPU cho truy vấn giống như index upload. Slot chỉ giữ khi
+                # đọc một trang, không giữ khi chờ embed, để upload mới không phải chờ cả lần rebuild
+                with self.indexer.bulk_slot():
+                    page = source.get(limit=self.batch_size, offset=offset, include=["documents", "metadatas"])
+                ids = page.get("ids") or []
+                if not ids:
+                    break
+                documents = [doc or "" for doc in page["documents"]]
+                futures = writer.submit(ids, documents, embedder.encode(documents), page["metadatas"])
+                self.indexer.bulk_checkpoint()
+                offset += len(ids)
+                ChromaBatchWriter.wait(pending)
+                self.registry.update_build(done=pending_end, total=max(total, offset))
+                pending, pending_end = futures, offset
+            ChromaBatchWriter.wait(pending)
+            writer.close()
+            self.registry.update_build(done=offset, total=max(total, offset), writes=writer.throughput())
+
+            # Retriever chuyển trước (collection mới đã đủ dữ liệu nhờ ghi song song), sau đó indexer
+            self.retriever.switch_collection(target_name, model_name, model=model)
+            self.indexer.promote_shadow_collection(target_name, model_name)
+            self.registry.set_active(target_name, model_name)
+            self.registry.update_build(status="completed", finished_at=datetime.now(timezone.utc).isoformat())
+            logger.info(f"Index rebuild completed, now serving from {target_name}")
+        except Exception as e:
+            logger.error(f"Index rebuild into {target_name} failed: {e}")
+            self.indexer.detach_shadow_collection()
+            self.registry.update_build(status="failed", error=str(e), finished_at=datetime.now(timezone.utc).isoformat())
@@ -0,0 +1,151 @@
+import os
+import gzip
+import json
+import hashlib
+from pathlib import Path
+from typing import List, Optional, Dict
+from mistralai import Mistral
+from config import settings
+
+
+class OCRPageCache:
+    """Cache kết quả OCR theo từng trang trên đĩa.
+
+    Key = (backend, SHA-256 nội dung file, số trang). Mỗi trang được lưu thành
+    một file markdown nén gzip; ``manifest.json`` được ghi sau cùng và đóng vai
+    trò đánh dấu cache đã đầy đủ.
+    """
+
+    def __init__(self, cache_dir: str = settings.OCR_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def hash_file(file_path: str, block_size: int = 1024 * 1024) -> str:
+        """Tính SHA-256 của file theo từng block để không phải đọc cả file vào RAM."""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _entry_dir(self, backend: str, content_hash: str) -> Path:
+        return self.cache_dir / backend / content_hash[:2] / content_hash
+
+    @staticmethod
+    def _page_file(entry_dir: Path, page_num: int) -> Path:
+        return entry_dir / f"page_{page_num:05d}.md.gz"
+
+    def _read_manifest(self, entry_dir: Path) -> Optional[Dict]:
+        manifest_path = entry_dir / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def has_pages(self, backend: str, content_hash: str) -> bool:
+        return self._read_manifest(self._entry_dir(backend, content_hash)) is not None
+
+    def page_count(self, backend: str, content_hash: str) -> Optional[int]:
+        """Số trang theo manifest nếu cache đầy đủ (mọi file trang đều có), ngược lại None."""
+        entry_dir = self._entry_dir(backend, content_hash)
+        manifest = self._read_manifest(entry_dir)
+        if manifest is None or not isinstance(manifest.get("page_count"), int):
+            return None
+        page_count = manifest["page_count"]
+        if not all(self._page_file(entry_dir, page_num).exists() for page_num in range(1, page_count + 1)):
+            return None
+        return page_count
+
+    def get_page(self, backend: str, content_hash: str, page_num: int) -> Optional[str]:
+        """Đọc một trang (bắt đầu từ 1) đã cache, trả về None nếu chưa có."""
+        page_file = self._page_file(self._entry_dir(backend, content_hash), page_num)
+        try:
+            with gzip.open(page_file, "rt", encoding="utf-8") as f:
+                return f.read()
+        except (OSError, EOFError, UnicodeDecodeError):  # thiếu file, gzip hỏng hoặc ghi dở
+            return None
+
+    def get_pages(self, backend: str, content_hash: str) -> Optional[List[str]]:
+        """Trả về toàn bộ trang đã cache, hoặc None nếu cache thiếu/hỏng."""
+        manifest = self._read_manifest(self._entry_dir(backend, content_hash))
+        if manifest is None:
+            return None
+        pages = []
+        for page_num in range(1, manifest.get("page_count", 0) + 1):
+            page = self.get_page(backend, content_hash, page_num)
+            if page is None:
+                return None
+            pages.append(page)
+        return pages
+
+    def put_pages(self, backend: str, content_hash: str, pages: List[str], source: Optional[str] = None):
+        """Ghi các trang vào cache. Manifest được ghi cuối cùng (atomic) sau khi mọi trang đã có."""
+        entry_dir = self._entry_dir(backend, content_hash)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        for page_num, page in enumerate(pages, 1):
+            with gzip.open(self._page_file(entry_dir, page_num), "wt", encoding="utf-8") as f:
+                f.write(page or "")
+
+        manifest = {
+            "backend": backend,
+            "content_hash": content_hash,
+            "page_count": len(pages),
+            "source": os.path.basename(source) if source else None,
+        }
+        tmp_path = entry_dir / "manifest.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, entry_dir / "manifest.json")
+
+
+class MistralOCRClient:
+    """OCR PDF qua Mistral OCR API, trả về markdown theo từng trang."""
+
+    backend = "mistral"
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "mistral-ocr-latest"):
+        self.api_key = api_key
+        self.model = model
+        self.client = None
+
+    def extract_pages(self, file_path: str) -> List[str]:
+        if self.client is None:
+            self.client = Mistral(api_key=self.api_key or os.getenv("MISTRAL_API_KEY"))
+        pdf_file = Path(file_path)
+        uploaded_file = self.client.files.upload(file={"file_name": pdf_file.name, "content": pdf_file.read_bytes()}, purpose="ocr")
+        signed_url = self.client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
+        ocr_response = self.client.ocr.process(model=self.model, document={"type": "document_url", "document_url": signed_url.url})
+        return [page.markdown for page in ocr_response.pages]
+
+
+class LocalOCRClient:
+    """Client OCR cục bộ, không gọi mạng - dùng để test/chạy offline.
+
+    Nếu truyền ``pages`` thì luôn trả về các trang đó (stub), ngược lại lấy lớp
+    text của PDF bằng PyMuPDF. ``calls`` đếm số lần trích xuất thực sự.
+    """
+
+    backend = "local"
+
+    def __init__(self, pages: Optional[List[str]] = None):
+        self.pages = pages
+        self.calls = 0
+
+    def extract_pages(self, file_path: str) -> List[str]:
+        self.calls += 1
+        if self.pages is not None:
+            return list(self.pages)
+        import fitz  # PyMuPDF
+        with fitz.open(file_path) as doc:
+            return [page.get_text() for page in doc]
+
+
+def get_ocr_client(backend: str = settings.OCR_BACKEND):
+    """Tạo OCR client theo cấu hình OCR_BACKEND ('mistral' hoặc 'local')."""
+    if backend == "local":
+        return LocalOCRClient()
+    return MistralOCRClient()
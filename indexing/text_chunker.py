@@ -0,0 +1,109 @@
+from typing import List, Optional, Tuple
+
+Span = Tuple[int, int]
+
+
+class TextChunker:
+    """Chia văn bản thành chunk theo ký tự, làm việc trên offset (start, end) thay vì copy chuỗi.
+
+    Cho ra cùng ranh giới chunk với ``RecursiveCharacterTextSplitter`` của langchain với
+    cấu hình indexer đang dùng (separators mặc định, keep_separator=True, strip_whitespace=True,
+    length_function=len). Vì separator được giữ lại ở đầu mỗi phần, mọi chunk là một đoạn
+    liên tục của văn bản gốc nên start_index chính là offset thật của chunk.
+    """
+
+    DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, separators: Optional[List[str]] = None):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must not be larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or self.DEFAULT_SEPARATORS
+
+    def split_spans(self, text: str) -> List[Span]:
+        """Trả về danh sách (start, end) của các chunk trong ``text``."""
+        return self._split(text, 0, len(text), self.separators)
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def create_chunks(self, text: str) -> List[Tuple[int, str]]:
+        """Trả về danh sách (start_index, nội dung chunk)."""
+        return [(start, text[start:end]) for start, end in self.split_spans(text)]
+
+    @staticmethod
+    def _strip(text: str, start: int, end: int) -> Span:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return start, end
+
+    @staticmethod
+    def _split_on(text: str, start: int, end: int, separator: str) -> List[Span]:
+        """Tách [start, end) tại mỗi lần xuất hiện của separator, giữ separator ở đầu phần sau."""
+        if not separator:
+            return [(i, i + 1) for i in range(start, end)]
+        spans = []
+        piece_start = start
+        pos = text.find(separator, start, end)
+        while pos != -1:
+            if pos > piece_start:
+                spans.append((piece_start, pos))
+            piece_start = pos
+            pos = text.find(separator, pos + len(separator), end)
+        if end > piece_start:
+            spans.append((piece_start, end))
+        return spans
+
+    def _split(self, text: str, start: int, end: int, separators: List[str]) -> List[Span]:
+        # Chọn separator đầu tiên xuất hiện trong đoạn văn bản
+        separator = separators[-1]
+        new_separators: List[str] = []
+        for i, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                new_separators = separators[i + 1:]
+                break
+
+        final_chunks: List[Span] = []
+        good_splits: List[Span] = []
+        for split_start, split_end in self._split_on(text, start, end, separator):
+            if split_end - split_start < self.chunk_size:
+                good_splits.append((split_start, split_end))
+                continue
+            if good_splits:
+                final_chunks.extend(self._merge(text, good_splits))
+                good_splits = []
+            if not new_separators:
+                final_chunks.append((split_start, split_end))
+            else:
+                final_chunks.extend(self._split(text, split_start, split_end, new_separators))
+        if good_splits:
+            final_chunks.extend(self._merge(text, good_splits))
+        return final_chunks
+
+    def _merge(self, text: str, splits: List[Span]) -> List[Span]:
+        """Gộp các phần liên tiếp thành chunk <= chunk_size, giữ phần gối đầu <= chunk_overlap."""
+        chunks: List[Span] = []
+        first = 0  # chỉ số phần đầu tiên của chunk hiện tại trong splits
+        total = 0
+        for i, (split_start, split_end) in enumerate(splits):
+            length = split_end - split_start
+            if total + length > self.chunk_size and i > first:
+                chunk = self._strip(text, splits[first][0], splits[i - 1][1])
+                if chunk[1] > chunk[0]:
+                    chunks.append(chunk)
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    total -= splits[first][1] - splits[first][0]
+                    first += 1
+            total += length
+        if first < len(splits):
+            chunk = self._strip(text, splits[first][0], splits[-1][1])
+            if chunk[1] > chunk[0]:
+                chunks.append(chunk)
+        return chunks
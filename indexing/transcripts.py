@@ -0,0 +1,111 @@
+"""Đọc transcript speech-to-text (CSV/TXT) thành các cửa sổ thời gian để index.
+
+Hỗ trợ hai định dạng đang có trong repo:
+- CSV: một cột khoảng thời gian dạng ``"0.0-30.0"`` (vd. cột ``timelape``) và cột nội dung.
+- TXT: mỗi dòng là một dict Python ``{'timestamp': (0.0, 30.0), 'text': '...'}``.
+
+Các đoạn liên tiếp được gộp tới chunk_size ký tự; đoạn dài hơn chunk_size được chia nhỏ và
+thời gian của từng phần được nội suy theo vị trí ký tự.
+"""
+import re
+import csv
+import ast
+from typing import Iterator, Dict, Any, Optional, Iterable
+from config import settings
+from indexing.text_chunker import TextChunker
+
+TIME_RANGE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*-\s*(\d+(?:\.\d+)?)\s*$')
+
+
+def _parse_txt_line(line: str) -> Optional[Dict[str, Any]]:
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        record = ast.literal_eval(line)
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(record, dict) or "text" not in record:
+        return None
+    try:
+        if "timestamp" in record:
+            start, end = record["timestamp"]
+        else:
+            start, end = record.get("start"), record.get("end")
+        if start is None:
+            return None
+        start, end = float(start), float(end if end is not None else start)
+    except (TypeError, ValueError):
+        # timestamp không phải cặp số (vd. None, một phần tử, chuỗi): bỏ qua dòng như các dòng hỏng khác
+        return None
+    return {"start": start, "end": end, "text": str(record["text"]).strip()}
+
+
+def is_transcript_file(file_path: str) -> bool:
+    """File .txt là transcript nếu dòng không rỗng đầu tiên là một segment hợp lệ."""
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            if line.strip():
+                return _parse_txt_line(line) is not None
+    return False
+
+
+def iter_transcript_segments(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Đọc lần lượt từng segment {start, end, text} (giây) mà không load cả file."""
+    with open(file_path, "r", encoding="utf-8", errors="ignore", newline="") as f:
+        if file_path.lower().endswith(".csv"):
+            for row in csv.reader(f):
+                # Cột đầu tiên có dạng "start-end" là cột thời gian; các cột còn lại là nội dung (bỏ qua header)
+                for i, cell in enumerate(row):
+                    match = TIME_RANGE_PATTERN.match(cell)
+                    if match:
+                        text = " ".join(part.strip() for j, part in enumerate(row) if j != i and part.strip())
+                        if text:
+                            yield {"start": float(match.group(1)), "end": float(match.group(2)), "text": text}
+                        break
+        else:
+            for line in f:
+                segment = _parse_txt_line(line)
+                if segment and segment["text"]:
+                    yield segment
+
+
+def iter_transcript_windows(segments: Iterable[Dict[str, Any]], chunk_size: int = settings.CHUNK_SIZE,
+                            max_window_seconds: float = settings.TRANSCRIPT_MAX_WINDOW_SECONDS) -> Iterator[Dict[str, Any]]:
+    """Gộp các segment liên tiếp thành cửa sổ {start, end, text} dài tối đa chunk_size ký tự."""
+    chunker = TextChunker(chunk_size=chunk_size, chunk_overlap=0)
+    window: Optional[Dict[str, Any]] = None
+
+    for segment in segments:
+        pieces = [segment]
+        if len(segment["text"]) > chunk_size:
+            # Nội suy thời gian của từng phần theo vị trí ký tự trong segment
+            text, duration = segment["text"], segment["end"] - segment["start"]
+            pieces = [{
+                "start": segment["start"] + duration * start / len(text),
+                "end": segment["start"] + duration * end / len(text),
+                "text": text[start:end],
+            } for start, end in chunker.split_spans(text)]
+
+        for piece in pieces:
+            if window is not None and (
+                len(window["text"]) + 1 + len(piece["text"]) > chunk_size
+                or piece["end"] - window["start"] > max_window_seconds
+            ):
+                yield window
+                window = None
+            if window is None:
+                window = dict(piece)
+            else:
+                window["text"] = f"{window['text']} {piece['text']}"
+                window["end"] = piece["end"]
+
+    if window is not None:
+        yield window
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
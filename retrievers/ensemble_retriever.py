@@ -1,12 +1,13 @@
 import re
 import json
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import threading
 from typing import List, Dict, Optional, Any
 import chromadb
 from sentence_transformers import SentenceTransformer, util
 from rank_bm25 import BM25Okapi
 from config import settings
+from utils.tracing import tracer
 
 class EnsembleRetriever:
     """Retrieves documents using vector search (ChromaDB) and BM25 search."""
@@ -23,8 +24,11 @@ class EnsembleRetriever:
         self.collection = None
         self.bm25 = None
         self.bm25_docs = []
+        # Giữ cho (collection, model) và (bm25, bm25_docs) luôn được đọc/thay cùng nhau khi switch_collection
+        self._swap_lock = threading.Lock()
         
         # Load SentenceTransformer model
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
         
         # Connect to ChromaDB
@@ -49,12 +53,16 @@ class EnsembleRetriever:
         """Loads documents from Chroma and initializes BM25 index."""
         if not self.collection:
             return
-        
+        self.bm25, self.bm25_docs = self._build_bm25(self.collection)
+
+    def _build_bm25(self, collection):
+        """Builds a BM25 index over the documents of a collection. Returns (bm25, bm25_docs)."""
         # Fetch all documents (limit by max_docs_bm25)
         # Chroma get() without ids returns all if limit is not set? Default limit is none?
         # Use limit=self.max_docs_bm25
+        bm25, bm25_docs = None, []
         try:
-            results = self.collection.get(
+            results = collection.get(
                 limit=self.max_docs_bm25, 
                 include=["documents", "metadatas"]
             )
@@ -64,27 +72,47 @@ class EnsembleRetriever:
             ids = results.get("ids", [])
             
             if not docs:
-                return
+                return bm25, bm25_docs
 
-            self.bm25_docs = []
             for i, doc_text in enumerate(docs):
                 meta = metadatas[i] if i < len(metadatas) else {}
                 # Ensure metadata has the structure expected by the rest of the app
                 # Indexer stores 'metadata' as a json string inside the metadata dict
                 # We normalize it here
-                self.bm25_docs.append({
+                bm25_docs.append({
                     "id": ids[i],
                     "text": doc_text,
-                    "metadata": meta.get("metadata", "{}") # Default to empty json string
+                    "metadata": meta.get("metadata", "{}"), # Default to empty json string
+                    "fields": meta  # Field phẳng (source, chapter, section...) để lọc giống `where` của Chroma
                 })
                 
-            if self.bm25_docs:
-                tokenized_corpus = [self._preprocess_text(doc["text"]) for doc in self.bm25_docs]
+            if bm25_docs:
+                tokenized_corpus = [self._preprocess_text(doc["text"]) for doc in bm25_docs]
+                # Bỏ tài liệu không có token ở cả corpus lẫn bm25_docs để vị trí điểm BM25 khớp với bm25_docs
+                bm25_docs = [doc for doc, tokens in zip(bm25_docs, tokenized_corpus) if tokens]
                 valid_corpus = [tokens for tokens in tokenized_corpus if tokens]
                 if valid_corpus:
-                    self.bm25 = BM25Okapi(valid_corpus)
+                    bm25 = BM25Okapi(valid_corpus)
         except Exception as e:
             print(f"Error initializing BM25: {e}")
+        return bm25, bm25_docs
+
+    def switch_collection(self, collection_name: str, model_name: str, model: Optional[SentenceTransformer] = None):
+        """Chuyển sang collection/embedding model khác (vd. sau khi re-embed xong).
+
+        Model, collection và BM25 mới được chuẩn bị đầy đủ trước, trong lúc đó search vẫn phục vụ
+        từ collection cũ; sau đó mọi tham chiếu được thay cùng lúc.
+        """
+        new_model = model or SentenceTransformer(model_name)
+        collection = self.client.get_collection(name=collection_name)
+        bm25, bm25_docs = self._build_bm25(collection)
+        with self._swap_lock:
+            self.collection_name = collection_name
+            self.model_name = model_name
+            self.model = new_model
+            self.collection = collection
+            self.bm25, self.bm25_docs = bm25, bm25_docs
+        print(f"Retriever switched to collection {collection_name} ({model_name})")
 
     def _preprocess_text(self, text: str) -> List[str]:
         """Preprocesses text for BM25."""
@@ -99,38 +127,46 @@ class EnsembleRetriever:
             return []
 
         effective_top_k = top_k or self.top_k
-        loop = asyncio.get_running_loop()
-        
-        with ThreadPoolExecutor() as executor:
+
+        with tracer.span("retriever.search", top_k=effective_top_k) as span:
+            # asyncio.to_thread chạy trên executor mặc định của loop: khi search bị hủy (vd. truy xuất
+            # suy đoán bị bỏ) loop không phải chờ thread xong; contextvars được sao chép nên span
+            # trong thread là con của retriever.search
             vector_task = None
             if self.collection:
-                vector_task = loop.run_in_executor(executor, self._vector_search_sync, query, effective_top_k, filter_metadata)
-            
+                vector_task = asyncio.to_thread(self._vector_search_sync, query, effective_top_k, filter_metadata)
+
             bm25_task = None
             if self.bm25:
-                bm25_task = loop.run_in_executor(executor, self._bm25_search_sync, query, effective_top_k)
+                bm25_task = asyncio.to_thread(self._bm25_search_sync, query, effective_top_k, filter_metadata)
 
             results = await asyncio.gather(
                 vector_task if vector_task else asyncio.sleep(0, result=[]),
                 bm25_task if bm25_task else asyncio.sleep(0, result=[])
             )
 
-        vector_results = results[0]
-        bm25_results = results[1]
-        
-        if not vector_results and not bm25_results:
-            return []
+            vector_results = results[0]
+            bm25_results = results[1]
+            span.set("vector_results", len(vector_results))
+            span.set("bm25_results", len(bm25_results))
+            
+            if not vector_results and not bm25_results:
+                return []
 
-        combined_results = self._combine_results(vector_results, bm25_results)
-        return self._rerank_results(query, combined_results)[:effective_top_k]
+            combined_results = self._combine_results(vector_results, bm25_results)
+            with tracer.span("retriever.rerank", candidates=len(combined_results)):
+                return self._rerank_results(query, combined_results)[:effective_top_k]
 
     def _vector_search_sync(self, query: str, top_k: int, filter_metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        if not self.collection:
+        with self._swap_lock:
+            collection, model = self.collection, self.model
+        if not collection:
             print("Warning: Chroma collection not available for vector search.")
             return []
 
         # Generate query embedding
-        query_embedding = self.model.encode(query, normalize_embeddings=True).tolist()
+        with tracer.span("retriever.embed_query"):
+            query_embedding = model.encode(query, normalize_embeddings=True).tolist()
         
         # Build filter if needed (Chroma filter syntax)
         # Assuming filter_metadata is a simple dict of exact matches
@@ -146,12 +182,13 @@ class EnsembleRetriever:
                  chroma_filter = {"$and": [{k: v} for k, v in filter_metadata.items()]}
 
         try:
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                where=chroma_filter,
-                include=["documents", "metadatas", "distances"]
-            )
+            with tracer.span("retriever.chroma_query", n_results=top_k):
+                results = collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=top_k,
+                    where=chroma_filter,
+                    include=["documents", "metadatas", "distances"]
+                )
         except Exception as e:
             print(f"Error during Chroma search: {e}")
             return []
@@ -184,28 +221,36 @@ class EnsembleRetriever:
                 
         return output
 
-    def _bm25_search_sync(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+    def _bm25_search_sync(self, query: str, top_k: int, filter_metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
         """Synchronous BM25 search."""
-        if not self.bm25 or not self.bm25_docs:
+        with self._swap_lock:
+            bm25, bm25_docs = self.bm25, self.bm25_docs
+        if not bm25 or not bm25_docs:
             return []
         
         tokenized_query = self._preprocess_text(query)
         if not tokenized_query:
             return []
         
-        bm25_scores = self.bm25.get_scores(tokenized_query)
-        # Get indices of top k scores
-        top_indices = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)[:top_k]
+        with tracer.span("retriever.bm25", documents=len(bm25_docs)):
+            bm25_scores = bm25.get_scores(tokenized_query)
+            candidates = range(len(bm25_scores))
+            if filter_metadata:
+                # Cùng ngữ nghĩa với filter của vector search: khớp chính xác mọi field
+                candidates = [i for i in candidates
+                              if all(bm25_docs[i]["fields"].get(k) == v for k, v in filter_metadata.items())]
+            # Get indices of top k scores
+            top_indices = sorted(candidates, key=lambda i: bm25_scores[i], reverse=True)[:top_k]
 
         results = []
         for i in top_indices:
             if bm25_scores[i] > 0:
                  results.append({
-                    "id": self.bm25_docs[i]["id"], 
-                    "text": self.bm25_docs[i]["text"], 
+                    "id": bm25_docs[i]["id"], 
+                    "text": bm25_docs[i]["text"], 
                     "score": bm25_scores[i], 
                     "source": "bm25", 
-                    "metadata": self.bm25_docs[i]["metadata"]
+                    "metadata": bm25_docs[i]["metadata"]
                 })
         return results
 
@@ -242,8 +287,9 @@ class EnsembleRetriever:
             return []
         
         texts = [result["text"] for result in results]
-        query_embedding = self.model.encode(query, normalize_embeddings=True)
-        text_embeddings = self.model.encode(texts, batch_size=32, normalize_embeddings=True)
+        model = self.model
+        query_embedding = model.encode(query, normalize_embeddings=True)
+        text_embeddings = model.encode(texts, batch_size=32, normalize_embeddings=True)
         similarities = util.cos_sim(query_embedding, text_embeddings)[0].cpu().tolist()
 
         processed_results = []
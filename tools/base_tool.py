@@ -30,10 +30,28 @@ class BaseTool(ABC):
         """
         return True
 
+    @property
+    def coalescible(self) -> bool:
+        """
+        Whether identical concurrent calls (same input/options apart from the username)
+        may share one execution. Override with False for tools whose result depends on
+        the calling user (e.g. reading or updating that user's progress).
+        """
+        return True
+
     @abstractmethod
     async def execute(self, assistant: 'LearningAssistant', **kwargs) -> Any:
         """
         Execute the tool asynchronously with the given parameters.
         The assistant instance is passed to access retriever, llm, etc.
+        Per-user side effects belong in apply_side_effects, not here.
         """
         pass
+
+    async def apply_side_effects(self, assistant: 'LearningAssistant', result: Any, **kwargs) -> Any:
+        """
+        Apply per-caller side effects (e.g. saving the result to the user's profile) after
+        execute. Runs once for every caller, including callers that received a result
+        shared with a concurrent identical request. Returns the result to give to this caller.
+        """
+        return result
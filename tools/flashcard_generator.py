@@ -45,8 +45,6 @@ class FlashcardGeneratorTool(BaseTool):
     
     async def execute(self, assistant, **kwargs):
         topic = kwargs.get("question", "")
-        options = kwargs.get("options", {})
-        username = options.get("username", "").strip()
         
         if not topic.strip():
             return "Vui lòng cung cấp chủ đề để tạo flashcard."
@@ -127,23 +125,26 @@ class FlashcardGeneratorTool(BaseTool):
                  print(f"Error parsing flashcard JSON: {e}\nResponse: {cleaned_response}")
                  return {"error": f"Lỗi khi xử lý phản hồi JSON từ AI: {e}"} # Return error dict
 
-            # Lưu flashcards (dưới dạng dict) vào MongoDB nếu có username
-            if username:
-                 try:
-                     # Pass the parsed dictionary directly
-                     self._save_flashcards_to_mongodb(username, topic, flashcard_data)
-                 except Exception as e:
-                     print(f"Error saving flashcards to MongoDB: {str(e)}")
-                     # Add warning to the dict to be returned
-                     flashcard_data["warning"] = "Không thể lưu flashcards vào hồ sơ người dùng."
-            # else: # No local history saving for now if not logged in
-            #     pass
-
             return flashcard_data # Return the parsed dictionary
         except Exception as e:
             print(f"Error generating flashcards for '{topic}': {str(e)}")
             return {"error": f"Lỗi khi tạo flashcard cho '{topic}': {str(e)}"} # Return error dict
 
+    async def apply_side_effects(self, assistant, result, **kwargs):
+        """Lưu flashcards vào hồ sơ của từng người gọi (kể cả khi bộ thẻ được dùng chung)."""
+        topic = kwargs.get("question", "")
+        username = kwargs.get("options", {}).get("username", "").strip()
+        # Lưu flashcards (dưới dạng dict) vào MongoDB nếu có username
+        if username and isinstance(result, dict) and "cards" in result:
+            try:
+                # Pass the parsed dictionary directly
+                self._save_flashcards_to_mongodb(username, topic, result)
+            except Exception as e:
+                print(f"Error saving flashcards to MongoDB: {str(e)}")
+                # Add warning to the dict to be returned
+                result["warning"] = "Không thể lưu flashcards vào hồ sơ người dùng."
+        return result
+
     # Modify save function to accept the dictionary
     def _save_flashcards_to_mongodb(self, username: str, topic: str, flashcard_data: dict):
         """Lưu flashcards (dưới dạng dict) vào MongoDB"""
@@ -60,6 +60,11 @@ class ProgressTrackerTool(BaseTool):
         """Progress tracker doesn't need document context."""
         return False
 
+    @property
+    def coalescible(self) -> bool:
+        """Reads and updates the calling user's own progress, so calls are never shared."""
+        return False
+
     async def execute(self, assistant: 'LearningAssistant', **kwargs) -> Dict:
         """
         Xử lý yêu cầu và trả về kết quả dưới dạng từ điển (không phải JSON string)
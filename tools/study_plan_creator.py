@@ -16,6 +16,8 @@ MONGO_HOST = "localhost"
 MONGO_PORT = 27017
 MONGO_DB_NAME = "edumentor"
 MONGO_COLLECTION_NAME = "stats" # Thống nhất sử dụng collection stats
+# Tiền tố các thông báo lỗi mà execute trả về thay cho kế hoạch (không được lưu vào hồ sơ)
+ERROR_PREFIXES = ("Vui lòng cung cấp", "Không tìm thấy thông tin", "Lỗi khi")
 
 class StudyPlanCreatorTool(BaseTool):
     def __init__(self):
@@ -60,19 +62,10 @@ class StudyPlanCreatorTool(BaseTool):
     async def execute(self, assistant: 'LearningAssistant', **kwargs) -> str:
         subject = kwargs.get("question", "").strip()
         context_str = kwargs.get("context", "") # Context from the graph
-        options = kwargs.get("options", {})
-        username = options.get("username", "").strip()
 
         if not subject:
             return "Vui lòng cung cấp chủ đề để tạo kế hoạch học tập."
             
-        # Bỏ kiểm tra bắt buộc username
-        # if not username:
-        #     return "Vui lòng cung cấp username để lưu kế hoạch học tập."
-            
-        # Nếu không có username, kế hoạch vẫn được tạo nhưng không lưu vào DB
-        save_to_db = bool(username)
-        
         if not context_str:
              # This case should ideally be handled by the graph ensuring context is retrieved
              logger.warning(f"StudyPlanCreator: Context not provided for '{subject}'. Attempting retrieval.")
@@ -108,26 +101,34 @@ class StudyPlanCreatorTool(BaseTool):
             response = await assistant.llm.ainvoke(prompt)
             plan_content = response # Adjust if response structure is different (e.g., response.content)
             logger.info(f"StudyPlanCreator: Plan generated for '{subject}'.")
-
-            # Save the plan to MongoDB only if username is provided
-            if save_to_db:
-                # Sử dụng UserDataManager để lưu kế hoạch học tập
-                success = self.user_data_manager.update_study_plan(username, subject, plan_content)
-                
-                if not success:
-                    logger.warning(f"StudyPlanCreator: Không thể lưu kế hoạch học tập cho '{username}', môn '{subject}'.")
-                    plan_content += "\n\n(Cảnh báo: Không thể lưu kế hoạch vào hồ sơ do lỗi cơ sở dữ liệu.)"
-                else:
-                    logger.info(f"StudyPlanCreator: Đã lưu kế hoạch học tập cho '{username}', môn '{subject}'.")
-            elif not save_to_db:
-                logger.info("StudyPlanCreator: Username không được cung cấp, kế hoạch học tập đã được tạo nhưng không lưu vào database.")
-            
             return plan_content
 
         except Exception as e:
             logger.exception(f"StudyPlanCreator: Error during execution for '{subject}': {e}")
             return f"Lỗi khi tạo kế hoạch học tập cho '{subject}': {str(e)}"
 
+    async def apply_side_effects(self, assistant: 'LearningAssistant', result: Any, **kwargs) -> Any:
+        """Lưu kế hoạch vào hồ sơ của từng người gọi (kể cả khi kế hoạch được dùng chung)."""
+        subject = kwargs.get("question", "").strip()
+        username = kwargs.get("options", {}).get("username", "").strip()
+        plan_content = result
+
+        # Nếu không có username, kế hoạch vẫn được tạo nhưng không lưu vào DB
+        if not username:
+            logger.info("StudyPlanCreator: Username không được cung cấp, kế hoạch học tập đã được tạo nhưng không lưu vào database.")
+            return plan_content
+        if not isinstance(plan_content, str) or plan_content.startswith(ERROR_PREFIXES):
+            return plan_content
+
+        # Sử dụng UserDataManager để lưu kế hoạch học tập
+        success = self.user_data_manager.update_study_plan(username, subject, plan_content)
+        if not success:
+            logger.warning(f"StudyPlanCreator: Không thể lưu kế hoạch học tập cho '{username}', môn '{subject}'.")
+            plan_content += "\n\n(Cảnh báo: Không thể lưu kế hoạch vào hồ sơ do lỗi cơ sở dữ liệu.)"
+        else:
+            logger.info(f"StudyPlanCreator: Đã lưu kế hoạch học tập cho '{username}', môn '{subject}'.")
+        return plan_content
+
     def __del__(self):
         """Ensure MongoDB client is closed when the object is destroyed."""
         if self.mongo_client:
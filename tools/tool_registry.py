@@ -6,7 +6,10 @@ import logging
 from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 import asyncio
+import copy
 from config import settings as config  
+from utils.single_flight import normalize_text, options_key
+from utils.tracing import tracer
 
 
 # --- Logging Setup ---
@@ -95,13 +98,32 @@ class ToolRegistry:
             # return result
 
         logger.info(f"Executing async tool '{name}'...")
-        try:
-            # Gọi trực tiếp hàm async execute
-            result = await execute_method(assistant=self.assistant, **kwargs)
-            logger.info(f"Tool '{name}' execution finished successfully.")
-            return result
-        except Exception as e:
-            logger.exception(f"Error during execution of tool '{name}': {e}")
-            # Trả về lỗi hoặc raise lại tùy theo cách graph xử lý
-            # return f"Error executing tool '{name}': {str(e)}"
-            raise # Raise lại để node trong graph có thể bắt và xử lý
\ No newline at end of file
+        with tracer.span(f"tool.{name}") as span:
+            try:
+                single_flight = getattr(self.assistant, "single_flight", None)
+                if single_flight is not None and tool.coalescible:
+                    # Tham số vô hướng khác (vd. num_results); lịch sử hội thoại là của riêng từng người gọi
+                    extras = {key: value for key, value in kwargs.items()
+                              if key not in ("question", "context", "options", "chat_history")
+                              and isinstance(value, (str, int, float, bool))}
+                    # Các lời gọi trùng (cùng tool, input, ngữ cảnh, options trừ username, phiên bản index)
+                    # đang chạy đồng thời dùng chung một lần execute
+                    key = ("tool", name, normalize_text(kwargs.get("question")), normalize_text(kwargs.get("context")),
+                           options_key(kwargs.get("options")), options_key(extras), await self.assistant.collection_version())
+                    result, shared = await single_flight.run(key, lambda: execute_method(assistant=self.assistant, **kwargs))
+                    span.set("coalesced", shared)
+                    if shared:
+                        logger.info(f"Tool '{name}' result shared with a concurrent identical call.")
+                    # Mỗi người gọi nhận bản sao riêng để side effect của người này không lộ sang người khác
+                    result = copy.deepcopy(result)
+                else:
+                    # Gọi trực tiếp hàm async execute
+                    result = await execute_method(assistant=self.assistant, **kwargs)
+                result = await tool.apply_side_effects(self.assistant, result, **kwargs)
+                logger.info(f"Tool '{name}' execution finished successfully.")
+                return result
+            except Exception as e:
+                logger.exception(f"Error during execution of tool '{name}': {e}")
+                # Trả về lỗi hoặc raise lại tùy theo cách graph xử lý
+                # return f"Error executing tool '{name}': {str(e)}"
+                raise # Raise lại để node trong graph có thể bắt và xử lý
\ No newline at end of file
@@ -31,16 +31,15 @@ const FileUploader = ({ onUploadSuccess }) => {
     const allowedTypes = [
       "application/pdf", // PDF
       "application/vnd.openxmlformats-officedocument.wordprocessingml.document", // DOCX
-      "application/msword", // DOC
       "text/plain", // TXT
       "application/vnd.openxmlformats-officedocument.presentationml.presentation", // PPTX
-      "application/vnd.ms-powerpoint" // PPT
+      "text/csv" // CSV transcript
     ];
 
     const droppedFiles = Array.from(e.dataTransfer.files).filter(
       file => allowedTypes.includes(file.type) ||
         // Kiểm tra phần mở rộng cho trường hợp MIME type không khớp
-        ['.pdf', '.docx', '.doc', '.txt', '.pptx', '.ppt'].some(ext =>
+        ['.pdf', '.docx', '.txt', '.pptx', '.csv'].some(ext =>
           file.name.toLowerCase().endsWith(ext)
         )
     );
@@ -113,7 +112,7 @@ const FileUploader = ({ onUploadSuccess }) => {
           type="file"
           ref={fileInputRef}
           className="hidden"
-          accept=".pdf,.docx,.doc,.txt,.pptx,.ppt"
+          accept=".pdf,.docx,.txt,.pptx,.csv"
           multiple
           onChange={handleFileChange}
         />
@@ -123,10 +122,9 @@ const FileUploader = ({ onUploadSuccess }) => {
         <div className="flex flex-wrap justify-center gap-2 mb-3">
           <span className="bg-blue-900/50 text-blue-300 text-xs px-2 py-1 rounded-full">PDF</span>
           <span className="bg-blue-900/50 text-blue-300 text-xs px-2 py-1 rounded-full">DOCX</span>
-          <span className="bg-blue-900/50 text-blue-300 text-xs px-2 py-1 rounded-full">DOC</span>
           <span className="bg-blue-900/50 text-blue-300 text-xs px-2 py-1 rounded-full">TXT</span>
           <span className="bg-blue-900/50 text-blue-300 text-xs px-2 py-1 rounded-full">PPTX</span>
-          <span className="bg-blue-900/50 text-blue-300 text-xs px-2 py-1 rounded-full">PPT</span>
+          <span className="bg-blue-900/50 text-blue-300 text-xs px-2 py-1 rounded-full">CSV</span>
         </div>
         <p className="text-gray-500 text-sm">hoặc nhấp để chọn file</p>
       </div>
@@ -213,7 +211,7 @@ const FileUploader = ({ onUploadSuccess }) => {
       )}
 
       <div className="mt-6 text-sm text-gray-400">
-        <p>Supported file types: PDF, PPTX, DOCX, TXT</p>
+        <p>Supported file types: PDF, PPTX, DOCX, TXT, CSV (transcript)</p>
         <p>Maximum file size: 10MB</p>
       </div>
     </div>
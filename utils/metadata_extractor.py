@@ -1,8 +1,119 @@
 import os
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Iterable
 from datetime import datetime
 
+# Các pattern được compile một lần ở mức module. Pattern neo đầu dòng có thêm bản bắt đầu bằng
+# "\n" cố định để re của CPython quét nhanh theo ký tự đầu (pattern bắt đầu bằng '^' hay bằng
+# nhiều lựa chọn khác ký tự đầu phải thử ở mọi vị trí).
+_MD_HEADER_PATTERN = re.compile(r'^#\s+(.+)$', re.MULTILINE)
+_MD_HEADER_NL_PATTERN = re.compile(r'\n#\s+(.+)$', re.MULTILINE)
+_UNDERLINE_PATTERN = re.compile(r'^(.+)\n=+\s*$', re.MULTILINE)
+_CAPS_PATTERN = re.compile(r'^([A-Z][A-Z\s]+[A-Z])$', re.MULTILINE)
+_CAPS_NL_PATTERN = re.compile(r'\n([A-Z][A-Z\s]+[A-Z])$', re.MULTILINE)
+# Mỗi marker tách theo ký tự đầu của từ khóa; match sớm nhất trong các pattern là kết quả
+_MARKER_PATTERNS = {
+    "chapter": [re.compile(r'(?:Chapter|CHAPTER|Chương)\s+(\d+|[IVXLCDM]+)')],
+    "section": [re.compile(r'(?:Section|SECTION)\s+(\d+(?:\.\d+)*)'),
+                re.compile(r'(?:Mục|MỤC)\s+(\d+(?:\.\d+)*)')],
+    "part": [re.compile(r'(?:PHẦN|Phần)\s+(\d+|[IVXLCDM]+)'),
+             re.compile(r'(?:BÀI|Bài)\s+(\d+|[IVXLCDM]+)')],
+}
+
+# Dùng cho find_section_boundaries (nhận diện marker ở đầu dòng tiêu đề)
+_HEADING_MD_PATTERN = re.compile(r'^#{1,6}\s+\S')
+_HEADING_UNDERLINE_PATTERN = re.compile(r'^=+\s*$')
+_HEADING_CHAPTER_PATTERN = re.compile(r'(?:Chapter|CHAPTER|Chương|CHƯƠNG)\s+(\d+|[IVXLCDM]+)\b')
+_HEADING_SECTION_PATTERN = re.compile(r'(?:Section|SECTION|Mục|MỤC)\s+(\d+(?:\.\d+)*)\b')
+_HEADING_PART_PATTERN = re.compile(r'(?:PHẦN|Phần|BÀI|Bài)\s+(\d+|[IVXLCDM]+)\b')
+
+
+class _MetadataScanner:
+    """Tìm title và chapter/section/part trên một hoặc nhiều trang (feed lần lượt từng trang).
+
+    Thứ tự ưu tiên của title giữ nguyên như bản cũ: Markdown header > tiêu đề gạch chân >
+    dòng IN HOA > dòng không rỗng đầu tiên (< 100 ký tự). Với mỗi trang chỉ chạy pattern của
+    những field còn thiếu (mỗi pattern dừng ở match đầu tiên), và dừng hẳn khi đã có Markdown
+    header cùng đủ ba marker.
+    """
+
+    def __init__(self):
+        self.md_title: Optional[str] = None
+        self.underline_title: Optional[str] = None
+        self.caps_title: Optional[str] = None
+        self.first_line: Optional[str] = None
+        self.markers: Dict[str, str] = {}
+        self.has_content = False
+
+    @property
+    def done(self) -> bool:
+        return self.md_title is not None and len(self.markers) == len(_MARKER_PATTERNS)
+
+    def feed(self, content: str):
+        if not content:
+            return
+        self.has_content = True
+
+        if self.md_title is None:
+            match = _MD_HEADER_PATTERN.match(content) or _MD_HEADER_NL_PATTERN.search(content)
+            if match:
+                self.md_title = match.group(1).strip()
+        if self.md_title is None and self.underline_title is None:
+            match = self._search_underline(content)
+            if match:
+                self.underline_title = match.group(1).strip()
+        if self.md_title is None and self.underline_title is None and self.caps_title is None:
+            match = _CAPS_PATTERN.match(content) or _CAPS_NL_PATTERN.search(content)
+            if match:
+                self.caps_title = match.group(1).strip()
+        if self.title_candidate() is None:
+            self.first_line = self._first_short_line(content)
+
+        for kind, patterns in _MARKER_PATTERNS.items():
+            if kind in self.markers:
+                continue
+            matches = [match for match in (pattern.search(content) for pattern in patterns) if match]
+            if matches:
+                self.markers[kind] = min(matches, key=lambda match: match.start()).group(0)
+
+    @staticmethod
+    def _search_underline(content: str):
+        # Chỉ thử pattern tại dòng nằm ngay trên một dòng bắt đầu bằng '='
+        pos = content.find('\n=')
+        while pos != -1:
+            match = _UNDERLINE_PATTERN.match(content, content.rfind('\n', 0, pos) + 1)
+            if match:
+                return match
+            pos = content.find('\n=', pos + 1)
+        return None
+
+    @staticmethod
+    def _first_short_line(content: str) -> Optional[str]:
+        # Duyệt từng dòng bằng find thay vì split('\n') cả tài liệu, dừng ở dòng hợp lệ đầu tiên
+        start = 0
+        while start <= len(content):
+            end = content.find('\n', start)
+            if end == -1:
+                end = len(content)
+            line = content[start:end].strip()
+            if line and len(line) < 100:
+                return line
+            start = end + 1
+        return None
+
+    def title_candidate(self) -> Optional[str]:
+        for title in (self.md_title, self.underline_title, self.caps_title, self.first_line):
+            if title is not None:
+                return title
+        return None
+
+    def title(self) -> Optional[str]:
+        if not self.has_content:
+            return None
+        title = self.title_candidate()
+        return title if title is not None else "Unknown Title"
+
+
 class MetadataExtractor:
     @staticmethod
     def extract_metadata(content: str, file_path: Optional[str] = None, file_type: Optional[str] = None) -> Dict[str, Any]:
@@ -17,13 +128,44 @@ class MetadataExtractor:
         Returns:
             Dictionary containing extracted metadata
         """
+        scanner = _MetadataScanner()
+        scanner.feed(content)
+        return MetadataExtractor._build_metadata(scanner, file_path, file_type)
+
+    @staticmethod
+    def extract_metadata_from_pages(pages: Iterable[str], file_path: Optional[str] = None,
+                                    file_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extract metadata from a stream of pages without joining them into one string.
+
+        Pages are consumed lazily and scanning stops as soon as every field is found.
+        Results match ``extract_metadata`` on the concatenated pages, except for matches
+        that would span a page boundary.
+
+        Args:
+            pages: Iterable of page texts (e.g. OCR pages read from the cache)
+            file_path: Path to the source file
+            file_type: Type of the file (pdf, md, txt, etc.)
+
+        Returns:
+            Dictionary containing extracted metadata
+        """
+        scanner = _MetadataScanner()
+        for page in pages:
+            scanner.feed(page)
+            if scanner.done:
+                break
+        return MetadataExtractor._build_metadata(scanner, file_path, file_type)
+
+    @staticmethod
+    def _build_metadata(scanner: _MetadataScanner, file_path: Optional[str], file_type: Optional[str]) -> Dict[str, Any]:
         metadata = {
             "source": os.path.basename(file_path) if file_path else "Unknown",
             "extraction_date": datetime.now().isoformat(),
         }
         
         # Extract title - try different methods based on content
-        title = MetadataExtractor._extract_title(content)
+        title = scanner.title()
         if title:
             metadata["title"] = title
         
@@ -36,64 +178,73 @@ class MetadataExtractor:
             metadata["file_size"] = os.path.getsize(file_path)
         
         # Extract chapter/section information
-        chapter_info = MetadataExtractor._extract_chapter_info(content)
-        if chapter_info:
-            metadata.update(chapter_info)
+        metadata.update(scanner.markers)
             
         return metadata
     
     @staticmethod
     def _extract_title(content: str) -> Optional[str]:
         """Extract the main title from document content"""
-        if not content:
-            return None
-            
-        # Look for Markdown headers (# Title)
-        md_header_match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
-        if md_header_match:
-            return md_header_match.group(1).strip()
-            
-        # Look for underlined headers (Title\n====)
-        underline_match = re.search(r'^(.+)\n=+\s*$', content, re.MULTILINE)
-        if underline_match:
-            return underline_match.group(1).strip()
-        
-        # Look for ALL CAPS titles (common in some documents)
-        caps_match = re.search(r'^([A-Z][A-Z\s]+[A-Z])$', content, re.MULTILINE)
-        if caps_match:
-            return caps_match.group(1).strip()
-        
-        # Default: use first non-empty line as title
-        lines = content.split('\n')
-        for line in lines:
-            line = line.strip()
-            if line and len(line) < 100:  # Reasonable title length
-                return line
-                
-        return "Unknown Title"
+        scanner = _MetadataScanner()
+        scanner.feed(content)
+        return scanner.title()
     
     @staticmethod
     def _extract_chapter_info(content: str) -> Dict[str, Any]:
         """Extract chapter and section information from content"""
-        chapter_info = {}
-        
-        # Look for chapter patterns like "Chapter X" or "Section X"
-        chapter_match = re.search(r'(?:Chapter|CHAPTER|Chương)\s+(\d+|[IVXLCDM]+)', content)
-        if chapter_match:
-            chapter_info["chapter"] = chapter_match.group(0)
-            
-        # Look for section patterns
-        section_match = re.search(r'(?:Section|SECTION|Mục|MỤC)\s+(\d+(?:\.\d+)*)', content)
-        if section_match:
-            chapter_info["section"] = section_match.group(0)
-            
-        # Look for Vietnamese-specific patterns (like "PHẦN", "BÀI")
-        vn_section_match = re.search(r'(?:PHẦN|Phần|BÀI|Bài)\s+(\d+|[IVXLCDM]+)', content)
-        if vn_section_match:
-            chapter_info["part"] = vn_section_match.group(0)
-            
-        return chapter_info
+        scanner = _MetadataScanner()
+        scanner.feed(content)
+        return dict(scanner.markers)
     
+    @staticmethod
+    def find_section_boundaries(content: str) -> List[Dict[str, Any]]:
+        """
+        Find heading lines that open a new section of the document.
+
+        Recognises the same markers as ``extract_metadata``: Markdown headers, underlined
+        titles, ``Chapter``/``Chương``, ``Section``/``Mục`` and ``PHẦN``/``BÀI`` lines.
+
+        Args:
+            content: The text content of the document (or of one page)
+
+        Returns:
+            List of boundaries in document order. Each has ``start`` (offset of the heading
+            line) and ``section_title``, plus ``chapter``, ``section`` or ``part`` when the
+            heading carries such a marker.
+        """
+        boundaries = []
+        lines = content.split('\n')
+        offset = 0
+        for i, line in enumerate(lines):
+            line_start = offset
+            offset += len(line) + 1
+            stripped = line.strip()
+            if not stripped or len(stripped) >= 100:
+                continue
+
+            is_md_header = _HEADING_MD_PATTERN.match(stripped) is not None
+            is_underlined = i + 1 < len(lines) and _HEADING_UNDERLINE_PATTERN.match(lines[i + 1]) is not None
+            # Bỏ ký hiệu markdown (#, **) để nhận diện "Chương 2", "Mục 1.3"... ở đầu dòng
+            heading_text = stripped.lstrip('#').strip().strip('*').strip()
+            boundary: Dict[str, Any] = {}
+
+            chapter_match = _HEADING_CHAPTER_PATTERN.match(heading_text)
+            if chapter_match:
+                boundary["chapter"] = chapter_match.group(0)
+            section_match = _HEADING_SECTION_PATTERN.match(heading_text)
+            if section_match:
+                boundary["section"] = section_match.group(0)
+            vn_section_match = _HEADING_PART_PATTERN.match(heading_text)
+            if vn_section_match:
+                boundary["part"] = vn_section_match.group(0)
+
+            if not (boundary or is_md_header or is_underlined):
+                continue
+            boundary["start"] = line_start
+            boundary["section_title"] = heading_text
+            boundaries.append(boundary)
+        return boundaries
+
     @staticmethod
     def enrich_chunk_metadata(chunk_text: str, source_metadata: Dict[str, Any], 
                              chunk_index: int, total_chunks: int) -> Dict[str, Any]:
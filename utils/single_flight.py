@@ -0,0 +1,59 @@
+import json
+import asyncio
+import unicodedata
+from typing import Dict, Any, Callable, Awaitable, Hashable, Optional, Tuple
+
+# Các option chỉ định người gọi, không ảnh hưởng tới kết quả dùng chung
+_CALLER_OPTIONS = ("username", "user_id")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Chuẩn hóa câu hỏi/đầu vào để các request chỉ khác hoa thường, khoảng trắng hay cách gõ dấu trùng key."""
+    return " ".join(unicodedata.normalize("NFC", text or "").casefold().split())
+
+
+def options_key(options: Optional[Dict[str, Any]]) -> str:
+    """Biểu diễn ổn định của options, bỏ các field định danh người gọi."""
+    shared = {key: value for key, value in (options or {}).items() if key not in _CALLER_OPTIONS}
+    return json.dumps(shared, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class SingleFlight:
+    """Gộp các lời gọi trùng key đang chạy đồng thời thành một lần tính.
+
+    Người gọi đầu tiên khởi chạy ``factory()`` thành một task; các người gọi đến sau với cùng key
+    (khi task chưa xong) chờ chính task đó và nhận cùng kết quả (hoặc cùng exception). Task được
+    ``shield`` nên một người gọi bị hủy (timeout, client ngắt kết nối) không làm hỏng kết quả của
+    những người khác. Key bị xóa ngay khi task xong: không có cache, chỉ gộp các request trùng lúc.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "failed": 0}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Trả về (kết quả, shared) với shared=True nếu lời gọi này dùng lại task của người khác."""
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["leaders"] += 1
+            task = asyncio.create_task(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["failed"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self._tasks),
+            "coalesced_ratio": round(self.stats["coalesced"] / calls, 4) if calls else 0.0,
+        }
@@ -0,0 +1,172 @@
+"""Span đo độ trễ từng stage của pipeline (node graph, tool, retriever, LLM, MongoDB).
+
+Mỗi span hoàn tất được ghi vào một ring buffer trong process (TRACE_BUFFER_SIZE span gần nhất), từ đó
+tính p50/p95 theo tên stage và dựng lại từng trace cho admin endpoint. Span cha/con được nối qua
+contextvars, nên hoạt động cả với code async, task tạo bằng asyncio.create_task và asyncio.to_thread
+(với run_in_executor cần chạy hàm qua ``contextvars.copy_context().run``).
+
+Nếu TRACING_OTEL_ENABLED và đã cài opentelemetry-api, mỗi span cũng được tạo qua OpenTelemetry
+tracer; việc export (OTLP, Jaeger...) do TracerProvider mà môi trường cấu hình quyết định, vd. chạy
+bằng ``opentelemetry-instrument`` với các biến OTEL_EXPORTER_*.
+"""
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "attributes", "error", "otel_span")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.start = time.time()
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.otel_span = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+class _NoopSpan:
+    def set(self, key: str, value: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    def __init__(self, enabled: bool = settings.TRACING_ENABLED, buffer_size: int = settings.TRACE_BUFFER_SIZE,
+                 otel_enabled: bool = settings.TRACING_OTEL_ENABLED):
+        self.enabled = enabled
+        # Span được ghi từ cả event loop lẫn các thread (retriever, to_thread) nên ghi/đọc buffer qua lock
+        self._spans: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._otel = None
+        self._otel_trace = None
+        if enabled and otel_enabled:
+            try:
+                from opentelemetry import trace as otel_trace
+                self._otel_trace = otel_trace
+                self._otel = otel_trace.get_tracer("edumentor")
+            except ImportError:
+                logger.warning("TRACING_OTEL_ENABLED is set but opentelemetry-api is not installed, keeping spans in-process only")
+
+    @contextmanager
+    def span(self, name: str, current: bool = True, **attributes) -> Iterator[Any]:
+        """Đo một stage. ``current=False`` cho span không làm cha của các span khác (vd. bao quanh một
+        async generator, nơi code của bên tiêu thụ chạy xen giữa các lần yield)."""
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        parent = _current_span.get()
+        span = Span(name, parent, attributes)
+        token = _current_span.set(span) if current else None
+        otel_span = None
+        if self._otel is not None:
+            parent_context = None
+            if parent is not None and parent.otel_span is not None:
+                parent_context = self._otel_trace.set_span_in_context(parent.otel_span)
+            otel_span = span.otel_span = self._otel.start_span(name, context=parent_context)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if token is not None:
+                try:
+                    _current_span.reset(token)
+                except ValueError:
+                    # Async generator bị đóng từ context khác (vd. client ngắt kết nối giữa stream)
+                    pass
+            record = {
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": name,
+                "start": span.start,
+                "duration_ms": round(duration_ms, 2),
+                "attributes": span.attributes,
+                "error": span.error,
+            }
+            with self._lock:
+                self._spans.append(record)
+            if otel_span is not None:
+                for key, value in span.attributes.items():
+                    if isinstance(value, (str, bool, int, float)):
+                        otel_span.set_attribute(key, value)
+                if span.error:
+                    otel_span.set_attribute("error.type", span.error)
+                otel_span.end()
+
+    def _snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._spans)
+
+    def stage_stats(self, window_seconds: Optional[float] = None, prefix: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """count / p50 / p95 / p99 / max (ms) và số lỗi theo tên span, trong window_seconds gần nhất nếu có."""
+        since = time.time() - window_seconds if window_seconds else 0.0
+        durations: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, int] = defaultdict(int)
+        for record in self._snapshot():
+            if record["start"] < since or (prefix and not record["name"].startswith(prefix)):
+                continue
+            durations[record["name"]].append(record["duration_ms"])
+            if record["error"]:
+                errors[record["name"]] += 1
+        stats = {}
+        for name, values in sorted(durations.items()):
+            ordered = sorted(values)
+            stats[name] = {
+                "count": len(ordered),
+                "p50_ms": round(_percentile(ordered, 0.5), 1),
+                "p95_ms": round(_percentile(ordered, 0.95), 1),
+                "p99_ms": round(_percentile(ordered, 0.99), 1),
+                "max_ms": round(ordered[-1], 1),
+                "errors": errors[name],
+            }
+        return stats
+
+    def recent_traces(self, limit: int = 20, min_duration_ms: float = 0.0) -> List[Dict[str, Any]]:
+        """Các trace gần nhất (span gốc + tổng thời gian), mới nhất trước."""
+        roots = [record for record in self._snapshot()
+                 if record["parent_id"] is None and record["duration_ms"] >= min_duration_ms]
+        roots.sort(key=lambda record: record["start"], reverse=True)
+        return [{"trace_id": root["trace_id"], "name": root["name"], "start": root["start"],
+                 "duration_ms": root["duration_ms"], "error": root["error"]} for root in roots[:limit]]
+
+    def get_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Mọi span còn trong buffer của một trace, theo thứ tự bắt đầu."""
+        spans = [record for record in self._snapshot() if record["trace_id"] == trace_id]
+        spans.sort(key=lambda record: record["start"])
+        return spans
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "buffered_spans": len(self._spans), "buffer_size": self._spans.maxlen,
+                "otel_export": self._otel is not None}
+
+
+tracer = Tracer()
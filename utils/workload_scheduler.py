@@ -0,0 +1,163 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any
+from config import settings
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class WorkloadScheduler:
+    """Ưu tiên truy vấn của người dùng (interactive) hơn việc index tài liệu (bulk).
+
+    - ``interactive()`` bao quanh một request /ask hoặc /tools để đo độ trễ.
+    - ``bulk_slot()`` giới hạn số tác vụ index (upload, rebuild) đang đọc/tách chunk một batch cùng lúc;
+      tác vụ vượt quá phải xếp hàng. Slot không được giữ khi chờ embed, để hàng đợi embedding dùng
+      chung gom được batch của nhiều tài liệu.
+    - ``checkpoint()`` được gọi giữa các batch index: ngủ bù để phần CPU dành cho bulk không
+      vượt quá bulk_cpu_share, và tạm dừng khi p95 độ trễ truy vấn gần đây vượt SLO (tối đa
+      max_pause_seconds mỗi lần để việc index không bị dừng hẳn).
+    """
+
+    def __init__(self, max_bulk_concurrency: int = settings.BULK_MAX_CONCURRENCY,
+                 bulk_cpu_share: float = settings.BULK_CPU_SHARE,
+                 latency_slo_ms: float = settings.ASK_LATENCY_SLO_MS,
+                 slo_window_seconds: float = settings.SLO_WINDOW_SECONDS,
+                 max_pause_seconds: float = settings.BULK_MAX_PAUSE_SECONDS,
+                 min_samples: int = 5):
+        self.max_bulk_concurrency = max_bulk_concurrency
+        self.bulk_cpu_share = min(max(bulk_cpu_share, 0.05), 1.0)
+        self.latency_slo = latency_slo_ms / 1000.0
+        self.slo_window = slo_window_seconds
+        self.max_pause = max_pause_seconds
+        self.min_samples = min_samples
+
+        self._cond = threading.Condition()
+        self._latencies: deque = deque()  # (thời điểm kết thúc, độ trễ giây) của request interactive
+        self._interactive_in_flight = 0
+        self._bulk_running = 0
+        self._bulk_queued = 0
+        # Thời điểm checkpoint trước của từng thread bulk, để tính thời gian đã chạy liên tục
+        self._local = threading.local()
+        self.stats = {
+            "interactive_requests": 0,
+            "bulk_tasks": 0,
+            "bulk_wait_seconds": 0.0,
+            "bulk_max_wait_seconds": 0.0,
+            "throttle_seconds": 0.0,
+            "paused_seconds": 0.0,
+            "pauses": 0,
+        }
+
+    # --- Interactive ---
+    @contextmanager
+    def interactive(self):
+        started = time.monotonic()
+        with self._cond:
+            self._interactive_in_flight += 1
+        try:
+            yield
+        finally:
+            finished = time.monotonic()
+            with self._cond:
+                self._interactive_in_flight -= 1
+                self._latencies.append((finished, finished - started))
+                self.stats["interactive_requests"] += 1
+                self._prune(finished)
+                # Đánh thức tác vụ bulk đang tạm dừng để kiểm tra lại SLO
+                self._cond.notify_all()
+
+    def _prune(self, now: float):
+        while self._latencies and now - self._latencies[0][0] > self.slo_window:
+            self._latencies.popleft()
+
+    def _slo_violated(self, now: float) -> bool:
+        self._prune(now)
+        if len(self._latencies) < self.min_samples:
+            return False
+        return _percentile([latency for _, latency in self._latencies], 0.95) > self.latency_slo
+
+    # --- Bulk ---
+    @contextmanager
+    def bulk_slot(self):
+        """Chiếm một slot bulk (chờ nếu đã đủ max_bulk_concurrency tác vụ đang chạy)."""
+        queued_at = time.monotonic()
+        with self._cond:
+            self._bulk_queued += 1
+            while self._bulk_running >= self.max_bulk_concurrency:
+                self._cond.wait()
+            self._bulk_queued -= 1
+            self._bulk_running += 1
+            waited = time.monotonic() - queued_at
+            self.stats["bulk_tasks"] += 1
+            self.stats["bulk_wait_seconds"] += waited
+            self.stats["bulk_max_wait_seconds"] = max(self.stats["bulk_max_wait_seconds"], waited)
+        self._local.last_checkpoint = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._bulk_running -= 1
+                self._cond.notify_all()
+
+    def checkpoint(self):
+        """Gọi giữa các đơn vị công việc bulk (vd. mỗi batch chunk)."""
+        now = time.monotonic()
+        last = getattr(self._local, "last_checkpoint", None)
+        if last is not None and self.bulk_cpu_share < 1.0:
+            # Chạy `busy` giây thì nghỉ busy * (1 - share) / share giây
+            busy = now - last
+            sleep_for = busy * (1.0 - self.bulk_cpu_share) / self.bulk_cpu_share
+            if sleep_for > 0:
+                time.sleep(sleep_for)
+                with self._cond:
+                    self.stats["throttle_seconds"] += sleep_for
+
+        with self._cond:
+            paused_at = time.monotonic()
+            if self._slo_violated(paused_at):
+                self.stats["pauses"] += 1
+                deadline = paused_at + self.max_pause
+                while self._slo_violated(time.monotonic()):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=min(remaining, 1.0))
+                self.stats["paused_seconds"] += time.monotonic() - paused_at
+        self._local.last_checkpoint = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            self._prune(now)
+            latencies = [latency for _, latency in self._latencies]
+            stats = dict(self.stats)
+            return {
+                "interactive": {
+                    "in_flight": self._interactive_in_flight,
+                    "window_requests": len(latencies),
+                    "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1),
+                    "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+                    "slo_ms": self.latency_slo * 1000,
+                    "slo_violated": self._slo_violated(now),
+                    "total_requests": stats["interactive_requests"],
+                },
+                "bulk": {
+                    "running": self._bulk_running,
+                    "queued": self._bulk_queued,
+                    "max_concurrency": self.max_bulk_concurrency,
+                    "cpu_share": self.bulk_cpu_share,
+                    "tasks": stats["bulk_tasks"],
+                    "avg_wait_seconds": round(stats["bulk_wait_seconds"] / stats["bulk_tasks"], 3) if stats["bulk_tasks"] else 0.0,
+                    "max_wait_seconds": round(stats["bulk_max_wait_seconds"], 3),
+                    "throttle_seconds": round(stats["throttle_seconds"], 3),
+                    "paused_seconds": round(stats["paused_seconds"], 3),
+                    "pauses": stats["pauses"],
+                },
+            }